@@ -0,0 +1,225 @@
+import math
+
+import numpy as np
+
+
+class Relaxation:
+    """
+    Closed-form trajectory of a quiescent field from its state after a given step.
+
+    While the whole field is below threshold its thresholded output is zero, so the lateral interaction and
+    the h_u adaptation of active regions vanish. With constant inputs, the update u += gain * (-u + drive)
+    is then linear, and with h_u growing by `ramp` every step (decision fields) the state k steps later is
+
+        u_k = alpha + ramp * k + decay ** k * (u_0 - alpha),   decay = 1 - gain,
+        alpha = external input + internal input + h_u - decay * ramp / gain
+
+    For 0 <= decay < 1, u_k stays below max(u_0, alpha) + ramp * k at every position.
+    """
+
+    def __init__(self, field, step, external_input, internal_input):
+        """
+        :param field: The quiescent field, in its state after step.
+        :param step: Index of the last integrated step.
+        :param external_input: External input held over the following steps.
+        :param internal_input: Internal input held over the following steps.
+        """
+        self.step = step
+        self.external_input = external_input.copy()
+        self.internal_input = internal_input.copy()
+        self.u0 = field.u_field.astype(np.float64)
+        self.h0 = field.h_u.astype(np.float64)
+        self.ramp = field.dt / field.tau_h if field.field_type == "decision" else 0.0
+        self.decay = 1.0 - field.step_gain
+        self.alpha = (self.external_input.astype(np.float64) + self.internal_input + self.h0
+                      - self.decay * self.ramp / field.step_gain)
+        self.peak = max(float(self.u0.max()), float(self.alpha.max()))
+
+    def bound(self, i):
+        """Upper bound of the state after any step up to i."""
+        return self.peak + self.ramp * (i - self.step)
+
+    def state(self, i):
+        """State after step i."""
+        k = i - self.step
+        return self.alpha + self.ramp * k + self.decay ** k * (self.u0 - self.alpha)
+
+    def h_u(self, i):
+        """h_u after step i."""
+        return self.h0 + self.ramp * (i - self.step)
+
+
+class ActiveSet:
+    """
+    Active-set scheduling for simultaneous_integration: fields that are quiescent are put to sleep and
+    advanced in closed form (see Relaxation), so each step only integrates the fields that are active.
+
+    A field is quiescent after a step when its whole state is below its threshold and its inputs are
+    constant: no external input event or delayed input is due, and its internal input does not change
+    (typically because every thresholded or gated connection into it is off). It sleeps until the first of:
+      - the bound of its relaxation could reach its threshold (or the threshold of a connection reading it,
+        so the fields reading it while it sleeps get the same input as from its exact state),
+      - an external input switches on or off, or a delayed input is due,
+      - a crossing is reported to it (fields with delayed inputs, e.g. Robot Feedback),
+      - its internal input changes by more than tolerance; while its gated connections are provably off
+        (one source of each stays at or below the connection threshold) it is not even computed.
+    The skipped convolution, input and history work is not done while it sleeps. When woken, its state,
+    h_u and the recorded history of the skipped steps are filled in from the closed form and it is integrated
+    normally from that step on. Fields with plain weighted connections (into or out of them) never sleep.
+
+    The closed form is the exact solution of the linear update, so with tolerance 0 the states differ from the
+    step-by-step integration only by rounding. A positive tolerance lets fields sleep while their internal
+    input still settles (e.g. under the inhibition of a converging Working Memory bump); the state of a
+    sleeping field then stays within tolerance of the step-by-step one.
+    """
+
+    def __init__(self, tolerance=0.0, min_sleep=10, retry=10):
+        """
+        :param tolerance: Largest change of the internal input of a sleeping field before it is woken.
+        :param min_sleep: Smallest number of steps worth skipping; shorter sleeps are not started.
+        :param retry: Steps to wait before checking again a field below threshold that could not sleep.
+        """
+        if min_sleep < 1 or retry < 1:
+            raise ValueError("min_sleep and retry must be positive numbers of steps.")
+        if tolerance < 0:
+            raise ValueError("tolerance must not be negative.")
+        self.tolerance = tolerance
+        self.min_sleep = min_sleep
+        self.retry = retry
+        self.stats = {"integrated": 0, "skipped": 0, "sleeps": 0}
+        self.sleeping = {}  # Field -> (Relaxation, step at which it has to be woken, whether its gates were off)
+        self.next_check = {}
+        self.limits = {}
+        self.gates = {}
+
+    def start(self, fields, start=0):
+        """
+        Prepares a run of the fields from step start, with all fields awake.
+        :param fields: Fields of the network, in integration order.
+        :param start: Index of the first step of the run.
+        """
+        self.sleeping = {}
+        self.next_check = {field: start for field in fields}
+
+        # A field sleeps while it stays below its threshold and the thresholds of the connections reading it;
+        # None when it never sleeps. Gates are the (threshold, sources) of the connections into a field, which
+        # are off as long as one of their sources stays at or below the threshold.
+        self.limits = {field: field.theta for field in fields}
+        self.gates = {field: [] for field in fields}
+        for field in fields:
+            for connection in field.connections:
+                if connection.kind == "weighted":
+                    if connection.weight != 0:
+                        self.limits[field] = None
+                        for source in connection.sources:
+                            self.limits[source] = None
+                    continue
+                self.gates[field].append((connection.threshold, connection.sources))
+                for source in connection.sources:
+                    if self.limits.get(source) is not None:
+                        self.limits[source] = min(self.limits[source], connection.threshold)
+        for field in fields:
+            if not 0 < field.step_gain <= 1:
+                self.limits[field] = None  # The relaxation oscillates, its bound does not hold
+
+    def integrate(self, field, i, threshold_crossings=None):
+        """
+        Integrates step i of a field like Field.integrate_single_step, or skips it while the field sleeps.
+        :param field: Field to step.
+        :param i: Index of the current time step.
+        :param threshold_crossings: Crossings passed to fields with delayed inputs.
+        """
+        sleep = self.sleeping.get(field)
+        if sleep is not None:
+            if not self._must_wake(field, sleep, i, threshold_crossings):
+                self.stats["skipped"] += 1
+                return
+            self._wake(field, i - 1)
+            self.next_check[field] = i + self.retry
+
+        field.integrate_single_step(i, threshold_crossings)
+        self.stats["integrated"] += 1
+        if i >= self.next_check[field]:
+            self._try_sleep(field, i)
+
+    def synchronize(self, i):
+        """Sets the state and h_u of the sleeping fields to their values after step i; they keep sleeping."""
+        for field, (relaxation, _, _) in self.sleeping.items():
+            field.u_field[:] = relaxation.state(i)
+            field.h_u[:] = relaxation.h_u(i)
+
+    def wake_all(self, i):
+        """Wakes all sleeping fields after step i, filling in their state and history (e.g. at the end of a run)."""
+        for field in list(self.sleeping):
+            self._wake(field, i)
+            self.next_check[field] = i + 1
+
+    def _must_wake(self, field, sleep, i, threshold_crossings):
+        relaxation, wake, gates_off = sleep
+        if i >= wake:
+            return True
+        if threshold_crossings and field.delayed_inputs.connections:
+            return True
+        if gates_off and self._gates_off(field, i):
+            return False
+        internal_input = field.get_internal_input(i)
+        return np.abs(internal_input - relaxation.internal_input).max() > self.tolerance
+
+    def _gates_off(self, field, i):
+        # A gate passes nothing while one of its sources stays at or below its threshold
+        for threshold, sources in self.gates[field]:
+            if all(self._peak(source, i) > threshold for source in sources):
+                return False
+        return True
+
+    def _peak(self, field, i):
+        # Largest value the state of a field can have when it is read in step i
+        sleep = self.sleeping.get(field)
+        if sleep is not None:
+            return sleep[0].bound(i)
+        return float(field.u_field.max())
+
+    def _try_sleep(self, field, i):
+        limit = self.limits[field]
+        if limit is None:
+            self.next_check[field] = math.inf
+            return
+        if field.u_field.max() >= limit:
+            self.next_check[field] = i + 1
+            return
+        self.next_check[field] = i + self.retry
+
+        # The inputs of step i hold until the next input event or delayed input
+        wake = len(field.t)
+        event = field.input_schedule.next_event_time()
+        if event is not None:
+            wake = min(wake, int(np.searchsorted(field.t, event, side="left")))
+        due = field.delayed_inputs.next_due_step()
+        if due is not None:
+            wake = min(wake, due)
+        if wake - i - 1 < self.min_sleep:
+            return
+
+        relaxation = Relaxation(field, i, field.get_external_input(field.time_at(i)), field.get_internal_input(i))
+        if relaxation.peak >= limit:
+            return
+        if relaxation.ramp:
+            # Steps after which the bound may reach the limit; the state of the step before waking is below it
+            wake = min(wake, i + math.ceil((limit - relaxation.peak) / relaxation.ramp))
+            if wake - i - 1 < self.min_sleep:
+                return
+
+        self.sleeping[field] = (relaxation, wake, self._gates_off(field, i + 1))
+        self.stats["sleeps"] += 1
+
+    def _wake(self, field, i):
+        # Fill in the skipped steps up to step i from the closed form
+        relaxation, _, _ = self.sleeping.pop(field)
+        recorder = field.recorder
+        if recorder.enabled:
+            for step in range(relaxation.step + 1, i + 1):
+                if step % recorder.every == 0:
+                    recorder.record(step, field.time_at(step), relaxation.state(step), relaxation.external_input,
+                                    relaxation.internal_input)
+        field.u_field[:] = relaxation.state(i)
+        field.h_u[:] = relaxation.h_u(i)
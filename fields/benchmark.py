@@ -0,0 +1,261 @@
+import contextlib
+import gc
+import importlib
+import io
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+from collections import namedtuple
+
+import numpy as np
+
+from fields.active_set import ActiveSet
+from fields.engine import BatchedEngine
+from fields.field import Field
+from fields.recorder import HistoryRecorder
+from fields.simulator import simultaneous_integration
+
+
+# A benchmark case: setup() builds what is timed (untimed), run(state) is the timed part
+BenchmarkCase = namedtuple("BenchmarkCase", ["name", "setup", "run"])
+
+# Timing and memory of one case: seconds per run (median and best of the repeats) and peak traced memory of
+# setup and run together (the fields' storage is allocated when they are built)
+BenchmarkResult = namedtuple("BenchmarkResult", ["name", "median", "best", "repeats", "peak_bytes"])
+
+# A case that got slower or used more memory than its baseline
+Regression = namedtuple("Regression", ["name", "metric", "baseline", "current", "ratio"])
+
+KERNEL = (1.5, 0.9, 0.0)
+FIELD_PARS = (80, 100, 0.1, 0.1)  # x_lim, t_lim, dx, dt (1601 grid points, 1001 steps)
+STEPS = 200  # Steps timed by the single-field cases
+INPUTS = [(0.0, 3.0, 1.5, 1, 15), (30.0, 3.0, 1.5, 5, 35), (-40.0, 3.0, 1.5, 10, 55)]
+INPUT_CENTERS = [0.0, 30.0, -40.0]
+
+# Simulation core, which has to be importable with numpy alone, and the optional packages it must not load
+CORE_MODULES = ["fields.field", "fields.simulator", "fields.utils", "fields.engine", "fields.session",
+                "fields.sweep", "model", "model_adaptation"]
+OPTIONAL_PACKAGES = ["matplotlib"]
+
+
+def _field(field_type=None, field_pars=FIELD_PARS, history=None, memory=None, **kwargs):
+    # Decision fields get a synthetic memory, so no benchmark depends on data/ or the memory store
+    x = np.arange(-field_pars[0], field_pars[0] + field_pars[2], field_pars[2])
+    if field_type == "decision" and memory is None:
+        memory = 6.2 + sum(0.5 * np.exp(-0.5 * (x - center) ** 2) for center in INPUT_CENTERS)
+    return Field(KERNEL, field_pars, INPUTS if field_type != "decision" else None, tau_h=20,
+                 field_type=field_type, theta=1.0, history=history if history is not None else HistoryRecorder(),
+                 sequence_memory=memory, name=f"Bench {field_type or 'plain'}", **kwargs)
+
+
+def _step_fields(fields):
+    for i in range(STEPS):
+        for field in fields:
+            field.integrate_single_step(i)
+
+
+_memories = {}
+
+
+def _learned_memory(module):
+    # Memory learned by the model's own sequence memory field, computed once per module
+    if module not in _memories:
+        model = importlib.import_module(module)
+        field = model.create_sequence_memory()
+        field.recorder = HistoryRecorder.disabled().bind(field.x, field.t, field.dtype)
+        with contextlib.redirect_stdout(io.StringIO()):
+            simultaneous_integration([field], INPUT_CENTERS)
+        _memories[module] = field.final_state()
+    return _memories[module]
+
+
+def _model_cases(module):
+    model_name = module.split(".")[-1]
+
+    def learning_setup():
+        return importlib.import_module(module).create_sequence_memory()
+
+    def recall_setup():
+        return importlib.import_module(module).create_recall_network(sequence_memory=_learned_memory(module))
+
+    cases = [BenchmarkCase(f"{model_name}/learning", learning_setup,
+                           lambda field: simultaneous_integration([field], INPUT_CENTERS))]
+    for batched in (False, True):
+        suffix = "/batched" if batched else ""
+        cases.append(BenchmarkCase(f"{model_name}/recall{suffix}", recall_setup,
+                                   lambda fields, batched=batched: simultaneous_integration(
+                                       fields, INPUT_CENTERS, batched=batched)))
+    cases.append(BenchmarkCase(f"{model_name}/recall/active_set", recall_setup,
+                               lambda fields: simultaneous_integration(fields, INPUT_CENTERS, active_set=ActiveSet())))
+    return cases
+
+
+def _grid_cases(x_lims=(20, 80, 320)):
+    cases = []
+    for x_lim in x_lims:
+        field_pars = (x_lim,) + FIELD_PARS[1:]
+        n = len(np.arange(-x_lim, x_lim + FIELD_PARS[2], FIELD_PARS[2]))
+        cases.append(BenchmarkCase(f"scaling/grid/{n}",
+                                   lambda field_pars=field_pars: [_field(field_pars=field_pars,
+                                                                         history=HistoryRecorder.disabled())],
+                                   _step_fields))
+    return cases
+
+
+def _field_count_cases(counts=(1, 4, 16, 64)):
+    def run(engine):
+        for i in range(STEPS):
+            engine.step(i, INPUT_CENTERS)
+
+    return [BenchmarkCase(f"scaling/fields/{count}",
+                          lambda count=count: BatchedEngine(networks=[[_field(history=HistoryRecorder.disabled())]
+                                                                      for _ in range(count)]),
+                          run)
+            for count in counts]
+
+
+def check_headless_imports(modules=CORE_MODULES, forbidden=OPTIONAL_PACKAGES):
+    """
+    Imports modules in a fresh interpreter, as a worker process or a restarted controller would.
+    :return: Seconds taken by the imports and the forbidden packages they loaded (should be empty).
+    """
+    code = (f"import sys, time\nstart = time.perf_counter()\nimport {', '.join(modules)}\n"
+            f"print(time.perf_counter() - start)\n"
+            f"print(' '.join(sorted({{name.split('.')[0] for name in sys.modules}} & set({list(forbidden)!r}))))")
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [root, os.environ.get("PYTHONPATH")])))
+    output = subprocess.run([sys.executable, "-c", code], env=env, capture_output=True, text=True, check=True)
+    seconds, loaded = (output.stdout.splitlines() + [""])[:2]
+    return float(seconds), loaded.split()
+
+
+def _startup(_):
+    # Interpreter start and core imports; fails if plotting packages leak into the core
+    _, loaded = check_headless_imports()
+    if loaded:
+        raise RuntimeError(f"Importing the simulation core loaded {', '.join(loaded)}.")
+
+
+def default_cases():
+    """
+    The benchmark cases of the suite:
+      - step/<field type>: STEPS calls of Field.integrate_single_step of one field (default history),
+      - model/learning, model/recall[/batched|/active_set]: full runs of the model.py and model_adaptation.py networks,
+      - scaling/grid/<points>: STEPS steps of one field on growing grids,
+      - scaling/fields/<count>: STEPS steps of a BatchedEngine with growing numbers of fields,
+      - construction/<field type>: building a field (kernel, backend, inputs and history storage),
+      - startup/import: a fresh interpreter importing the simulation core, which must not load matplotlib.
+    """
+    cases = []
+    for field_type in (None, "sequence_memory", "decision"):
+        label = field_type or "plain"
+        cases.append(BenchmarkCase(f"step/{label}", lambda field_type=field_type: [_field(field_type)],
+                                   _step_fields))
+    cases += _model_cases("model") + _model_cases("model_adaptation")
+    cases += _grid_cases() + _field_count_cases()
+    for field_type in (None, "decision"):
+        label = field_type or "plain"
+        cases.append(BenchmarkCase(f"construction/{label}", lambda: None,
+                                   lambda _, field_type=field_type: _field(field_type)))
+    cases.append(BenchmarkCase("startup/import", lambda: None, _startup))
+    return cases
+
+
+def run_case(case, repeats=5, measure_memory=True):
+    """
+    Times a case. Every repeat gets a fresh setup; the peak memory of setup and run is traced in one extra
+    run (tracing slows the run down, so it is not timed).
+    :return: BenchmarkResult.
+    """
+    times = []
+    with contextlib.redirect_stdout(io.StringIO()):
+        for _ in range(repeats):
+            state = case.setup()
+            gc.collect()
+            start = time.perf_counter()
+            case.run(state)
+            times.append(time.perf_counter() - start)
+
+        peak = None
+        if measure_memory:
+            gc.collect()
+            tracemalloc.start()
+            case.run(case.setup())
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+    return BenchmarkResult(case.name, statistics.median(times), min(times), repeats, peak)
+
+
+def run_suite(cases=None, repeats=5, pattern=None, measure_memory=True, echo=True):
+    """
+    Runs benchmark cases.
+    :param cases: Cases to run (defaults to default_cases()).
+    :param repeats: Timed runs per case.
+    :param pattern: Only run the cases whose name contains this string.
+    :param measure_memory: Also trace the peak memory of each case.
+    :param echo: Print each result as it is measured.
+    :return: Dictionary in the format of save_results.
+    """
+    results = {}
+    for case in cases if cases is not None else default_cases():
+        if pattern is not None and pattern not in case.name:
+            continue
+        result = run_case(case, repeats, measure_memory)
+        results[case.name] = result._asdict()
+        if echo:
+            print(format_result(result))
+    return {"environment": environment(), "results": results}
+
+
+def environment():
+    """Describes the machine and library versions the results were measured with."""
+    return {"python": platform.python_version(), "numpy": np.__version__, "machine": platform.machine(),
+            "processor": platform.processor(), "system": platform.system(), "cpus": os.cpu_count(),
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S")}
+
+
+def format_result(result):
+    """One line summary of a BenchmarkResult."""
+    memory = "" if result.peak_bytes is None else f"  peak {result.peak_bytes / 2 ** 20:8.2f} MiB"
+    return f"{result.name:36s} median {result.median * 1e3:9.3f} ms  best {result.best * 1e3:9.3f} ms{memory}"
+
+
+def save_results(results, path):
+    """Writes suite results (e.g. a new baseline) as JSON."""
+    with open(path, "w") as f:
+        json.dump(results, f, indent=1)
+
+
+def load_results(path):
+    """Reads results written by save_results."""
+    with open(path) as f:
+        return json.load(f)
+
+
+def compare(results, baseline, time_threshold=0.25, memory_threshold=0.10):
+    """
+    Compares results against a baseline. Times are compared on the best run, which is the least sensitive
+    to noise. Cases missing from either side are ignored.
+    :param results: Results of run_suite.
+    :param baseline: Results of an earlier run_suite (see load_results).
+    :param time_threshold: Largest accepted relative slowdown (0.25 accepts runs up to 25 % slower).
+    :param memory_threshold: Largest accepted relative growth of the peak memory.
+    :return: List of Regression, empty if there is none.
+    """
+    regressions = []
+    for name, current in results["results"].items():
+        reference = baseline["results"].get(name)
+        if reference is None:
+            continue
+        for metric, threshold in (("best", time_threshold), ("peak_bytes", memory_threshold)):
+            if current.get(metric) is None or not reference.get(metric):
+                continue
+            ratio = current[metric] / reference[metric]
+            if ratio > 1 + threshold:
+                regressions.append(Regression(name, metric, reference[metric], current[metric], ratio))
+    return regressions
@@ -0,0 +1,158 @@
+import json
+
+import numpy as np
+
+from fields.events import ThresholdEvent, FeedbackEvent
+
+
+EVENT_TYPES = {"ThresholdEvent": ThresholdEvent, "FeedbackEvent": FeedbackEvent}
+
+
+class Checkpoint:
+    """
+    Complete dynamic state of a network after a time step: every field's u_field and h_u, threshold monitor
+    states (which positions have fired), pending delayed inputs, pushed live inputs, logged events and the
+    state of incremental convolution backends. Parameters (kernels, inputs, connections) are not part of it,
+    they come from the network the checkpoint is restored into, so one checkpoint can be continued in several
+    "what-if" variants of a network (forks). Recorded histories are not included either: a resumed run
+    records from the step after the checkpoint on.
+
+    Resuming a checkpoint in the same network continues with results bit-identical to the uninterrupted run.
+    """
+
+    def __init__(self, step, arrays, meta):
+        """
+        :param step: Index of the last time step integrated before the checkpoint.
+        :param arrays: Dictionary of the state arrays.
+        :param meta: JSON-serializable description of the remaining state.
+        """
+        self.step = step
+        self.arrays = arrays
+        self.meta = meta
+
+    @classmethod
+    def capture(cls, fields, step, engine=None, extra=None):
+        """
+        Captures the state of a network.
+        :param fields: Fields of the network.
+        :param step: Index of the last time step integrated.
+        :param engine: BatchedEngine stepping the fields, if any (its convolution backends may hold state).
+        :param extra: JSON-serializable state of the caller (e.g. of a streaming session).
+        """
+        arrays = {}
+        meta = {"step": step, "fields": [], "engine": None, "extra": extra}
+        for k, field in enumerate(fields):
+            prefix = f"{k}/"
+            arrays[prefix + "u"] = field.u_field.copy()
+            arrays[prefix + "h_u"] = field.h_u.copy()
+
+            monitors = []
+            for m, ((positions, direction), monitor) in enumerate(field.monitors.items()):
+                for name in ("above", "fired_up", "fired_down"):
+                    arrays[f"{prefix}monitor{m}/{name}"] = getattr(monitor, name).copy()
+                monitors.append({"positions": None if positions is None else list(positions),
+                                 "direction": direction})
+
+            live_keys = list(field.live_inputs)
+            for j, key in enumerate(live_keys):
+                arrays[f"{prefix}live{j}"] = field.live_inputs[key].copy()
+
+            delayed = field.delayed_inputs
+            meta["fields"].append({
+                "name": field.name,
+                "monitors": monitors,
+                "pending": [list(entry) for entry in delayed.pending],
+                "counts": list(delayed.counts),
+                "sequence": delayed._sequence,
+                "live_inputs": live_keys,
+                "events": [[type(event).__name__, list(event)] for event in field.event_log],
+                "convolution": _capture_convolution(field.convolution, arrays, prefix + "convolution/"),
+            })
+
+        if engine is not None:
+            meta["engine"] = [[_capture_convolution(convolution, arrays, f"engine/{g}/{c}/")
+                               for c, (_, convolution) in enumerate(group)]
+                              for g, group in enumerate(engine.convolutions)]
+        return cls(step, arrays, meta)
+
+    def restore(self, fields):
+        """
+        Restores the state into a network built like the one that was captured (same field names and grids).
+        The fields' parameters are left as they are.
+        :return: Index of the next time step to integrate.
+        """
+        by_name = {field.name: field for field in fields}
+        if sorted(by_name) != sorted(info["name"] for info in self.meta["fields"]):
+            raise ValueError("The fields do not match the fields of the checkpoint.")
+
+        for k, info in enumerate(self.meta["fields"]):
+            field = by_name[info["name"]]
+            prefix = f"{k}/"
+            field.u_field[...] = self.arrays[prefix + "u"]  # In place: an engine may hold views of the state
+            field.h_u[...] = self.arrays[prefix + "h_u"]
+
+            field.monitors = {}
+            for m, monitor_info in enumerate(info["monitors"]):
+                monitor = field.get_monitor(monitor_info["positions"], monitor_info["direction"])
+                for name in ("above", "fired_up", "fired_down"):
+                    getattr(monitor, name)[...] = self.arrays[f"{prefix}monitor{m}/{name}"]
+
+            delayed = field.delayed_inputs
+            delayed.pending = [tuple(entry) for entry in info["pending"]]  # Stored in heap order
+            delayed.counts = list(info["counts"])
+            delayed._sequence = info["sequence"]
+
+            field.live_inputs = {key: self.arrays[f"{prefix}live{j}"].copy()
+                                 for j, key in enumerate(info["live_inputs"])}
+            field._update_live_input()
+
+            field.event_log.events = [EVENT_TYPES[name](*values) for name, values in info["events"]]
+            field.input_schedule.reset()
+            _restore_convolution(field.convolution, info["convolution"], self.arrays, prefix + "convolution/")
+        return self.step + 1
+
+    def restore_engine(self, engine):
+        """Restores the state of the convolution backends of a BatchedEngine built for the restored fields."""
+        if self.meta["engine"] is None:
+            return
+        if [len(group) for group in self.meta["engine"]] != [len(group) for group in engine.convolutions]:
+            raise ValueError("The engine does not match the engine of the checkpoint.")
+        for g, group in enumerate(engine.convolutions):
+            for c, (_, convolution) in enumerate(group):
+                _restore_convolution(convolution, self.meta["engine"][g][c], self.arrays, f"engine/{g}/{c}/")
+
+    def save(self, path):
+        """Writes the checkpoint into a compressed .npz file."""
+        np.savez_compressed(path, meta=np.array(json.dumps(self.meta, default=_json_default)), **self.arrays)
+
+    @classmethod
+    def load(cls, path):
+        """Reads a checkpoint written by save."""
+        with np.load(path) as data:
+            meta = json.loads(str(data["meta"]))
+            arrays = {name: data[name] for name in data.files if name != "meta"}
+        return cls(meta["step"], arrays, meta)
+
+
+def _capture_convolution(convolution, arrays, prefix):
+    # Only incremental backends (DeltaConvolution) carry state between steps
+    if not hasattr(convolution, "get_state"):
+        return None
+    state = convolution.get_state()
+    arrays[prefix + "conv"] = state["conv"]
+    if state["f_prev"] is not None:
+        arrays[prefix + "f_prev"] = state["f_prev"]
+    return {"since_exact": state["since_exact"], "has_f_prev": state["f_prev"] is not None}
+
+
+def _restore_convolution(convolution, info, arrays, prefix):
+    if info is None or not hasattr(convolution, "set_state"):
+        return
+    convolution.set_state({"conv": arrays[prefix + "conv"], "since_exact": info["since_exact"],
+                           "f_prev": arrays[prefix + "f_prev"] if info["has_f_prev"] else None})
+
+
+def _json_default(value):
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError(f"Cannot store {type(value).__name__} in a checkpoint.")
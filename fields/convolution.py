@@ -0,0 +1,382 @@
+from collections import namedtuple
+from functools import lru_cache
+
+import numpy as np
+
+from fields import kernel_cache
+
+
+# numpy >= 2.0 lets the FFT functions write into preallocated output arrays
+_FFT_HAS_OUT = np.lib.NumpyVersion(np.__version__) >= "2.0.0"
+
+
+class FFTConvolution:
+    """
+    Reference lateral-interaction path: full complex FFT of the thresholded output, product with the kernel
+    spectrum, complex IFFT, real part and ifftshift. Works on a single field (n,) or a stack (m, n).
+    """
+    kind = "fft"
+
+    def __init__(self, kernel, dx):
+        """
+        :param kernel: Kernel sampled on the spatial grid, shape (n,) or (m, n) for a stack of fields.
+        :param dx: Spatial step of the grid.
+        """
+        self.dx = dx
+        self.options = {}
+        real, cplx = _work_dtypes(kernel)
+        self.w_hat = kernel_spectrum(kernel, ("fft", np.dtype(cplx).str),
+                                     lambda row: np.fft.fft(row.astype(float)).astype(cplx))
+
+    def threshold(self, u, theta):
+        """Returns the thresholded output H(u - theta)."""
+        return np.heaviside(u - theta, 1)
+
+    def __call__(self, f):
+        """Returns the convolution of the thresholded output f with the kernel."""
+        f_hat = np.fft.fft(f, axis=-1)
+        conv = np.fft.ifftshift(np.real(np.fft.ifft(f_hat * self.w_hat, axis=-1)), axes=-1)
+        return (self.dx * conv).astype(self.w_hat.real.dtype, copy=False)
+
+
+class RFFTConvolution:
+    """
+    Real-input FFT path. The ifftshift and the dx factor are folded into the kernel spectrum once, so a step
+    is one rfft, one in-place complex product and one irfft, all written into preallocated work buffers.
+    The returned arrays are these buffers: they are overwritten by the next call.
+
+    Grid sizes with large prime factors (e.g. 1601 points) make the FFT itself slow, so for those the
+    transforms use a zero-padded fast length of at least 2n - 1 and the linear result is wrapped back onto
+    the periodic domain, which gives the same circular convolution.
+
+    With boundary="zero" the field is not periodic: activity beyond the ends of the grid is taken as zero,
+    so bumps near one end do not interact with the other end.
+    """
+    kind = "rfft"
+
+    def __init__(self, kernel, dx, boundary="periodic"):
+        """
+        :param kernel: Kernel sampled on the spatial grid, shape (n,) or (m, n) for a stack of fields.
+        :param dx: Spatial step of the grid.
+        :param boundary: "periodic" (default) or "zero".
+        """
+        _check_boundary(boundary)
+        self.dx = dx
+        self.options = {"boundary": boundary}
+        self.boundary = boundary
+        self.n = kernel.shape[-1]
+        real, cplx = _work_dtypes(kernel)
+        if boundary == "periodic":
+            self.n_fft = self.n if _is_fast_length(self.n) else next_fast_length(2 * self.n - 1)
+            start = 0
+        else:
+            # Linear convolution with the kernel origin (index n // 2) mapped onto the output grid
+            self.n_fft = next_fast_length(2 * self.n - 1)
+            start = self.n // 2
+
+        def transform(row):
+            # Computed in double precision, then stored in the work dtype. For the periodic boundary, shifting
+            # the kernel instead of the result gives the same (circular) convolution
+            row = row.astype(float)
+            if boundary == "periodic":
+                row = np.fft.ifftshift(row)
+            return (dx * np.fft.rfft(row, n=self.n_fft)).astype(cplx)
+
+        self.w_hat = kernel_spectrum(kernel, ("rfft", boundary, self.n_fft, dx, np.dtype(cplx).str), transform)
+        self._f = np.empty(kernel.shape, dtype=real)
+        self._f_hat = np.empty(kernel.shape[:-1] + self.w_hat.shape[-1:], dtype=cplx)
+        self._y = np.empty(kernel.shape[:-1] + (self.n_fft,), dtype=real)
+        self._conv = self._y[..., start:start + self.n]
+
+    def threshold(self, u, theta):
+        """Returns the thresholded output H(u - theta) in a work buffer."""
+        return np.greater_equal(u, theta, out=self._f)
+
+    def __call__(self, f):
+        """Returns the convolution of the thresholded output f with the kernel in a work buffer."""
+        if _FFT_HAS_OUT:
+            np.fft.rfft(f, n=self.n_fft, axis=-1, out=self._f_hat)
+            self._f_hat *= self.w_hat
+            np.fft.irfft(self._f_hat, n=self.n_fft, axis=-1, out=self._y)
+        else:
+            f_hat = np.fft.rfft(f, n=self.n_fft, axis=-1)
+            f_hat *= self.w_hat
+            self._y[...] = np.fft.irfft(f_hat, n=self.n_fft, axis=-1)
+
+        if self.boundary == "periodic" and self.n_fft != self.n:
+            # Wrap the tail of the linear convolution around the periodic domain
+            self._conv[..., :self.n - 1] += self._y[..., self.n:2 * self.n - 1]
+        return self._conv
+
+
+class DeltaConvolution:
+    """
+    Incremental lateral-interaction path for fields whose thresholded output changes at only a few sites
+    between steps (stable bumps). The previous output and convolution are kept; for every site that flipped
+    the kernel column centred on it is added or subtracted. When too many sites flip, or every check_every
+    incremental steps, the convolution is recomputed exactly with the real-FFT path, and a drift larger than
+    drift_tolerance is counted in drift_failures.
+    """
+    kind = "delta"
+
+    def __init__(self, kernel, dx, max_flips=32, check_every=100, drift_tolerance=1e-9, tolerance=1e-12):
+        """
+        :param kernel: Kernel sampled on the spatial grid, shape (n,) or (m, n) for a stack of fields.
+        :param dx: Spatial step of the grid.
+        :param max_flips: Largest number of flipped sites (per field) still updated incrementally.
+        :param check_every: Number of incremental steps after which the result is recomputed by FFT.
+        :param drift_tolerance: Largest accepted difference between the incremental and the exact result.
+        :param tolerance: Kernel values below tolerance * max|kernel| are left out of the kernel columns.
+        """
+        self.dx = dx
+        self.options = {"max_flips": max_flips, "check_every": check_every,
+                        "drift_tolerance": drift_tolerance, "tolerance": tolerance}
+        self.max_flips = max_flips
+        self.check_every = check_every
+        self.drift_tolerance = drift_tolerance
+        self.exact = RFFTConvolution(kernel, dx)
+        self.n = kernel.shape[-1]
+        self.rows = 1 if kernel.ndim == 1 else kernel.shape[0]
+
+        # Kernel columns as offsets around the flipped site, restricted to the kernel support
+        shifted = dx * np.fft.ifftshift(np.atleast_2d(kernel), axes=-1)
+        magnitude = np.abs(shifted).max(axis=0)
+        support = np.flatnonzero(magnitude > tolerance * magnitude.max())
+        self.offsets = np.where(support > self.n // 2, support - self.n, support)
+        real, _ = _work_dtypes(kernel)
+        self.columns = shifted[:, support].astype(real)
+
+        self._f = np.empty(kernel.shape, dtype=real)
+        self._f_prev = None
+        self._conv = np.empty(kernel.shape, dtype=real)
+        self._since_exact = 0
+        self.incremental_steps = 0
+        self.full_steps = 0
+        self.drift_failures = 0
+
+    def threshold(self, u, theta):
+        """Returns the thresholded output H(u - theta) in a work buffer."""
+        return np.greater_equal(u, theta, out=self._f)
+
+    def reset(self):
+        """Forgets the previous output, so the next call recomputes the convolution by FFT."""
+        self._f_prev = None
+
+    def get_state(self):
+        """Returns a copy of the incremental state (previous output and convolution), e.g. for checkpoints."""
+        return {"f_prev": None if self._f_prev is None else self._f_prev.copy(), "conv": self._conv.copy(),
+                "since_exact": self._since_exact}
+
+    def set_state(self, state):
+        """Restores a state returned by get_state."""
+        self._f_prev = None if state["f_prev"] is None else np.array(state["f_prev"], dtype=self._f.dtype)
+        self._conv[...] = state["conv"]
+        self._since_exact = int(state["since_exact"])
+
+    def __call__(self, f):
+        """Returns the convolution of the thresholded output f with the kernel in a work buffer."""
+        if self._f_prev is None:
+            return self._full(f)
+
+        flat_flips = np.flatnonzero(np.not_equal(f, self._f_prev))
+        if len(flat_flips) > self.max_flips * self.rows:
+            return self._full(f)
+
+        if len(flat_flips):
+            rows, sites = np.divmod(flat_flips, self.n)
+            signs = (f.flat[flat_flips] - self._f_prev.flat[flat_flips])[:, None]
+            indices = (sites[:, None] + self.offsets[None, :]) % self.n
+            if f.ndim == 1:
+                np.add.at(self._conv, indices, signs * self.columns[0])
+            else:
+                np.add.at(self._conv, (rows[:, None], indices), signs * self.columns[rows])
+            self._f_prev[...] = f
+        self.incremental_steps += 1
+        self._since_exact += 1
+
+        if self._since_exact >= self.check_every:
+            exact = self.exact(f)
+            if np.abs(self._conv - exact).max() > self.drift_tolerance:
+                self.drift_failures += 1
+            return self._full(f, exact)
+        return self._conv
+
+    def _full(self, f, exact=None):
+        self._conv[...] = self.exact(f) if exact is None else exact
+        self._f_prev = np.array(f, dtype=self._f.dtype)
+        self._since_exact = 0
+        self.full_steps += 1
+        return self._conv
+
+
+class DirectConvolution:
+    """
+    Direct (banded) lateral-interaction path for fast-decaying kernels. The kernel is truncated to the
+    taps within radius grid points of its origin, found from a relative tolerance, and convolved directly
+    with the thresholded output padded by the radius on both sides. With boundary="periodic" the padding
+    wraps around, which matches the FFT paths up to the truncation; with boundary="zero" it is zero.
+    """
+    kind = "direct"
+
+    def __init__(self, kernel, dx, tolerance=1e-9, boundary="periodic"):
+        """
+        :param kernel: Kernel sampled on the spatial grid, shape (n,) or (m, n) for a stack of fields.
+        :param dx: Spatial step of the grid.
+        :param tolerance: Kernel values below tolerance * max|kernel| are dropped.
+        :param boundary: "periodic" (default) or "zero".
+        """
+        _check_boundary(boundary)
+        self.dx = dx
+        self.options = {"tolerance": tolerance, "boundary": boundary}
+        self.boundary = boundary
+        self.n = kernel.shape[-1]
+        self.radius = kernel_radius(kernel, tolerance)
+        center = self.n // 2
+        kernels = np.atleast_2d(kernel)
+        real, _ = _work_dtypes(kernel)
+        self.taps = (dx * kernels[:, center - self.radius:center + self.radius + 1]).astype(real)
+        self._padded = np.zeros((len(kernels), self.n + 2 * self.radius), dtype=real)
+        self._f = np.empty(kernel.shape, dtype=real)
+        self._conv = np.empty(kernel.shape, dtype=real)
+
+    def threshold(self, u, theta):
+        """Returns the thresholded output H(u - theta) in a work buffer."""
+        return np.greater_equal(u, theta, out=self._f)
+
+    def __call__(self, f):
+        """Returns the convolution of the thresholded output f with the kernel in a work buffer."""
+        r, n = self.radius, self.n
+        rows = np.atleast_2d(f)
+        self._padded[:, r:r + n] = rows
+        if self.boundary == "periodic" and r:
+            self._padded[:, :r] = rows[:, n - r:]
+            self._padded[:, r + n:] = rows[:, :r]
+
+        conv = self._conv.reshape(rows.shape)
+        for k in range(len(rows)):
+            conv[k] = np.convolve(self._padded[k], self.taps[k], mode="valid")
+        return self._conv
+
+
+# Rough cost per multiply-add of the direct path and per n log2(n) of a real FFT pair, from timings on a
+# 1601-point grid; only the ratio matters for choosing between the two
+DIRECT_COST_PER_TAP = 0.25
+FFT_COST_PER_POINT = 2.5
+
+# Result of analyze_kernel
+KernelAnalysis = namedtuple("KernelAnalysis", ["radius", "support", "direct_cost", "fft_cost", "kind"])
+
+
+def kernel_radius(kernel, tolerance=1e-9):
+    """
+    Returns the number of grid points on each side of the kernel origin (index n // 2) outside of which
+    all kernel values are below tolerance * max|kernel|. For a stack of kernels the largest radius is used.
+    """
+    magnitude = np.abs(np.atleast_2d(kernel)).max(axis=0)
+    n = len(magnitude)
+    center = n // 2
+    support = np.flatnonzero(magnitude > tolerance * magnitude.max())
+    if len(support) == 0:
+        return 0
+    radius = int(np.abs(support - center).max())
+    return min(radius, center, n - 1 - center)
+
+
+def analyze_kernel(kernel, dx, tolerance=1e-9):
+    """
+    Finds the effective support of a kernel and estimates whether a direct convolution is cheaper than
+    the real-FFT path on this grid.
+    :param kernel: Kernel sampled on the spatial grid, shape (n,) or (m, n).
+    :param dx: Spatial step of the grid.
+    :param tolerance: Relative tolerance defining the support (see kernel_radius).
+    :return: KernelAnalysis with the radius in grid points, the support half-width in x units, both cost
+             estimates and the recommended backend kind.
+    """
+    n = kernel.shape[-1]
+    radius = kernel_radius(kernel, tolerance)
+    n_fft = n if _is_fast_length(n) else next_fast_length(2 * n - 1)
+    direct_cost = DIRECT_COST_PER_TAP * n * (2 * radius + 1)
+    fft_cost = FFT_COST_PER_POINT * n_fft * np.log2(n_fft)
+    kind = DirectConvolution.kind if direct_cost < fft_cost else RFFTConvolution.kind
+    return KernelAnalysis(radius, radius * dx, direct_cost, fft_cost, kind)
+
+
+def kernel_spectrum(kernel, key, transform):
+    """
+    Returns the spectra of a kernel or a stack of kernels from the shared kernel cache (see
+    fields.kernel_cache), computing each distinct kernel once per process.
+    :param kernel: Kernel sampled on the spatial grid, shape (n,) or (m, n).
+    :param key: Tuple describing the transform (kind and every option it depends on).
+    :param transform: Callable computing the spectrum of one kernel row.
+    :return: Read-only spectrum of shape (k,) for a single kernel, (1, k) for a stack of identical kernels
+             (broadcast over the stack) or (m, k).
+    """
+    cache = kernel_cache.shared_cache
+    spectra = {}
+    keys = []
+    for row in np.atleast_2d(kernel):
+        row_key = key + kernel_cache.array_key(row)
+        if row_key not in spectra:
+            spectra[row_key] = cache.get(row_key, lambda: transform(row))
+        keys.append(row_key)
+    if kernel.ndim == 1:
+        return spectra[keys[0]]
+    if len(spectra) == 1:
+        return spectra[keys[0]][None, :]
+    stacked = np.stack([spectra[row_key] for row_key in keys])
+    stacked.flags.writeable = False
+    return stacked
+
+
+def _work_dtypes(kernel):
+    # Real and complex work types follow the kernel: float32 kernels run in float32/complex64
+    real = np.float32 if kernel.dtype == np.float32 else np.float64
+    return real, np.result_type(real, np.complex64)
+
+
+def _check_boundary(boundary):
+    if boundary not in ("periodic", "zero"):
+        raise ValueError(f"Unknown boundary '{boundary}', expected 'periodic' or 'zero'.")
+
+
+def _is_fast_length(n):
+    for p in (2, 3, 5):
+        while n % p == 0:
+            n //= p
+    return n == 1
+
+
+@lru_cache(maxsize=None)
+def next_fast_length(n):
+    """Returns the smallest length >= n whose only prime factors are 2, 3 and 5."""
+    while not _is_fast_length(n):
+        n += 1
+    return n
+
+
+# Available lateral-interaction backends, selected per field with Field(convolution=...)
+CONVOLUTIONS = {
+    FFTConvolution.kind: FFTConvolution,
+    RFFTConvolution.kind: RFFTConvolution,
+    DeltaConvolution.kind: DeltaConvolution,
+    DirectConvolution.kind: DirectConvolution,
+}
+
+
+def make_convolution(kind, kernel, dx, **options):
+    """
+    Creates a convolution backend of the given kind.
+    :param kind: Name of the backend (see CONVOLUTIONS), or "auto" to pick "direct" or "rfft" from
+                 analyze_kernel (options: tolerance, boundary).
+    :param kernel: Kernel sampled on the spatial grid, shape (n,) or (m, n).
+    :param dx: Spatial step of the grid.
+    :param options: Backend-specific options (e.g. max_flips for "delta").
+    """
+    if kind == "auto":
+        tolerance = options.pop("tolerance", 1e-9)
+        kind = analyze_kernel(kernel, dx, tolerance).kind
+        if kind == DirectConvolution.kind:
+            options["tolerance"] = tolerance
+    if kind not in CONVOLUTIONS:
+        raise ValueError(f"Unknown convolution '{kind}', expected one of {sorted(CONVOLUTIONS)}.")
+    return CONVOLUTIONS[kind](kernel, dx, **options)
@@ -0,0 +1,342 @@
+import time
+
+import numpy as np
+
+from fields import profiling
+from fields.convolution import make_convolution
+from fields.field_network import compile_stages
+from fields.checkpoint import Checkpoint
+from fields.stopping import StopReport, as_conditions, check_stop, finish_run
+
+
+class BatchedEngine:
+    """
+    Steps all fields of a network together as one stacked (n_fields, n_x) array.
+
+    Thresholding, the FFT convolution, the h_u update and the Euler update run once per step for
+    all fields instead of once per field. Each field's u_field and h_u become views into the stacked
+    arrays, so connections, monitoring and plotting keep working on the Field objects unchanged.
+
+    The update order of simultaneous_integration is preserved: fields are stepped in list order, the
+    Action Onset field is monitored afterwards, and the fields with delayed inputs (Robot Feedback) are
+    stepped last with the crossings of the current step (in the same pass as the other fields when their
+    delays are at least one step, see __init__). Coupling inputs are computed in stages, so a field sees
+    the already updated state of the fields before it, exactly as in the per-field path. The step works in
+    preallocated buffers and its results are identical to the per-field path.
+
+    Several independent networks (e.g. the trials of a parameter sweep) can share one engine, so all their
+    fields go through the same batched FFT each step.
+    """
+
+    def __init__(self, fields=None, networks=None):
+        """
+        :param fields: List of Field objects of one network sharing the same spatial and temporal grid.
+        :param networks: Alternatively, a list of independent networks (lists of fields) stepped together,
+                         e.g. the trials of a sweep. Each network has its own Action Onset and feedback fields.
+        """
+        if networks is None:
+            networks = [fields] if fields else []
+        elif fields is not None:
+            raise ValueError("Pass either fields or networks, not both.")
+        if not networks or not all(networks):
+            raise ValueError("BatchedEngine needs at least one field per network.")
+
+        all_fields = [field for network in networks for field in network]
+        reference = all_fields[0]
+        for field in all_fields[1:]:
+            if field.x.shape != reference.x.shape or not np.allclose(field.x, reference.x):
+                raise ValueError(f"Field '{field.name}' does not share the spatial grid of '{reference.name}'.")
+            if field.dt != reference.dt or len(field.t) != len(reference.t):
+                raise ValueError(f"Field '{field.name}' does not share the time grid of '{reference.name}'.")
+            if field.dtype != reference.dtype:
+                raise ValueError(f"Field '{field.name}' does not share the dtype of '{reference.name}'.")
+
+        self.x = reference.x
+        self.t = reference.t
+        self.dx = reference.dx
+        self.dt = reference.dt
+
+        self.networks = networks
+        self.action_onset_fields = [next((field for field in network if field.name == "Action Onset"), None)
+                                    for network in networks]
+        self.feedback_fields = [[field for field in network if field.delayed_inputs.connections]
+                                for network in networks]
+        self.action_onset_field = self.action_onset_fields[0]
+
+        # Stack order: fields integrated in the main pass first (network by network, in the order of
+        # simultaneous_integration: the fields without delayed inputs in list order, then those with delayed
+        # inputs), then the fields whose delayed inputs may fire in the step of the crossing that triggers them
+        # (delays shorter than a step or not known in advance), which have to wait for the Action Onset
+        # crossings of the current step. With delays of at least one step (e.g. Robot Feedback), the inputs
+        # due in a step are all known at its start, so those fields are stepped in the main pass and only
+        # schedule the new crossings afterwards; the whole network then goes through one batched FFT.
+        # Both groups are contiguous slices.
+        def is_late(field):
+            min_delay = field.delayed_inputs.min_delay()
+            return min_delay is None or min_delay < 1
+
+        main_fields = [field for network in networks for field in
+                       [field for field in network if not field.delayed_inputs.connections]
+                       + [field for field in network if field.delayed_inputs.connections and not is_late(field)]]
+        late_fields = [field for network_fields in self.feedback_fields for field in network_fields
+                       if is_late(field)]
+        self.fields = main_fields + late_fields
+        self.groups = [group for group in (slice(0, len(main_fields)), slice(len(main_fields), len(self.fields)))
+                       if group.stop > group.start]
+        self.main_group = 0 if main_fields else None
+        self.late_group = len(self.groups) - 1 if late_fields else None
+        self.early_feedback_fields = [[field for field in network_fields if not is_late(field)]
+                                      for network_fields in self.feedback_fields]
+        network_index = {id(field): n for n, network in enumerate(networks) for field in network}
+        self.network_of = [network_index[id(field)] for field in self.fields]
+
+        # Stacked state; the fields keep views into these arrays
+        self.u = np.stack([field.u_field for field in self.fields])
+        self.h_u = np.stack([field.h_u for field in self.fields])
+        for k, field in enumerate(self.fields):
+            field.u_field = self.u[k]
+            field.h_u = self.h_u[k]
+
+        dtype = self.u.dtype
+        self.theta = np.array([[field.theta] for field in self.fields], dtype=dtype)
+        self.convolutions = [self._group_convolutions(group) for group in self.groups]
+
+        # Coupling lowered into index arrays, in stages that reproduce the in-order (sequential) update
+        self.stages = compile_stages(self.networks, self.fields, self.groups)
+
+        # h_u adaptation: sequence memory fields grow where they are active, decision fields grow uniformly
+        self.h_rate_active = np.array([[field.dt / field.tau_h if field.field_type == "sequence_memory" else 0.0]
+                                       for field in self.fields], dtype=dtype)
+        self.h_rate_const = np.array([[field.dt / field.tau_h if field.field_type == "decision" else 0.0]
+                                      for field in self.fields], dtype=dtype)
+
+        # Gain of the fixed-step update of each field (dt for explicit Euler, see fields.integrators)
+        self.gain = np.array([[field.step_gain] for field in self.fields], dtype=dtype)
+
+        # Work buffers reused every step
+        self.f = np.zeros_like(self.u)
+        self.conv = np.zeros_like(self.u)
+        self.external_input = np.zeros_like(self.u)
+        self.internal_input = np.zeros_like(self.u)
+        self.partial = np.zeros_like(self.u)
+        self.work = np.zeros_like(self.u)
+
+        # Per-group plans computed once: the fields with delayed inputs (the only ones with feedback events),
+        # the rows adapting h_u (sequence memory and decision fields), and the row addressing of each stage
+        self._feedback_rows = [[(k, field) for k, field in enumerate(self.fields[group])
+                                if field.delayed_inputs.connections] for group in self.groups]
+        self._adapting = [(_rows_with(self.h_rate_active[group]), _rows_with(self.h_rate_const[group]))
+                          for group in self.groups]
+        self._stage_plans = [[self._stage_plan(coupling, group) for coupling in stages]
+                             for stages, group in zip(self.stages, self.groups)]
+        self._input_rows = np.zeros(len(self.fields), dtype=bool)  # Rows holding a nonzero external input
+
+    def step(self, i, input_centers=None):
+        """
+        Advances all fields by one time step.
+        :param i: Index of the current time step, or a sequence with the step index of each network
+                  (independent networks, e.g. the sessions of fields.server, may be at different steps).
+        :param input_centers: Positions monitored in the Action Onset fields.
+        :return: For each network, the list of (position, time) threshold crossings detected in its
+                 Action Onset field in this step (None if it is not monitored).
+        """
+        steps = [i] * len(self.networks) if np.ndim(i) == 0 else list(i)
+        if self.main_group is not None:
+            self._step_group(self.main_group, steps)
+
+        threshold_crossings = [None] * len(self.networks)
+        if input_centers is not None:
+            for n, action_onset_field in enumerate(self.action_onset_fields):
+                if action_onset_field:
+                    threshold_crossings[n] = action_onset_field.monitor_action_onset(input_centers, steps[n])
+
+        # Fields with delayed inputs stepped in the main pass schedule the new crossings for later steps
+        for n, network_fields in enumerate(self.early_feedback_fields):
+            if threshold_crossings[n]:
+                for field in network_fields:
+                    field.handle_feedback_events(steps[n], threshold_crossings[n])
+
+        if self.late_group is not None:
+            crossings_by_field = {id(field): threshold_crossings[n]
+                                  for n, network_fields in enumerate(self.feedback_fields) for field in network_fields}
+            self._step_group(self.late_group, steps, crossings_by_field)
+
+        return threshold_crossings
+
+    def run(self, input_centers=None, stop=None, start=0, checkpoint_every=None, on_checkpoint=None):
+        """
+        Integrates the network over the whole time grid, or until a stop condition is met.
+        :param input_centers: Positions monitored in the Action Onset field.
+        :param stop: Optional stop condition or list of conditions (see fields.stopping).
+        :param start: Index of the first time step (e.g. after restoring a checkpoint).
+        :param checkpoint_every: Capture a Checkpoint every N steps and pass it to on_checkpoint.
+        :param on_checkpoint: Callable receiving the checkpoints (e.g. lambda c: c.save(...)).
+        :return: StopReport of the run.
+        """
+        conditions = as_conditions(stop)
+        profiler = profiling.active
+        for i in range(start, len(self.t)):
+            if profiler is not None:
+                step_start = time.perf_counter()
+                self.step(i, input_centers)
+                profiler.record_step(time.perf_counter() - step_start)
+            else:
+                self.step(i, input_centers)
+            if checkpoint_every and (i + 1) % checkpoint_every == 0:
+                on_checkpoint(Checkpoint.capture(self.fields, i, engine=self))
+            if conditions:
+                report = check_stop(conditions, i, self.fields[0].time_at(i), self.fields)
+                if report is not None:
+                    return finish_run(self.fields, report)
+        return StopReport("completed", len(self.t) - 1, self.fields[0].time_at(len(self.t) - 1))
+
+    def drive(self, u, h_u, external_input, out):
+        """
+        Evaluates the drive conv(f) + external input + internal input + h_u of all fields simultaneously
+        from the given stacked state (used by the network integrators of fields.integrators).
+        The thresholded output is left in self.f.
+        :param u: Stacked field states.
+        :param h_u: Stacked h_u.
+        :param external_input: Stacked external inputs.
+        :param out: Array receiving the drive.
+        """
+        f = np.greater_equal(u, self.theta, out=self.f)
+        for g, group in enumerate(self.groups):
+            conv = self.conv[group]
+            for rows, convolution in self.convolutions[g]:
+                conv[rows] = convolution(f[group][rows])
+        self.couple(u, self.internal_input)
+        np.add(self.conv, external_input, out=out)
+        out += self.internal_input
+        out += h_u
+        return out
+
+    def couple(self, u, out):
+        """Computes the internal input of all fields from the stacked state u into out."""
+        for stages in self.stages:
+            for coupling in stages:
+                out[coupling.rows] = coupling(u, out[coupling.rows])
+        return out
+
+    def _group_convolutions(self, group):
+        # One batched backend per convolution kind (and options) in the group; usually one for the whole group
+        fields = self.fields[group]
+        keys = [(field.convolution.kind, tuple(sorted(field.convolution.options.items()))) for field in fields]
+        convolutions = []
+        for key in dict.fromkeys(keys):
+            rows = [k for k in range(len(fields)) if keys[k] == key]
+            kernels = np.stack([fields[k].kernel for k in rows])
+            convolution = make_convolution(key[0], kernels, self.dx, **dict(key[1]))
+            if rows == list(range(rows[0], rows[-1] + 1)):
+                rows = slice(rows[0], rows[-1] + 1)
+            convolutions.append((rows, convolution))
+        return convolutions
+
+    def _stage_plan(self, coupling, group):
+        # Rows of a coupling stage in the stack and in its group, and their gains; slices (views) when contiguous
+        if coupling.row_slice is not None:
+            rows = coupling.row_slice
+            local = slice(rows.start - group.start, rows.stop - group.start)
+        else:
+            rows = coupling.rows
+            local = coupling.rows - group.start
+        return coupling, rows, local, self.gain[rows]
+
+    def _step_group(self, g, steps, crossings_by_field=None):
+        group = self.groups[g]
+        fields = self.fields[group]
+        u = self.u[group]
+        h_u = self.h_u[group]
+        field_steps = [steps[n] for n in self.network_of[group]]
+
+        # Stage timings when profiling is on (see fields.profiling)
+        timer = profiling.active.timer(f"engine/{g}") if profiling.active is not None else None
+
+        # A delayed input fires into the state of its field before the field is updated, but the fields updated
+        # before it in the sequential order still read its previous state: that state is held for the coupling
+        # until the stage of the field
+        held = []
+        for k, field in self._feedback_rows[g]:
+            crossings = crossings_by_field.get(id(field)) if crossings_by_field else None
+            previous = u[k].copy() if field.delayed_inputs.pending or crossings else None
+            if field.handle_feedback_events(field_steps[k], crossings):
+                held.append((k, previous))
+        if timer:
+            timer.mark("feedback")
+
+        # Fields without scheduled or pushed inputs keep a zero row, which is only cleared once
+        times = [field.time_at(i) for field, i in zip(fields, field_steps)]
+        external_input = self.external_input[group]
+        input_rows = self._input_rows[group]
+        for k, field in enumerate(fields):
+            if field.input_schedule.pars_list or field.live_inputs:
+                external_input[k] = field.get_external_input(times[k])
+                input_rows[k] = True
+            elif input_rows[k]:
+                external_input[k] = 0
+                input_rows[k] = False
+        if timer:
+            timer.mark("external_input")
+
+        # Thresholded output and lateral interaction for the whole group at once
+        f = np.greater_equal(u, self.theta[group], out=self.f[group])
+        conv = self.conv[group]
+        for rows, convolution in self.convolutions[g]:
+            conv[rows] = convolution(f[rows])
+        if timer:
+            timer.mark("convolution")
+
+        active_rows, const_rows = self._adapting[g]
+        if active_rows is not None:
+            h_u[active_rows] += self.h_rate_active[group][active_rows] * f[active_rows]
+        if const_rows is not None:
+            h_u[const_rows] += self.h_rate_const[group][const_rows]
+        if timer:
+            timer.mark("h_u")
+
+        partial = np.subtract(conv, u, out=self.partial[group])
+        partial += external_input
+        fired = []
+        for k, previous in held:
+            fired.append((group.start + k, u[k].copy()))
+            u[k] = previous
+
+        # Coupling stage by stage, so each field sees the updated state of the fields updated before it
+        for coupling, rows, local, gain in self._stage_plans[g]:
+            internal_input = coupling(self.u, self.internal_input[rows])
+            for row, state in fired:
+                if _contains(rows, row):
+                    self.u[row] = state
+            if isinstance(rows, slice):
+                work = np.add(partial[local], internal_input, out=self.work[rows])
+                work += self.h_u[rows]
+                work *= gain
+                self.u[rows] += work
+            else:
+                self.internal_input[rows] = internal_input
+                self.u[rows] += gain * (partial[local] + internal_input + self.h_u[rows])
+        if timer:
+            timer.mark("coupling")
+
+        internal_input = self.internal_input[group]
+        for k, field in enumerate(fields):
+            field.recorder.record(field_steps[k], times[k], u[k], external_input[k], internal_input[k])
+        if timer:
+            timer.mark("history")
+
+
+def _contains(rows, row):
+    # Whether a row is addressed by a stage (slice or index array)
+    if isinstance(rows, slice):
+        return rows.start <= row < rows.stop
+    return row in rows
+
+
+def _rows_with(rates):
+    # Rows of a (n, 1) rate array that are nonzero, as a slice when consecutive (a view), None if there are none
+    rows = np.flatnonzero(rates[:, 0])
+    if len(rows) == 0:
+        return None
+    if rows[-1] - rows[0] == len(rows) - 1:
+        return slice(int(rows[0]), int(rows[-1]) + 1)
+    return rows
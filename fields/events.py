@@ -0,0 +1,254 @@
+import heapq
+from collections import namedtuple
+
+import numpy as np
+
+from fields.utils import nearest_indices
+
+
+# A threshold crossing of a field: direction is "up" (reached theta) or "down" (fell below theta)
+ThresholdEvent = namedtuple("ThresholdEvent", ["field", "position", "time", "step", "direction"])
+
+# A delayed input applied to a field in response to a crossing of a source field
+FeedbackEvent = namedtuple("FeedbackEvent", ["field", "position", "time", "step", "source", "source_time"])
+
+# A delayed-input connection: crossings of `source` are applied as Gaussian inputs after a delay (in steps)
+DelayedConnection = namedtuple("DelayedConnection", ["source", "delays", "amplitude", "width"])
+
+
+class EventLog:
+    """
+    Typed log of the events of a run. Events are kept in order and passed to the registered sinks;
+    printing them is optional (echo=True), so monitoring does not stall the integration loop on stdout.
+    """
+
+    def __init__(self, echo=False):
+        self.events = []
+        self.sinks = []
+        self.echo = echo
+
+    def add_sink(self, sink):
+        """Registers a callable receiving every new event."""
+        self.sinks.append(sink)
+
+    def log(self, event):
+        self.events.append(event)
+        for sink in self.sinks:
+            sink(event)
+        if self.echo:
+            print(format_event(event))
+
+    def extend(self, events):
+        for event in events:
+            self.log(event)
+
+    def of_type(self, event_type):
+        """Returns the logged events of one type (e.g. ThresholdEvent)."""
+        return [event for event in self.events if isinstance(event, event_type)]
+
+    def clear(self):
+        self.events = []
+
+    def __len__(self):
+        return len(self.events)
+
+    def __iter__(self):
+        return iter(self.events)
+
+
+def format_event(event):
+    """Formats an event the way the monitoring messages used to be printed."""
+    if isinstance(event, ThresholdEvent):
+        verb = "reached" if event.direction == "up" else "left"
+        return f"Threshold {verb} in {event.field} at position {event.position:.2f} at time {event.time:.2f}"
+    if isinstance(event, FeedbackEvent):
+        return (f"{event.field} field activated at time {event.time:.2f} due to {event.source} threshold crossing "
+                f"at position {event.position:.2f} and time {event.source_time:.2f}")
+    return repr(event)
+
+
+class ThresholdMonitor:
+    """
+    Detects threshold crossings of a field with one vectorized comparison per step.
+
+    With positions, the grid indices closest to the positions are computed once and the field is compared
+    at those indices against the previous step. Without positions, the whole field is watched and an event
+    is reported for every new supra-threshold region (a new bump), at the position of its peak.
+    """
+
+    def __init__(self, field, positions=None, theta=None, direction="up", once=True, log=None):
+        """
+        :param field: Field to monitor.
+        :param positions: x positions to monitor (e.g. the input centers); None watches the whole field.
+        :param theta: Threshold (defaults to the field's theta).
+        :param direction: "up", "down" or "both".
+        :param once: With positions, report each position only once (its first crossing), as for action onsets.
+        :param log: EventLog receiving the events (defaults to the field's event_log).
+        """
+        if direction not in ("up", "down", "both"):
+            raise ValueError(f"Unknown direction '{direction}', expected 'up', 'down' or 'both'.")
+        self.field = field
+        self.positions = None if positions is None else list(positions)
+        self.theta = field.theta if theta is None else theta
+        self.direction = direction
+        self.once = once
+        self.log = field.event_log if log is None else log
+
+        self.indices = None if positions is None else nearest_indices(field.x, self.positions)
+        width = len(field.x) if self.indices is None else len(self.indices)
+        self.above = np.zeros(width, dtype=bool)  # State at the previous check (everything starts below)
+        self.fired_up = np.zeros(width, dtype=bool)
+        self.fired_down = np.zeros(width, dtype=bool)
+
+    def check(self, i):
+        """
+        Compares the field with the state at the previous check and logs the crossings.
+        :param i: Index of the current time step.
+        :return: List of ThresholdEvent detected in this step.
+        """
+        u = self.field.u_field if self.indices is None else self.field.u_field[self.indices]
+        above = u >= self.theta
+        events = []
+        if self.indices is None:
+            if self.direction in ("up", "both"):
+                events += self._region_events(i, u, above, self.above, "up")
+            if self.direction in ("down", "both"):
+                events += self._region_events(i, u, self.above, above, "down")
+        else:
+            if self.direction in ("up", "both"):
+                events += self._site_events(i, above & ~self.above, self.fired_up, "up")
+            if self.direction in ("down", "both"):
+                events += self._site_events(i, ~above & self.above, self.fired_down, "down")
+        self.above = above
+
+        self.log.extend(events)
+        return events
+
+    def reset(self):
+        """Forgets the previous state and which positions have fired."""
+        self.above[:] = False
+        self.fired_up[:] = False
+        self.fired_down[:] = False
+
+    def _site_events(self, i, crossed, fired, direction):
+        if self.once:
+            crossed &= ~fired
+            fired |= crossed
+        hits = np.flatnonzero(crossed)
+        if len(hits) == 0:
+            return []
+        time = self.field.time_at(i)
+        x = self.field.x[self.indices[hits]]
+        return [ThresholdEvent(self.field.name, position, time, i, direction) for position in x]
+
+    def _region_events(self, i, u, current, previous, direction):
+        # Regions of `current` that do not overlap `previous` are new (or, for "down", vanished) bumps
+        edges = np.diff(np.concatenate(([0], current.view(np.int8), [0])))
+        starts, ends = np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)
+        if len(starts) == 0:
+            return []
+        overlap = np.concatenate(([0], np.cumsum(previous)))
+        new = (overlap[ends] - overlap[starts]) == 0
+        if not new.any():
+            return []
+
+        time = self.field.time_at(i)
+        events = []
+        for start, end in zip(starts[new], ends[new]):
+            peak = start + int(np.argmax(u[start:end])) if direction == "up" else (start + end - 1) // 2
+            events.append(ThresholdEvent(self.field.name, self.field.x[peak], time, i, direction))
+        return events
+
+
+class DelayedInputScheduler:
+    """
+    Applies delayed Gaussian inputs to a field in response to threshold crossings of other fields
+    (e.g. Robot Feedback reacting to Action Onset).
+
+    Pending inputs are kept in a heap keyed by the step at which they are due, so any number of them can be
+    scheduled and several can fire in the same step. Each connection has its own delay distribution:
+      - an int: the same delay for every crossing,
+      - a sequence: the k-th crossing of the connection gets the k-th delay (cycling through the sequence),
+      - a callable: called with k, returns the delay of the k-th crossing (e.g. drawn from a distribution).
+    The Gaussian profile of each input is computed once per position and cached.
+    """
+
+    def __init__(self, field):
+        self.field = field
+        self.connections = []
+        self.counts = []  # Crossings scheduled so far per connection
+        self.pending = []  # Heap of (due step, sequence number, position, crossing step, connection index)
+        self._sequence = 0
+        self._profiles = {}
+
+    def add_connection(self, source, delays, amplitude=3.0, width=1.5):
+        """
+        :param source: Name of the field whose crossings trigger the inputs.
+        :param delays: Delay distribution in time steps (int, sequence or callable, see the class docstring).
+        :param amplitude: Amplitude of the Gaussian input.
+        :param width: Width of the Gaussian input.
+        """
+        self.connections.append(DelayedConnection(source, delays, amplitude, width))
+        self.counts.append(0)
+
+    def schedule(self, source, crossings, i):
+        """
+        Schedules the delayed inputs of all connections from source for the crossings detected at step i.
+        :param source: Name of the field that crossed the threshold.
+        :param crossings: List of (position, time) crossings.
+        :param i: Index of the current time step.
+        """
+        for c, connection in enumerate(self.connections):
+            if connection.source != source:
+                continue
+            for position, _ in crossings:
+                delay = self._delay(connection.delays, self.counts[c])
+                self.counts[c] += 1
+                heapq.heappush(self.pending, (i + delay, self._sequence, position, i, c))
+                self._sequence += 1
+
+    def fire_due(self, i):
+        """
+        Applies all inputs due at step i (or earlier) to the field and logs them.
+        :return: List of FeedbackEvent fired in this step.
+        """
+        events = []
+        while self.pending and self.pending[0][0] <= i:
+            _, _, position, crossing_step, c = heapq.heappop(self.pending)
+            connection = self.connections[c]
+            self.field.u_field += self._profile(position, connection.amplitude, connection.width)
+            events.append(FeedbackEvent(self.field.name, position, self.field.time_at(i), i, connection.source,
+                                        self.field.time_at(crossing_step)))
+        self.field.event_log.extend(events)
+        return events
+
+    def min_delay(self):
+        """
+        Smallest delay of the connections in steps, or None if it is not known in advance (callable delays) or
+        there are no connections.
+        """
+        delays = []
+        for connection in self.connections:
+            if callable(connection.delays):
+                return None
+            delays.append(int(np.min(connection.delays)))
+        return min(delays) if delays else None
+
+    def next_due_step(self):
+        """Step at which the next pending input is due, or None."""
+        return self.pending[0][0] if self.pending else None
+
+    def _profile(self, position, amplitude, width):
+        key = (position, amplitude, width)
+        if key not in self._profiles:
+            profile = amplitude * np.exp(-0.5 * ((self.field.x - position) / width) ** 2)
+            self._profiles[key] = profile.astype(self.field.u_field.dtype)
+        return self._profiles[key]
+
+    @staticmethod
+    def _delay(delays, k):
+        if callable(delays):
+            return int(delays(k))
+        if np.ndim(delays) == 0:
+            return int(delays)
+        return int(delays[k % len(delays)])
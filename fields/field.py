@@ -1,14 +1,22 @@
 # fields/field.py
 
 import numpy as np
-from fields.utils import external_input_function, kernel_osc
+from fields.utils import kernel_osc
 from fields.utils import load_sequence_memory
-import matplotlib.pyplot as plt
+from fields.recorder import HistoryRecorder
+from fields.inputs import InputSchedule
+from fields import kernel_cache, profiling
+from fields.convolution import make_convolution
+from fields.events import EventLog, ThresholdMonitor, DelayedInputScheduler
+from fields.field_network import Connection
+from fields.integrators import step_gain
 
 
 class Field:
     def __init__(self, kernel_pars, field_pars, external_input_pars_list=None, tau_h=100, h_0=0, input_flag=True,
-                 name="Field", field_type=None, theta=1.0):
+                 name="Field", field_type=None, theta=1.0, history=None,
+                 convolution="rfft", convolution_options=None, integrator="euler", sequence_memory=None,
+                 dtype=np.float64):
         # Existing code
         self.kernel_pars = kernel_pars
         self.field_pars = field_pars
@@ -21,140 +29,205 @@ class Field:
         self.input_flag = input_flag
         self.theta = theta
 
+        # Floating point type of the state, inputs, kernel spectrum and histories (np.float32 halves memory
+        # and bandwidth; see fields.precision to check the drift against float64)
+        self.dtype = np.dtype(dtype)
+        if self.dtype not in (np.float32, np.float64):
+            raise ValueError(f"Unsupported dtype {self.dtype}, expected float32 or float64.")
+
         # Spatial and temporal grids
         self.x = np.arange(-self.x_lim, self.x_lim + self.dx, self.dx)
         self.t = np.arange(0, self.t_lim + self.dt, self.dt)
 
-        # State history and current state initialization
-        self.history_u = np.zeros([len(self.t), len(self.x)])
+        # Recording policy for the state and input histories (records every step by default)
+        self.recorder = (history if history is not None else HistoryRecorder()).bind(self.x, self.t, self.dtype)
 
         if field_type == "decision":
-            self.u_field = load_sequence_memory().flatten() - 6.2  # Ensure it's 1D
-            self.loaded_internal_input = load_sequence_memory().flatten() - 6.2  # Store loaded data for internal input
+            # Learned memory (the latest one unless given), loaded once and shared with the other decision fields
+            memory = load_sequence_memory() if sequence_memory is None else np.asarray(sequence_memory)
+            # Store loaded data for internal input
+            self.loaded_internal_input = (memory.flatten() - 6.2).astype(self.dtype)
+            self.u_field = self.loaded_internal_input.copy()  # Ensure it's 1D
         else:
-            self.u_field = h_0 * np.ones(np.shape(self.x))  # Default initialization
-            self.loaded_internal_input = np.zeros_like(self.x)  # Default for other types
-        self.activity = np.zeros([len(self.t), len(self.x)])  # Initialize activity
+            self.u_field = h_0 * np.ones(np.shape(self.x), dtype=self.dtype)  # Default initialization
+            self.loaded_internal_input = np.zeros_like(self.x, dtype=self.dtype)  # Default for other types
+
+        self.h_u = h_0 * np.ones(np.shape(self.x), dtype=self.dtype)
 
-        # Initialize activity to zeros
-        self.activity = np.zeros([len(self.t), len(self.x)])  # This stays the same for both types
+        # Kernel and lateral-interaction backend ("rfft" by default, "fft" for the reference complex path,
+        # "delta" for incremental updates of mostly stable outputs, "direct" for truncated fast-decaying
+        # kernels, "auto" to choose between "direct" and "rfft" from the kernel support). The sampled kernel
+        # and its spectrum are shared read-only by all fields with the same kernel and grid (fields.kernel_cache)
+        self.kernel = kernel_cache.shared_cache.kernel(kernel_osc, self.x, self.kernel_pars, self.dtype)
+        self.convolution = make_convolution(convolution, self.kernel, self.dx, **(convolution_options or {}))
 
-        self.h_u = h_0 * np.ones(np.shape(self.x))
+        # Fixed-step scheme: "euler" (explicit Euler) or "exponential" (exponential Euler, exact decay)
+        self.integrator = integrator
+        self.step_gain = step_gain(integrator, self.dt)
 
-        # Fourier transform of the kernel function
-        self.w_hat = np.fft.fft(kernel_osc(self.x, *self.kernel_pars))
+        # External inputs compiled once into an event timeline with cached profiles
+        self.input_schedule = InputSchedule(self.x, self.external_input_pars_list, dtype=self.dtype)
 
-        # List of connected fields (internal inputs)
+        # List of connected fields (internal inputs) and the typed connections they define
         self.connected_fields = []
+        self.connections = []
 
-        # Initialize histories for internal and external inputs
-        self.history_external_input = np.zeros([len(self.t), len(self.x)])  # External input history
-        self.history_internal_input = np.zeros([len(self.t), len(self.x)])  # Internal input history
+        # Threshold monitors (created on first use, one per set of monitored positions) and their event log
+        self.monitors = {}
+        self.event_log = EventLog()
 
-        # Initialize monitoring state for input centers
-        self.threshold_crossed = {}
+        # Delayed inputs triggered by threshold crossings of other fields (see add_delayed_input)
+        self.delayed_inputs = DelayedInputScheduler(self)
 
-        # Initialize lists for tracking threshold crossing delays
-        self.delay_queue = []  # To store delays for threshold crossing messages
-        self.crossing_positions = []  # To store positions of the crossings
-        self.crossing_times = []  # To store the time when crossings occurred
+        # Sensor-driven inputs pushed while the field is running (see push_input)
+        self.live_inputs = {}
+        self.live_input = np.zeros_like(self.x, dtype=self.dtype)
+
+    def time_at(self, i):
+        """Returns the time of step i, also for steps past the precomputed time grid (streaming runs)."""
+        return self.t[i] if i < len(self.t) else i * self.dt
 
     def integrate_single_step(self, i, threshold_crossings=None):
-        # Monitor threshold crossings for "Robot feedback" field
-        if self.name == "Robot Feedback" and threshold_crossings:
-            for crossing_position, crossing_time in threshold_crossings:
-                # Append crossing position and current time to track delays
-                self.crossing_positions.append(crossing_position)
-                self.crossing_times.append(i)
-
-                # Add a delay for each crossing (customize as needed)
-                self.delay_queue.append(14)  # Delay for the first crossing
-                self.delay_queue.append(16)  # Delay for the second crossing
-                self.delay_queue.append(22)  # Delay for the third crossing
-
-        # Check for delayed printing of messages and apply Gaussian input
-        if self.crossing_times:
-            for j in range(len(self.crossing_times)):
-                if i >= self.crossing_times[j] + self.delay_queue[j]:
-                    print(
-                        f"Robot feedback field activated at time {self.t[i]:.2f} due to Action Onset threshold crossing at position {self.crossing_positions[j]:.2f} and time {self.t[self.crossing_times[j]]:.2f}"
-                    )
-
-                    # Apply Gaussian input at the crossing position
-                    center = self.crossing_positions[j]
-                    amplitude = 3.0  # Customize the amplitude as needed
-                    width = 1.5  # Customize the width of the Gaussian input as needed
-                    gaussian_input = amplitude * np.exp(-0.5 * ((self.x - center) / width) ** 2)
-
-                    # Add the Gaussian input to the field
-                    self.u_field += gaussian_input
-
-                    # Remove the printed crossing from the lists
-                    self.crossing_times.pop(j)
-                    self.crossing_positions.pop(j)
-                    self.delay_queue.pop(j)
-                    break  # Exit the loop after handling a print to avoid index issues
-
-        external_input = self.get_external_input(self.t[i])
+        # Stage timings when profiling is on (see fields.profiling)
+        timer = profiling.active.timer(self.name) if profiling.active is not None else None
+
+        self.handle_feedback_events(i, threshold_crossings)
+        if timer:
+            timer.mark("feedback")
+
+        external_input = self.get_external_input(self.time_at(i))
+        if timer:
+            timer.mark("external_input")
         internal_input = self.get_internal_input(i)
+        if timer:
+            timer.mark("internal_input")
+
+        f = self.convolution.threshold(self.u_field, self.theta)
+        conv = self.convolution(f)
+        if timer:
+            timer.mark("convolution")
 
-        # Track the internal and external inputs for this time step
-        self.history_external_input[i, :] = external_input
-        self.history_internal_input[i, :] = internal_input
+        self._update_h_u(f)
+        if timer:
+            timer.mark("h_u")
 
-        f = np.heaviside(self.u_field - self.theta, 1)
-        f_hat = np.fft.fft(f)
-        conv = self.dx * np.fft.ifftshift(np.real(np.fft.ifft(f_hat * self.w_hat)))
+        self.u_field += self.step_gain * (-self.u_field + conv + external_input + internal_input + self.h_u)
+        if timer:
+            timer.mark("update")
 
+        # Track the activity state and the inputs of this time step
+        self.recorder.record(i, self.time_at(i), self.u_field, external_input, internal_input)
+        if timer:
+            timer.mark("history")
+
+    def _update_h_u(self, f):
         # Calculate h_u based on field type
         if self.field_type == "sequence_memory":
             self.h_u += self.dt / self.tau_h * f
         elif self.field_type == "decision":
             self.h_u += self.dt / self.tau_h
-        else:
-            # If the type is not provided, keep h_u constant
-            self.h_u = self.h_u  # No change to h_u
+        # If the type is not provided, keep h_u constant
 
-        self.u_field += self.dt * (-self.u_field + conv + external_input + internal_input + self.h_u)
+    @property
+    def history_u(self):
+        """Recorded field states, shape (n_recorded, n_recorded_positions)."""
+        return self.recorder.u
 
-        # Track the activity state
-        self.history_u[i, :] = self.u_field
-        self.activity[i, :] = self.u_field
+    @property
+    def activity(self):
+        """Alias of history_u."""
+        return self.recorder.u
+
+    @property
+    def history_external_input(self):
+        """Recorded external inputs."""
+        return self.recorder.external_input
+
+    @property
+    def history_internal_input(self):
+        """Recorded internal inputs."""
+        return self.recorder.internal_input
+
+    def final_state(self):
+        """Returns a copy of the current (final) state of the whole field, independent of the recording policy."""
+        return self.u_field.copy()
+
+    def handle_feedback_events(self, i, threshold_crossings=None, source="Action Onset"):
+        """
+        Schedules the delayed inputs for new threshold crossings of a source field and applies the delayed
+        inputs that are due. Runs at the start of every integration step, before the field output is thresholded.
+        :param i: Index of the current time step.
+        :param threshold_crossings: List of (position, time) crossings reported by the source field.
+        :param source: Name of the field that reported the crossings.
+        :return: List of FeedbackEvent fired in this step.
+        """
+        if threshold_crossings:
+            self.delayed_inputs.schedule(source, threshold_crossings, i)
+        if self.delayed_inputs.pending:
+            return self.delayed_inputs.fire_due(i)
+        return []
+
+    def add_delayed_input(self, source, delays, amplitude=3.0, width=1.5):
+        """
+        Makes threshold crossings of another field apply a Gaussian input to this field after a delay.
+        :param source: Name of the field whose crossings trigger the input.
+        :param delays: Delay in time steps: an int, a sequence (k-th crossing gets the k-th delay, cycling)
+                       or a callable returning the delay of the k-th crossing.
+        :param amplitude: Amplitude of the Gaussian input.
+        :param width: Width of the Gaussian input.
+        """
+        self.delayed_inputs.add_connection(source, delays, amplitude, width)
 
     def monitor_action_onset(self, input_centers, i):
         """
         Monitors the action_onset field at specific positions (input_centers).
-        If the activity at these positions reaches or exceeds the threshold, a message is printed once.
+        A crossing is reported once per position, the first time the activity there reaches the threshold,
+        and logged as a ThresholdEvent in the field's event_log.
         Returns a list of crossing points and the corresponding time.
         """
-        threshold_crossings = []  # List to store threshold crossing info
-
-        for center in input_centers:
-            # Find the closest index to the center position in the spatial grid self.x
-            closest_idx = np.abs(self.x - center).argmin()
+        events = self.get_monitor(input_centers).check(i)
+        return [(event.position, event.time) for event in events]
 
-            # Initialize the monitoring state for this center if not already done
-            if center not in self.threshold_crossed:
-                self.threshold_crossed[center] = False
-
-            # Check if the activity at this position exceeds the threshold and hasn't been printed yet
-            if self.u_field[closest_idx] >= self.theta and not self.threshold_crossed[center]:
-                # Log the crossing point and time
-                threshold_crossings.append((self.x[closest_idx], self.t[i]))
+    def get_monitor(self, positions=None, direction="up"):
+        """
+        Returns the threshold monitor of this field for the given positions (None for the whole field),
+        creating it on first use so the closest grid indices are only computed once.
+        """
+        key = (None if positions is None else tuple(positions), direction)
+        if key not in self.monitors:
+            self.monitors[key] = ThresholdMonitor(self, positions, direction=direction)
+        return self.monitors[key]
 
-                # Print the message with 2 decimal places for position, activity, and time
-                print(f"Threshold reached at position {self.x[closest_idx]:.2f} at time {self.t[i]:.2f}")
+    def get_external_input(self, t):
+        """Returns the external input at time t (scheduled inputs plus pushed live inputs); do not modify it."""
+        total_input = self.input_schedule(t)
+        if self.live_inputs:
+            return total_input + self.live_input
+        return total_input
 
-                # Mark this center as having crossed the threshold
-                self.threshold_crossed[center] = True
+    def push_input(self, key, center, amplitude, width):
+        """
+        Adds a Gaussian input that stays on until it is released, e.g. driven by a sensor in a closed loop.
+        Pushing an input with an existing key replaces it.
+        :param key: Identifier used to release the input.
+        :param center: Center of the Gaussian input.
+        :param amplitude: Amplitude of the Gaussian input.
+        :param width: Width of the Gaussian input.
+        """
+        profile = amplitude * (np.exp(-((self.x - center) ** 2) / (2 * (width ** 2))))
+        self.live_inputs[key] = profile.astype(self.dtype)
+        self._update_live_input()
 
-        return threshold_crossings  # Return the list of crossing points and times
+    def release_input(self, key):
+        """Removes a pushed input; unknown keys are ignored."""
+        if self.live_inputs.pop(key, None) is not None:
+            self._update_live_input()
 
-    def get_external_input(self, t):
-        total_input = np.zeros_like(self.x)
-        for input_pars in self.external_input_pars_list:  # Iterate over the list of input parameters
-            total_input += external_input_function(self.x, t, input_pars)
-        return total_input
+    def _update_live_input(self):
+        # Rebuild the sum instead of subtracting, so releasing inputs does not accumulate rounding errors
+        self.live_input[:] = 0
+        for profile in self.live_inputs.values():
+            self.live_input += profile
 
     def get_internal_input(self, i):
         # Initialize internal input with the loaded data for "decision" field type
@@ -163,35 +236,19 @@ class Field:
         else:
             internal_input = np.zeros_like(self.u_field)  # For other types, initialize to zeros
 
-        # Check if this field is the Working Memory field
-        if self.name == "Working Memory":
-            # Get the Human and Robot feedback fields (assuming they are connected fields)
-            human_feedback_field = self.get_connected_field_by_name("Human Feedback")
-            robot_feedback_field = self.get_connected_field_by_name("Robot Feedback")
-
-            # Define a threshold for both fields
-            threshold = 1.0  # Customize this threshold as needed
-            constant = 3.0  # Define a scaling constant for the input
-
-            # Check if both fields exceed the threshold
-            if human_feedback_field is not None and robot_feedback_field is not None:
-                mask_human = human_feedback_field.u_field > threshold
-                mask_robot = robot_feedback_field.u_field > threshold
-                internal_input += constant * mask_human * mask_robot
-                return internal_input
-
-        # Add inputs from connected fields with their custom parameters
-        for connected_field, weight, connection_params in self.connected_fields:
-            # Extract connection-specific parameters
-            threshold = connection_params.get('threshold', None)  # Get threshold if provided
-
-            # Apply threshold logic if a threshold is provided
-            if threshold is not None:
-                mask = connected_field.u_field > threshold  # Create a mask where activity exceeds threshold
-                internal_input += weight * connected_field.u_field * mask
+        for connection in self.connections:
+            if connection.kind == "and":
+                # Input only where all source fields exceed the threshold
+                gate = connection.weight
+                for source in connection.sources:
+                    gate = gate * (source.u_field > connection.threshold)
+                internal_input += gate
+            elif connection.kind == "thresholded":
+                source = connection.sources[0]
+                mask = source.u_field > connection.threshold  # Create a mask where activity exceeds threshold
+                internal_input += connection.weight * source.u_field * mask
             else:
-                # If no threshold, just apply the connection with weight and scaling factor
-                internal_input += weight * connected_field.u_field
+                internal_input += connection.weight * connection.sources[0].u_field
 
         return internal_input
 
@@ -217,8 +274,23 @@ class Field:
             connection_params = {}  # If no parameters provided, use an empty dictionary
         self.connected_fields.append((field, weight, connection_params))
 
+        threshold = connection_params.get('threshold', None)
+        kind = "weighted" if threshold is None else "thresholded"
+        self.connections.append(Connection(kind, (field,), weight, threshold))
+
+    def add_gated_connection(self, fields, gain=3.0, threshold=1.0):
+        """
+        Adds a multiplicative AND-gate: the field receives gain wherever all the given fields exceed threshold.
+        :param fields: The gating fields.
+        :param gain: Input added where all gating fields are above threshold.
+        :param threshold: Threshold applied to every gating field.
+        """
+        self.connections.append(Connection("and", tuple(fields), gain, threshold))
+
     def plot_loaded_field(self):
         """Plots the loaded u_field for the decision field."""
+        import matplotlib.pyplot as plt  # Plotting is optional, the simulation only needs numpy
+
         if self.field_type == "decision":
             plt.plot(self.x, self.u_field)
             plt.xlabel('x')
@@ -1,7 +1,218 @@
+from collections import namedtuple
+
+import numpy as np
+
+
+# A typed connection into a field:
+#   - "weighted":    weight * u_source
+#   - "thresholded": weight * u_source * (u_source > threshold)
+#   - "and":         weight * (u_1 > threshold) * (u_2 > threshold) * ...  (multiplicative AND-gate)
+Connection = namedtuple("Connection", ["kind", "sources", "weight", "threshold"])
+
+
 class FieldNetwork:
+    """
+    Connection graph of a network of fields.
+
+    Connections are declared on the target field (Field.add_connection / Field.add_gated_connection) or
+    through connect_fields / connect_and_gate here. compile_stages lowers them once into index arrays so the
+    coupling of all fields is computed with a few vectorized operations per step (see CompiledCoupling).
+    """
+
     def __init__(self, fields):
         self.fields = fields
 
-    def connect_fields(self, field1, field2, weight):
-        # Code to connect field1 to field2
-        pass
+    def connect_fields(self, field1, field2, weight, threshold=None):
+        """
+        Connects field1 to field2 (field2 receives weight * u_field1, masked by u_field1 > threshold if given).
+        """
+        connection_params = {} if threshold is None else {'threshold': threshold}
+        field2.add_connection(field1, weight=weight, connection_params=connection_params)
+
+    def connect_and_gate(self, sources, target, gain, threshold):
+        """Makes target receive gain wherever all source fields are above threshold."""
+        target.add_gated_connection(sources, gain=gain, threshold=threshold)
+
+    def validate(self):
+        """
+        Checks that field names are unique and that every connection and delayed input comes from a field
+        of this network.
+        """
+        names = [field.name for field in self.fields]
+        duplicates = sorted({name for name in names if names.count(name) > 1})
+        if duplicates:
+            raise ValueError(f"Field names must be unique in a network, found duplicates: {duplicates}.")
+
+        members = {id(field) for field in self.fields}
+        for field in self.fields:
+            for connection in field.connections:
+                for source in connection.sources:
+                    if id(source) not in members:
+                        raise ValueError(f"Field '{field.name}' is connected to '{source.name}', "
+                                         f"which is not part of the network.")
+            for connection in field.delayed_inputs.connections:
+                if connection.source not in names:
+                    raise ValueError(f"Field '{field.name}' has delayed inputs from '{connection.source}', "
+                                     f"which is not part of the network.")
+
+    def update_stages(self, order):
+        """
+        Splits fields into update stages that reproduce the sequential (in-order) update: a field reading a
+        field updated before it goes to a later stage; a field reading a field updated after it must not
+        be in a later stage than that field. Fields of a stage are updated together.
+        :param order: Fields of this network in update order, each at most once.
+        :return: Stage number of each field, in the given order.
+        """
+        members = {id(field) for field in self.fields}
+        foreign = [field.name for field in order if id(field) not in members]
+        if foreign:
+            raise ValueError(f"Fields {foreign} in the update order are not part of the network.")
+        position = {id(field): k for k, field in enumerate(order)}
+        if len(position) != len(order):
+            raise ValueError("A field appears more than once in the update order.")
+        stages = []
+        for k, field in enumerate(order):
+            stage = 0
+            for connection in field.connections:
+                for source in connection.sources:
+                    j = position.get(id(source))
+                    if j is not None and j < k:
+                        stage = max(stage, stages[j] + 1)
+            # Earlier fields that read this one must see its old value: do not update it before them
+            for j in range(k):
+                if any(source is field for connection in order[j].connections
+                       for source in connection.sources):
+                    stage = max(stage, stages[j])
+            stages.append(stage)
+        return stages
+
+
+class CompiledCoupling:
+    """
+    Coupling of a set of target rows of a stacked state array, lowered into index arrays:
+    one gather of the source rows, one masked product and one scatter-add for the weighted/thresholded
+    connections, and the same for the AND-gates. The gathers and products are written into work buffers
+    allocated once, and the scatter-add becomes an in-place addition to a slice when the connections of a kind
+    go to consecutive targets, one each.
+    """
+
+    def __init__(self, fields, rows, row_of):
+        """
+        :param fields: Target fields, in the order of rows.
+        :param rows: Rows of the targets in the stacked state array.
+        :param row_of: Dictionary mapping id(field) to its row in the stacked state array.
+        """
+        self.rows = np.asarray(rows, dtype=np.intp)
+        # Contiguous target rows are addressed with a slice, so the engine works on views of its arrays
+        self.row_slice = _as_slice(self.rows)
+        self.base = np.stack([field.loaded_internal_input if field.field_type == "decision"
+                              else np.zeros_like(field.u_field) for field in fields])
+        dtype = self.base.dtype
+        width = self.base.shape[-1]
+
+        edges, gates = [], []
+        for t, field in enumerate(fields):
+            for connection in field.connections:
+                if connection.kind == "and":
+                    gates.append((t, [row_of[id(source)] for source in connection.sources],
+                                  connection.weight, connection.threshold))
+                else:
+                    threshold = connection.threshold if connection.kind == "thresholded" else -np.inf
+                    edges.append((t, row_of[id(connection.sources[0])], connection.weight, threshold))
+
+        self.edge_targets = np.array([edge[0] for edge in edges], dtype=np.intp)
+        self.edge_sources = np.array([edge[1] for edge in edges], dtype=np.intp)
+        self.edge_weights = np.array([[edge[2]] for edge in edges], dtype=dtype).reshape(-1, 1)
+        self.edge_thresholds = np.array([[edge[3]] for edge in edges], dtype=dtype).reshape(-1, 1)
+        self.edge_targets_unique = len(set(self.edge_targets.tolist())) == len(self.edge_targets)
+        self.edge_target_slice = _as_slice(self.edge_targets)
+
+        # Gates of different arity are padded with the first source and an always-true threshold
+        arity = max((len(gate[1]) for gate in gates), default=1)
+        self.gate_targets = np.array([gate[0] for gate in gates], dtype=np.intp)
+        self.gate_sources = np.array([gate[1] + [gate[1][0]] * (arity - len(gate[1])) for gate in gates],
+                                     dtype=np.intp).reshape(-1, arity)
+        self.gate_gains = np.array([[gate[2]] for gate in gates], dtype=dtype).reshape(-1, 1)
+        self.gate_thresholds = np.array([[gate[3]] * len(gate[1]) + [-np.inf] * (arity - len(gate[1]))
+                                         for gate in gates], dtype=dtype).reshape(-1, arity)
+        self.gate_targets_unique = len(set(self.gate_targets.tolist())) == len(self.gate_targets)
+        self.gate_target_slice = _as_slice(self.gate_targets)
+
+        # Work buffers reused by every call
+        self._edge_values = np.empty((len(edges), width), dtype=dtype)
+        self._edge_mask = np.empty((len(edges), width), dtype=bool)
+        self._gate_values = np.empty((len(gates), width), dtype=dtype)
+        self._gate_sources = np.empty((len(gates), width), dtype=dtype)
+        self._gate_mask = np.empty((len(gates), width), dtype=bool)
+
+    def __call__(self, u, out):
+        """
+        Computes the internal input of the target rows.
+        :param u: Stacked state array.
+        :param out: Array of shape (n_targets, n_x) receiving the internal input.
+        """
+        out[...] = self.base
+        if len(self.edge_sources):
+            values = np.take(u, self.edge_sources, axis=0, out=self._edge_values, mode="clip")
+            np.greater(values, self.edge_thresholds, out=self._edge_mask)
+            values *= self._edge_mask
+            values *= self.edge_weights
+            _scatter_add(out, self.edge_targets, values, self.edge_targets_unique, self.edge_target_slice)
+        if len(self.gate_sources):
+            values = self._gate_values
+            values[...] = self.gate_gains
+            for a in range(self.gate_sources.shape[1]):
+                sources = np.take(u, self.gate_sources[:, a], axis=0, out=self._gate_sources, mode="clip")
+                values *= np.greater(sources, self.gate_thresholds[:, a:a + 1], out=self._gate_mask)
+            _scatter_add(out, self.gate_targets, values, self.gate_targets_unique, self.gate_target_slice)
+        return out
+
+
+def _as_slice(indices):
+    # The slice selecting the given indices if they are consecutive and increasing, otherwise None
+    if len(indices) and np.array_equal(indices, np.arange(indices[0], indices[0] + len(indices))):
+        return slice(int(indices[0]), int(indices[0]) + len(indices))
+    return None
+
+
+def _scatter_add(out, targets, values, unique, target_slice=None):
+    # Buffered fancy-index addition is much faster than np.add.at but only correct without repeated targets;
+    # consecutive targets are a view, which avoids the gather and scatter of the fancy index
+    if target_slice is not None:
+        out[target_slice] += values
+    elif unique:
+        out[targets] += values
+    else:
+        np.add.at(out, targets, values)
+
+
+def compile_stages(networks, fields, groups):
+    """
+    Compiles the coupling of one or more independent networks stacked in one state array.
+    :param networks: List of networks (lists of fields).
+    :param fields: All fields in stack order.
+    :param groups: Slices of the stack that are stepped one after the other (e.g. main and feedback fields).
+    :return: For each group, the list of CompiledCoupling stages in update order.
+    """
+    row_of = {id(field): k for k, field in enumerate(fields)}
+    stage_of = {}
+    for network in networks:
+        graph = FieldNetwork(network)
+        graph.validate()
+        members = {id(field) for field in network}
+        for group in groups:
+            order = [field for field in fields[group] if id(field) in members]
+            for field, stage in zip(order, graph.update_stages(order)):
+                stage_of[id(field)] = stage
+
+    compiled = []
+    for group in groups:
+        group_fields = fields[group]
+        n_stages = max(stage_of[id(field)] for field in group_fields) + 1
+        stages = []
+        for stage in range(n_stages):
+            members = [field for field in group_fields if stage_of[id(field)] == stage]
+            if members:
+                stages.append(CompiledCoupling(members, [row_of[id(field)] for field in members], row_of))
+        compiled.append(stages)
+    return compiled
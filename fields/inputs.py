@@ -0,0 +1,93 @@
+import numpy as np
+
+
+class InputSchedule:
+    """
+    Precompiled schedule of Gaussian external inputs given as (center, amplitude, width, active_start, active_end).
+
+    Each Gaussian profile is evaluated once and truncated to its support. The on/off times are sorted into
+    an event timeline, and the summed input is kept as a running sum that is only rebuilt when an input
+    switches on or off. An input is active when active_start <= t <= active_end, as in
+    external_input_function.
+    """
+
+    def __init__(self, x, external_input_pars_list, tolerance=1e-12, dtype=np.float64):
+        """
+        :param x: Spatial grid of the field.
+        :param external_input_pars_list: List of (center, amplitude, width, active_start, active_end) tuples.
+        :param tolerance: Profile values below tolerance * |amplitude| are dropped from the support.
+        :param dtype: Floating point type of the profiles and of the summed input.
+        """
+        self.x = x
+        self.pars_list = list(external_input_pars_list)
+        self.profiles = []  # (start index, stop index, values) per input
+        for center, amplitude, width, _, _ in self.pars_list:
+            profile = amplitude * (np.exp(-((x - center) ** 2) / (2 * (width ** 2))))
+            support = np.flatnonzero(np.abs(profile) > tolerance * abs(amplitude))
+            if len(support) == 0:
+                self.profiles.append((0, 0, profile[:0].astype(dtype)))
+            else:
+                lo, hi = support[0], support[-1] + 1
+                self.profiles.append((lo, hi, profile[lo:hi].astype(dtype)))
+
+        # Event timeline: inputs switch on once t >= active_start and off once t > active_end
+        self.on_times = np.array([pars[3] for pars in self.pars_list], dtype=float)
+        self.off_times = np.array([pars[4] for pars in self.pars_list], dtype=float)
+        self.on_order = np.argsort(self.on_times, kind="stable")
+        self.off_order = np.argsort(self.off_times, kind="stable")
+
+        self.total = np.zeros_like(x, dtype=dtype)
+        self.total.flags.writeable = False
+        self.reset()
+
+    def reset(self):
+        """Rewinds the schedule to before the first event."""
+        self._on_pointer = 0
+        self._off_pointer = 0
+        self._t = -np.inf
+        self.active = []
+        self._rebuild()
+
+    def __call__(self, t):
+        """
+        Returns the summed input at time t. The returned array is shared and read-only.
+        :param t: Current time; calls are expected in non-decreasing order (going back rewinds the schedule).
+        """
+        if t < self._t:
+            self.reset()
+        self._t = t
+
+        changed = False
+        while self._on_pointer < len(self.on_order) and self.on_times[self.on_order[self._on_pointer]] <= t:
+            self._on_pointer += 1
+            changed = True
+        while self._off_pointer < len(self.off_order) and self.off_times[self.off_order[self._off_pointer]] < t:
+            self._off_pointer += 1
+            changed = True
+
+        if changed:
+            started = set(self.on_order[:self._on_pointer].tolist())
+            ended = set(self.off_order[:self._off_pointer].tolist())
+            active = sorted(started - ended)
+            if active != self.active:
+                self.active = active
+                self._rebuild()
+        return self.total
+
+    def next_event_time(self):
+        """Time of the next on/off event after the current time, or None if the schedule is exhausted."""
+        candidates = []
+        if self._on_pointer < len(self.on_order):
+            candidates.append(self.on_times[self.on_order[self._on_pointer]])
+        if self._off_pointer < len(self.off_order):
+            candidates.append(self.off_times[self.off_order[self._off_pointer]])
+        return min(candidates) if candidates else None
+
+    def _rebuild(self):
+        # Summed in list order, like the per-step evaluation, so the result does not drift over many events
+        self.total.flags.writeable = True
+        self.total[:] = 0
+        for k in self.active:
+            lo, hi, values = self.profiles[k]
+            self.total[lo:hi] += values
+        self.total.flags.writeable = False
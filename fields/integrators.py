@@ -0,0 +1,223 @@
+import numpy as np
+
+from fields.stopping import StopReport, as_conditions, check_stop, finish_run
+
+
+# Fixed-step schemes of the per-step update u += gain * (-u + drive), selected per field:
+#   - "euler":       gain = dt, the original explicit Euler step,
+#   - "exponential": gain = 1 - exp(-dt), exact for the linear decay (tau = 1) with the drive held over the
+#                    step, so the relaxation towards the drive is stable for any dt.
+STEP_GAINS = {
+    "euler": lambda dt: dt,
+    "exponential": lambda dt: float(-np.expm1(-dt)),
+}
+
+
+def step_gain(integrator, dt):
+    """Returns the gain of the fixed-step update u += gain * (-u + drive) for an integrator name."""
+    if integrator not in STEP_GAINS:
+        raise ValueError(f"Unknown integrator '{integrator}', expected one of {sorted(STEP_GAINS)}.")
+    return STEP_GAINS[integrator](dt)
+
+
+class ExponentialIntegrator:
+    """
+    Second-order exponential time differencing (ETD2RK) for a whole network, with optional adaptive steps.
+
+    The decay term -u is integrated exactly and the drive (lateral interaction, external and internal inputs,
+    h_u) is interpolated linearly over the step from an exponential Euler predictor. The difference between the
+    predictor and the corrector estimates the local error: steps grow during plateaus, where the drive is
+    constant and the relaxation is exact, and shrink where the thresholded output switches.
+
+    The run reproduces the discrete events of simultaneous_integration on the fields' time grid: external
+    inputs change at grid times, delayed inputs fire at grid times (steps are cut at both), and Action Onset
+    crossings are dated to the grid step in which they happen: a step in which a monitored position crosses
+    the threshold is located on the dense output and retaken up to the end of the grid step of the crossing.
+    All fields are updated simultaneously from the same state. Histories are resampled to the output grid:
+    row i holds the state at t[i] + dt, like the state after step i of the fixed-step integration,
+    interpolated with the dense output of the scheme.
+    """
+
+    def __init__(self, adaptive=True, rtol=1e-2, atol=1e-2, dt_min=None, dt_max=None, safety=0.9):
+        """
+        :param adaptive: If False, take fixed steps of the grid dt (second-order fixed-step scheme).
+        :param rtol: Relative tolerance of the local error.
+        :param atol: Absolute tolerance of the local error.
+        :param dt_min: Smallest step; steps of this size are accepted whatever their error
+                       (defaults to dt / 10 of the grid).
+        :param dt_max: Largest step (defaults to no limit besides the input and feedback events).
+        :param safety: Safety factor of the step size controller.
+        """
+        if rtol <= 0 or atol <= 0:
+            raise ValueError("rtol and atol must be positive.")
+        self.adaptive = adaptive
+        self.rtol = rtol
+        self.atol = atol
+        self.dt_min = dt_min
+        self.dt_max = dt_max
+        self.safety = safety
+        self.stats = {"accepted": 0, "rejected": 0, "evaluations": 0}
+
+    def run(self, engine, input_centers=None, stop=None):
+        """
+        Integrates the fields of a BatchedEngine over their time grid, or until a stop condition is met.
+        Statistics of the run (accepted and rejected steps, drive evaluations) are kept in self.stats.
+        :param engine: BatchedEngine holding the stacked state of the network.
+        :param input_centers: Positions monitored in the Action Onset fields.
+        :param stop: Optional stop condition or list of conditions (see fields.stopping), checked after
+                     every accepted step with the time of the step.
+        :return: StopReport of the run.
+        """
+        conditions = as_conditions(stop)
+        dt = engine.dt
+        n_steps = len(engine.t)
+        t_end = n_steps * dt
+        dt_min = dt / 10 if self.dt_min is None else self.dt_min
+        dt_max = np.inf if self.dt_max is None else self.dt_max
+        eps = 1e-9 * dt
+
+        u, h_u = engine.u, engine.h_u
+        rate_active = engine.h_rate_active / dt  # h_u growth per unit time
+        rate_const = engine.h_rate_const / dt
+        external_input = np.zeros_like(u)
+        drive = np.zeros_like(u)
+        drive_predicted = np.zeros_like(u)
+        self.stats = {"accepted": 0, "rejected": 0, "evaluations": 0}
+
+        tau = 0.0  # Current time of the state
+        row = 0  # Next output row (state at t[row] + dt)
+        h = dt
+        while row < n_steps:
+            k = min(int(np.floor(tau / dt + 1e-9)), n_steps - 1)  # Grid step containing tau
+            for field in engine.fields:
+                field.handle_feedback_events(k)
+            for r, field in enumerate(engine.fields):
+                external_input[r] = field.get_external_input(field.time_at(k))
+
+            # Cut the step at the next grid time where an input switches or a delayed input fires
+            stop = min(self._next_event_step(engine, k) * dt, t_end)
+            h = min(h if self.adaptive else dt, dt_max, stop - tau)
+            if stop - tau - h < eps:
+                h = stop - tau
+
+            engine.drive(u, h_u, external_input, drive)
+            f = engine.f.copy()
+            self.stats["evaluations"] += 1
+            while True:
+                g1 = -np.expm1(-h)
+                predicted = u + g1 * (drive - u)
+                h_predicted = h_u + h * (rate_active * f + rate_const)
+                engine.drive(predicted, h_predicted, external_input, drive_predicted)
+                f_predicted = engine.f
+                self.stats["evaluations"] += 1
+                slope = (drive_predicted - drive) / h
+                corrected = predicted + (h - g1) * slope
+
+                error = 0.0
+                if self.adaptive:
+                    scale = self.atol + self.rtol * np.maximum(np.abs(u), np.abs(corrected))
+                    error = np.sqrt(np.mean(((corrected - predicted) / scale) ** 2))
+                    if error > 1.0 and h > dt_min:
+                        h = max(dt_min, h * max(0.2, self.safety * error ** -0.5))
+                        self.stats["rejected"] += 1
+                        continue
+
+                # A crossing is only detected at the end of the step: end the step with the grid step of the
+                # crossing, so it is not dated to a later grid step
+                if input_centers is not None:
+                    cut = self._crossing_step(engine, input_centers, tau, h, u, drive, slope, corrected)
+                    if cut is not None and cut < h - eps:
+                        h = cut
+                        continue
+                break
+
+            self._record(engine, tau, h, u, drive, slope, n_steps, row)
+            row = min(n_steps, int(np.floor((tau + h + eps) / dt)))
+
+            h_u += 0.5 * h * (rate_active * (f + f_predicted) + 2 * rate_const)
+            u[...] = corrected
+            tau = tau + h
+            if abs(tau - round(tau / dt) * dt) < eps:
+                tau = round(tau / dt) * dt
+            self.stats["accepted"] += 1
+
+            # Crossings are dated to the grid step in which they happen, as in the fixed-step integration
+            if input_centers is not None:
+                i = min(max(int(np.ceil(tau / dt - 1e-9)) - 1, 0), n_steps - 1)
+                for n, action_onset_field in enumerate(engine.action_onset_fields):
+                    if action_onset_field:
+                        crossings = action_onset_field.monitor_action_onset(input_centers, i)
+                        if crossings:
+                            for field in engine.feedback_fields[n]:
+                                field.handle_feedback_events(i, crossings)
+
+            if conditions:
+                report = check_stop(conditions, max(row - 1, 0), tau, engine.fields)
+                if report is not None:
+                    return finish_run(engine.fields, report)
+
+            if self.adaptive:
+                h = h * (5.0 if error == 0 else min(5.0, self.safety * error ** -0.5))
+
+        return StopReport("completed", n_steps - 1, engine.fields[0].time_at(n_steps - 1))
+
+    @staticmethod
+    def _next_event_step(engine, k):
+        # Earliest grid step after k at which an external input may switch or a delayed input is due
+        steps = [len(engine.t)]
+        for field in engine.fields:
+            event_time = field.input_schedule.next_event_time()
+            if event_time is not None:
+                steps.append(int(np.ceil(event_time / engine.dt - 1e-9)))
+            due = field.delayed_inputs.next_due_step()
+            if due is not None:
+                steps.append(due)
+        return max(min(steps), k + 1)
+
+    @staticmethod
+    def _crossing_step(engine, input_centers, tau, h, u, drive, slope, corrected):
+        # Length of the step up to the end of the grid step in which a monitored position of an Action Onset
+        # field first crosses the threshold, located by bisection on the dense output (None without crossing)
+        dt = engine.dt
+        crossing = None
+        for field in engine.action_onset_fields:
+            if field is None:
+                continue
+            row = engine.fields.index(field)
+            monitor = field.get_monitor(input_centers)
+            indices = monitor.indices[(corrected[row, monitor.indices] >= monitor.theta) & ~monitor.above
+                                      & ~monitor.fired_up]
+            if len(indices) == 0:
+                continue
+            u0, du, rate = u[row, indices], drive[row, indices] - u[row, indices], slope[row, indices]
+            low, high = 0.0, h
+            for _ in range(50):
+                s = 0.5 * (low + high)
+                g1 = -np.expm1(-s)
+                if (u0 + g1 * du + (s - g1) * rate >= monitor.theta).any():
+                    high = s
+                else:
+                    low = s
+            crossing = high if crossing is None else min(crossing, high)
+        if crossing is None:
+            return None
+        end = max(np.ceil((tau + crossing) / dt - 1e-9), np.floor(tau / dt + 1e-9) + 1) * dt
+        return end - tau
+
+    @staticmethod
+    def _record(engine, tau, h, u, drive, slope, n_steps, row):
+        # Dense output of the step: exact decay towards a drive varying linearly over the step
+        internal_input = np.zeros_like(u)
+        recorders = [field.recorder for field in engine.fields if field.recorder.enabled]
+        inputs = any(recorder.inputs for recorder in recorders)
+        while row < n_steps and (row + 1) * engine.dt <= tau + h + 1e-9 * engine.dt:
+            if any(row % recorder.every == 0 for recorder in recorders):
+                s = (row + 1) * engine.dt - tau
+                g1 = -np.expm1(-s)
+                state = u + g1 * (drive - u) + (s - g1) * slope
+                if inputs:
+                    engine.couple(state, internal_input)
+                for r, field in enumerate(engine.fields):
+                    time = field.time_at(row)
+                    field.recorder.record(row, time, state[r], field.get_external_input(time), internal_input[r])
+            row += 1
@@ -0,0 +1,97 @@
+import hashlib
+import os
+from collections import OrderedDict
+
+import numpy as np
+
+
+class KernelCache:
+    """
+    Process-wide cache of sampled kernels and kernel spectra, shared by all fields and convolution backends.
+
+    Entries are keyed by what they are computed from (kernel function and parameters, grid, dtype, transform)
+    and returned read-only, so fields with the same kernel on the same grid share one array. The least
+    recently used entries are dropped once the cache holds more than max_bytes (arrays still referenced by
+    fields stay alive). With a root directory, entries are also written as .npy files and memory-mapped
+    read-only by later processes.
+    """
+
+    def __init__(self, max_bytes=256 * 2 ** 20, root=None):
+        """
+        :param max_bytes: Largest total size of the cached arrays held in memory (0 disables the cache).
+        :param root: Directory of the on-disk layer (None to keep the cache in memory only).
+        """
+        self.max_bytes = max_bytes
+        self.root = root
+        self._entries = OrderedDict()
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, compute):
+        """
+        Returns the cached array for a key, calling compute() to build it on a miss.
+        :param key: Tuple of the values the array is computed from (str, int, float, bool, None and tuples).
+        :param compute: Callable returning the array.
+        :return: Read-only array, shared with every other caller of the same key.
+        """
+        data = self._entries.get(key)
+        if data is not None:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return data
+
+        self.misses += 1
+        path = None if self.root is None else os.path.join(self.root, _digest(repr(key)) + ".npy")
+        if path is not None and os.path.exists(path):
+            data = np.load(path, mmap_mode="r")
+        else:
+            data = np.asarray(compute())
+            data.flags.writeable = False
+            if path is not None:
+                os.makedirs(self.root, exist_ok=True)
+                tmp_path = path[:-len(".npy")] + f".{os.getpid()}.tmp.npy"
+                np.save(tmp_path, data)
+                os.replace(tmp_path, path)
+
+        if data.nbytes <= self.max_bytes:
+            self._entries[key] = data
+            self.nbytes += data.nbytes
+            while self.nbytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.nbytes -= evicted.nbytes
+        return data
+
+    def kernel(self, function, x, pars, dtype=np.float64):
+        """Returns function(x, *pars) as a read-only array of the given dtype."""
+        key = ("kernel", function.__module__, function.__qualname__, tuple(pars), grid_key(x), np.dtype(dtype).str)
+        return self.get(key, lambda: function(x, *pars).astype(dtype))
+
+    def clear(self):
+        """Drops all entries held in memory (the on-disk layer is kept)."""
+        self._entries.clear()
+        self.nbytes = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+
+def grid_key(x):
+    """Identifies a uniform grid by its first point, last point and size."""
+    return float(x[0]), float(x[-1]), len(x)
+
+
+def array_key(a):
+    """Identifies an array by its shape, dtype and a hash of its contents."""
+    a = np.ascontiguousarray(a)
+    return a.shape, a.dtype.str, _digest(a.data)
+
+
+def _digest(data):
+    if isinstance(data, str):
+        data = data.encode()
+    return hashlib.sha1(data).hexdigest()
+
+
+# Cache shared by all fields of the process; replace or configure it (e.g. set root) before building fields
+shared_cache = KernelCache()
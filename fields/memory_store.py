@@ -0,0 +1,171 @@
+import glob
+import hashlib
+import json
+import os
+import time
+
+import numpy as np
+
+
+_code_version = None
+
+
+def code_version():
+    """Hash of the sources of the fields package: memories learned with other code are not reused."""
+    global _code_version
+    if _code_version is None:
+        digest = hashlib.sha256()
+        for path in sorted(glob.glob(os.path.join(os.path.dirname(os.path.abspath(__file__)), "*.py"))):
+            with open(path, "rb") as f:
+                digest.update(os.path.basename(path).encode())
+                digest.update(f.read())
+        _code_version = digest.hexdigest()[:16]
+    return _code_version
+
+
+def learning_scenario(field, **extra):
+    """
+    Describes everything a learned memory depends on: the field's kernel, grids, inputs, adaptation and
+    numerics, the code version, and any extra settings of the learning run. A stop condition has to be given
+    with all its parameters (e.g. stop=repr(condition)), since memories of runs stopped early differ from the
+    memory of the complete run.
+    """
+    scenario = {
+        "field_type": field.field_type,
+        "kernel_pars": list(field.kernel_pars),
+        "field_pars": list(field.field_pars),
+        "external_inputs": [list(pars) for pars in field.external_input_pars_list],
+        "tau_h": field.tau_h,
+        "h_0": field.h_0,
+        "theta": field.theta,
+        "integrator": field.integrator,
+        "convolution": [field.convolution.kind, sorted(field.convolution.options.items())],
+        "dtype": field.dtype.name,
+        "code_version": code_version(),
+    }
+    scenario.update(extra)
+    return scenario
+
+
+def scenario_key(scenario):
+    """Content address of a learning scenario."""
+    encoded = json.dumps(scenario, sort_keys=True, default=repr)
+    return hashlib.sha256(encoded.encode()).hexdigest()
+
+
+class MemoryStore:
+    """
+    Content-addressed store of learned sequence memories.
+
+    Each memory is saved once as <key>.npy, where the key is the hash of its learning scenario, and listed in
+    an index file (index.json) with its scenario, size and last use. Learning runs can be skipped when their
+    scenario is already stored, and the least recently used memories are evicted when the store grows past
+    its limits. Loaded memories are cached per process and returned read-only, so all fields using a memory
+    share one array.
+    """
+
+    _loaded = {}  # (root, key) -> read-only array, shared within the process
+
+    def __init__(self, root=os.path.join("data", "memories"), max_entries=None, max_bytes=None):
+        """
+        :param root: Directory of the store.
+        :param max_entries: Largest number of stored memories (None for no limit).
+        :param max_bytes: Largest total size of the stored memories (None for no limit).
+        """
+        self.root = root
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.index_path = os.path.join(root, "index.json")
+
+    def key(self, field, **extra):
+        """Returns the key of the memory learned by a field (see learning_scenario)."""
+        return scenario_key(learning_scenario(field, **extra))
+
+    def __contains__(self, key):
+        return key in self._read_index()
+
+    def get(self, key):
+        """
+        Returns the stored memory for a key (read-only and shared), or None if it is not stored.
+        Marks the memory as the most recently used one.
+        """
+        index = self._read_index()
+        if key not in index:
+            return None
+        data = self._load(key, index[key])
+        index[key]["last_used"] = time.time()
+        self._write_index(index)
+        return data
+
+    def put(self, key, data, scenario=None):
+        """
+        Stores a memory under its key. A memory that is already stored is not written again.
+        :param key: Key of the learning scenario.
+        :param data: Learned memory (e.g. the final state of the sequence memory field).
+        :param scenario: Description of the scenario kept in the index for reference.
+        :return: Path of the stored file.
+        """
+        os.makedirs(self.root, exist_ok=True)
+        index = self._read_index()
+        path = os.path.join(self.root, f"{key}.npy")
+        if key not in index or not os.path.exists(path):
+            tmp_path = os.path.join(self.root, f"{key}.tmp.npy")
+            np.save(tmp_path, np.asarray(data))
+            os.replace(tmp_path, path)
+            index[key] = {"file": f"{key}.npy", "bytes": os.path.getsize(path), "created": time.time(),
+                          "scenario": scenario}
+        index[key]["last_used"] = time.time()
+        self._evict(index, keep=key)
+        self._write_index(index)
+        return path
+
+    def latest(self):
+        """Returns the most recently used memory, or None if the store is empty."""
+        index = self._read_index()
+        if not index:
+            return None
+        key = max(index, key=lambda k: index[k]["last_used"])
+        return self._load(key, index[key])
+
+    def nbytes(self):
+        """Total size of the stored memories on disk."""
+        return sum(entry["bytes"] for entry in self._read_index().values())
+
+    def _load(self, key, entry):
+        cache_key = (os.path.abspath(self.root), key)
+        if cache_key not in self._loaded:
+            data = np.load(os.path.join(self.root, entry["file"]))
+            if data.ndim == 1:
+                data = data.reshape(1, -1)
+            data.flags.writeable = False
+            self._loaded[cache_key] = data
+            print(f"Loaded sequence memory {key[:12]} from {self.root}")
+        return self._loaded[cache_key]
+
+    def _evict(self, index, keep):
+        # Least recently used first, never the memory that was just stored
+        order = sorted((k for k in index if k != keep), key=lambda k: index[k]["last_used"])
+        total = sum(entry["bytes"] for entry in index.values())
+        while order and ((self.max_entries is not None and len(index) > self.max_entries) or
+                         (self.max_bytes is not None and total > self.max_bytes)):
+            key = order.pop(0)
+            entry = index.pop(key)
+            total -= entry["bytes"]
+            try:
+                os.remove(os.path.join(self.root, entry["file"]))
+            except FileNotFoundError:
+                pass
+            self._loaded.pop((os.path.abspath(self.root), key), None)
+
+    def _read_index(self):
+        if not os.path.exists(self.index_path):
+            return {}
+        with open(self.index_path) as f:
+            return json.load(f)
+
+    def _write_index(self, index):
+        os.makedirs(self.root, exist_ok=True)
+        tmp_path = self.index_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(index, f, indent=1, default=repr)
+        os.replace(tmp_path, self.index_path)
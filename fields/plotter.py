@@ -1,8 +1,10 @@
+import os
+
 import numpy as np
 import matplotlib.pyplot as plt
 import matplotlib.animation as animation
 import time
-from fields.utils import load_external_input_params
+from fields.utils import load_external_input_params, nearest_indices
 
 
 class Plotter:
@@ -18,7 +20,7 @@ class Plotter:
             axes = [axes]
 
         for i, field in enumerate(self.fields):
-            axes[i].plot(field.x, field.activity[-1, :])  # Assuming 'activity' has the final state
+            axes[i].plot(field.x, field.final_state())  # Final state is kept whatever the recording policy
             axes[i].set_xlim(-field.x_lim, field.x_lim)
             axes[i].set_xlabel('x')
             axes[i].set_ylabel('Activity')
@@ -28,6 +30,10 @@ class Plotter:
         plt.show()
 
     def animate_activity(self, field_pars, interval=10, input_flag=False, plot_inputs=False):
+        for field in self.fields:
+            if len(field.activity) == 0 or len(field.recorder.x) != len(field.x):
+                raise ValueError(f"Field '{field.name}' has no full-field history recorded to animate.")
+
         num_fields = len(self.fields)
         fig, axes = plt.subplots(1, num_fields, figsize=(6 * num_fields, 4))  # Side-by-side layout
 
@@ -51,17 +57,19 @@ class Plotter:
         if plot_inputs:
             input_lines = []
             for i, field in enumerate(self.fields):
-                if np.any(field.history_external_input) or np.any(field.history_internal_input):
+                if field.recorder.inputs and (np.any(field.history_external_input) or
+                                              np.any(field.history_internal_input)):
                     ext_line, = axes[i].plot(field.x, field.history_external_input[0, :], label='External Input',
                                              linestyle='--')
                     int_line, = axes[i].plot(field.x, field.history_internal_input[0, :], label='Internal Input',
                                              linestyle=':')
                     input_lines.append((ext_line, int_line))
 
-        for t in range(0, len(self.fields[0].t), interval):
+        # Iterate over recorded rows; with a decimated recording each row already spans several time steps
+        for t in range(0, len(self.fields[0].activity), interval):
             for i, field in enumerate(self.fields):
                 lines[i].set_ydata(field.activity[t, :])
-                axes[i].set_title(f"{field.name} - Time Step: {t}")
+                axes[i].set_title(f"{field.name} - Time Step: {field.recorder.steps[t]}")
 
                 if plot_inputs:
                     ext_line, int_line = input_lines[i]
@@ -73,6 +81,19 @@ class Plotter:
 
         plt.show()
 
+    def save_animation(self, path, fps=25, interval=10, plot_inputs=False):
+        """
+        Renders the activity offscreen (no display needed) into a video or GIF file, or into a directory of
+        PNG frames for a path without extension, keeping every interval-th recorded row (see fields.renderer).
+        :return: Number of frames written.
+        """
+        from fields.renderer import ActivityRenderer
+
+        renderer = ActivityRenderer(self.fields, plot_inputs=plot_inputs)
+        if os.path.splitext(path)[1]:
+            return renderer.save_video(path, fps=fps, every=interval)
+        return len(renderer.save_frames(path, every=interval))
+
     def plot_activity_at_input_centers(self, input_centers, interval=10):
         """Plots the evolution of fields' activities at specified input centers over time, including theta lines."""
         num_fields = len(self.fields)
@@ -86,11 +107,12 @@ class Plotter:
 
         # Plot activity at each input center for each field
         for i, field in enumerate(self.fields):
-            # Find the closest indices for each input center
-            closest_indices = [np.abs(field.x - center).argmin() for center in input_centers]
+            # Find the closest recorded indices for each input center
+            recorded_x = field.recorder.x
+            closest_indices = nearest_indices(recorded_x, input_centers)
 
             for idx in closest_indices:
-                axes[i].plot(field.t, field.activity[:, idx], label=f'Activity at x={field.x[idx]:.2f}')
+                axes[i].plot(field.recorder.t, field.activity[:, idx], label=f'Activity at x={recorded_x[idx]:.2f}')
 
             # Add a horizontal line for theta
             axes[i].axhline(y=field.theta, color='r', linestyle='--', label=f'Theta = {field.theta:.2f}')
@@ -0,0 +1,96 @@
+import time
+from collections import namedtuple
+
+import numpy as np
+
+from fields.sweep import run_sweep, crossing_times
+
+
+# Result of validate_precision. Crossing times are given per monitored position (NaN where a run never
+# crossed); state drifts, bump drifts (inf when the number of bumps differs) and the number of sites whose
+# thresholded output differs are given per field name.
+PrecisionReport = namedtuple("PrecisionReport", [
+    "dtype", "crossing_times", "reference_crossing_times", "crossing_drift", "missing_crossings",
+    "state_drift", "bump_drift", "output_mismatch", "seconds", "reference_seconds", "passed",
+])
+
+
+def bump_centers(x, u, theta):
+    """
+    Returns the centers of the regions where u is at or above theta (bumps). Unlike local maxima, these do
+    not depend on round-off ripples on top of a saturated bump.
+    """
+    above = np.concatenate(([False], u >= theta, [False]))
+    edges = np.flatnonzero(np.diff(above.astype(np.int8)))
+    return np.array([(x[start] + x[stop - 1]) / 2 for start, stop in zip(edges[::2], edges[1::2])])
+
+
+def validate_precision(build_network, input_centers, dtype=np.float32, params=None, stop=None,
+                       time_tolerance=None, bump_tolerance=None):
+    """
+    Runs a network once in float64 and once in a reduced precision and reports how far the results drift:
+    the Action Onset crossing times, the final states and the bump positions of every field.
+    :param build_network: Callable taking dtype and the params as keyword arguments and returning the
+                          connected list of fields (e.g. model_adaptation.create_recall_network).
+    :param input_centers: Positions monitored in the Action Onset field.
+    :param dtype: Precision to validate, e.g. np.float32.
+    :param params: Further keyword arguments of build_network.
+    :param stop: Optional callable returning fresh stop conditions for a run (see fields.run_sweep).
+    :param time_tolerance: Largest accepted crossing time drift (defaults to one time step).
+    :param bump_tolerance: Largest accepted drift of a bump center (defaults to one grid step).
+    :return: PrecisionReport; passed is True when no crossing or bump is missing or added and all crossing
+             times and bump centers are within the tolerances.
+    """
+    params = dict(params or {})
+    built = []
+
+    def build(**kw):
+        built.append(build_network(**kw))
+        return built[-1]
+
+    def run(run_dtype):
+        start = time.perf_counter()
+        summary = run_sweep(build, [dict(params, dtype=run_dtype)], input_centers, stop=stop)[0]
+        return summary, time.perf_counter() - start
+
+    reference, reference_seconds = run(np.float64)
+    reduced, seconds = run(dtype)
+
+    reference_times = crossing_times(reference, input_centers)
+    times = crossing_times(reduced, input_centers)
+    missing = int(np.sum(np.isnan(reference_times) != np.isnan(times)))
+    both = ~np.isnan(reference_times) & ~np.isnan(times)
+    crossing_drift = float(np.abs(times[both] - reference_times[both]).max()) if both.any() else 0.0
+
+    state_drift, bump_drift, output_mismatch = {}, {}, {}
+    for field in built[0]:
+        state = reference.final_states[field.name]
+        other = reduced.final_states[field.name].astype(float)
+        state_drift[field.name] = float(np.abs(other - state).max())
+        output_mismatch[field.name] = int(np.sum((other >= field.theta) != (state >= field.theta)))
+        centers = bump_centers(field.x, state, field.theta)
+        other_centers = bump_centers(field.x, other, field.theta)
+        if len(other_centers) != len(centers):
+            bump_drift[field.name] = np.inf
+        else:
+            bump_drift[field.name] = float(np.abs(other_centers - centers).max()) if len(centers) else 0.0
+
+    # Default tolerances: one step of the grids of the network
+    time_tolerance = built[0][0].dt if time_tolerance is None else time_tolerance
+    bump_tolerance = built[0][0].dx if bump_tolerance is None else bump_tolerance
+    passed = (missing == 0 and crossing_drift <= time_tolerance and
+              all(drift <= bump_tolerance for drift in bump_drift.values()))
+
+    return PrecisionReport(
+        dtype=np.dtype(dtype).name,
+        crossing_times=times,
+        reference_crossing_times=reference_times,
+        crossing_drift=crossing_drift,
+        missing_crossings=missing,
+        state_drift=state_drift,
+        bump_drift=bump_drift,
+        output_mismatch=output_mismatch,
+        seconds=seconds,
+        reference_seconds=reference_seconds,
+        passed=passed,
+    )
@@ -0,0 +1,185 @@
+import numpy as np
+
+
+class HistoryRecorder:
+    """
+    Records the state and inputs of a field during integration according to a recording policy.
+
+    The policy is a combination of:
+      - every: keep only every Nth time step (1 keeps all steps),
+      - last: keep only the last K recorded steps in a ring buffer (None keeps all),
+      - positions: keep only the grid points closest to these x positions (None keeps the whole field),
+      - inputs: also record the external and internal inputs,
+      - enabled: record nothing at all when False.
+
+    Recorded data is exposed in chronological order through u, external_input and internal_input,
+    with the matching time steps in steps/t and the recorded grid points in x.
+    """
+
+    def __init__(self, every=1, last=None, positions=None, inputs=True, enabled=True):
+        if every < 1:
+            raise ValueError("every must be a positive number of steps.")
+        if last is not None and last < 1:
+            raise ValueError("last must be a positive number of steps.")
+        self.every = int(every)
+        self.last = None if last is None else int(last)
+        self.positions = None if positions is None else list(positions)
+        self.inputs = inputs
+        self.enabled = enabled
+
+    @classmethod
+    def full(cls):
+        """Records every step of the whole field."""
+        return cls()
+
+    @classmethod
+    def decimated(cls, every, inputs=True):
+        """Records every Nth step of the whole field."""
+        return cls(every=every, inputs=inputs)
+
+    @classmethod
+    def ring(cls, last, every=1, inputs=True):
+        """Records the last K (optionally decimated) steps of the whole field."""
+        return cls(every=every, last=last, inputs=inputs)
+
+    @classmethod
+    def at_positions(cls, positions, every=1, inputs=False):
+        """Records only the grid points closest to the given positions, e.g. the input centers."""
+        return cls(every=every, positions=positions, inputs=inputs)
+
+    @classmethod
+    def disabled(cls):
+        """Records nothing; only the current state of the field is kept."""
+        return cls(enabled=False)
+
+    def bind(self, x, t, dtype=np.float64):
+        """
+        Allocates the storage for a field with the given spatial and temporal grids.
+        :param x: Spatial grid of the field.
+        :param t: Time grid of the field, used to size the storage.
+        :param dtype: Floating point type of the recorded arrays.
+        """
+        if self.positions is None:
+            self.indices = None
+            self.x = x
+        else:
+            self.indices = np.array([np.abs(x - position).argmin() for position in self.positions], dtype=np.intp)
+            self.x = x[self.indices]
+
+        width = len(self.x) if self.enabled else 0
+        if not self.enabled:
+            capacity = 0
+        elif self.last is not None:
+            capacity = self.last
+        else:
+            capacity = (len(t) + self.every - 1) // self.every
+
+        self._u = np.zeros([capacity, width], dtype=dtype)
+        input_capacity = capacity if self.inputs else 0
+        self._external_input = np.zeros([input_capacity, width], dtype=dtype)
+        self._internal_input = np.zeros([input_capacity, width], dtype=dtype)
+        self._steps = np.zeros(capacity, dtype=np.int64)
+        self._t = np.zeros(capacity, dtype=dtype)
+        self.count = 0  # Number of rows recorded so far (including rows overwritten in the ring buffer)
+        return self
+
+    def record(self, i, t, u, external_input=None, internal_input=None):
+        """
+        Records one time step if the policy selects it.
+        :param i: Index of the time step.
+        :param t: Time of the step.
+        :param u: Field state after the step.
+        :param external_input: External input applied in the step.
+        :param internal_input: Internal input applied in the step.
+        """
+        if not self.enabled or i % self.every:
+            return
+
+        if self.last is not None:
+            row = self.count % self.last
+        else:
+            row = self.count
+            if row >= len(self._u):
+                self._grow()
+
+        if self.indices is None:
+            self._u[row] = u
+            if self.inputs:
+                self._external_input[row] = external_input
+                self._internal_input[row] = internal_input
+        else:
+            self._u[row] = u[self.indices]
+            if self.inputs:
+                self._external_input[row] = external_input[self.indices]
+                self._internal_input[row] = internal_input[self.indices]
+
+        self._steps[row] = i
+        self._t[row] = t
+        self.count += 1
+
+    def reset(self):
+        """Discards everything recorded so far."""
+        self.count = 0
+
+    def trim(self):
+        """Releases the storage beyond the recorded rows, e.g. after a run that stopped before the end of the grid."""
+        if self.last is not None or self.count >= len(self._u):
+            return
+        self._u = self._u[:self.count].copy()
+        if self.inputs:
+            self._external_input = self._external_input[:self.count].copy()
+            self._internal_input = self._internal_input[:self.count].copy()
+        self._steps = self._steps[:self.count].copy()
+        self._t = self._t[:self.count].copy()
+
+    def _grow(self):
+        # Only reached when a run goes past the time grid used to size the storage (e.g. streaming)
+        capacity = max(2 * len(self._u), 1)
+        self._u = _resized(self._u, capacity)
+        if self.inputs:
+            self._external_input = _resized(self._external_input, capacity)
+            self._internal_input = _resized(self._internal_input, capacity)
+        self._steps = _resized(self._steps, capacity)
+        self._t = _resized(self._t, capacity)
+
+    def _ordered(self, data):
+        if self.last is None or self.count <= self.last:
+            return data[:min(self.count, len(data))]
+        start = self.count % self.last
+        return np.concatenate([data[start:], data[:start]])
+
+    @property
+    def u(self):
+        """Recorded field states, shape (n_recorded, n_positions)."""
+        return self._ordered(self._u)
+
+    @property
+    def external_input(self):
+        """Recorded external inputs (empty unless inputs are recorded)."""
+        return self._ordered(self._external_input)
+
+    @property
+    def internal_input(self):
+        """Recorded internal inputs (empty unless inputs are recorded)."""
+        return self._ordered(self._internal_input)
+
+    @property
+    def steps(self):
+        """Time step indices of the recorded rows."""
+        return self._ordered(self._steps)
+
+    @property
+    def t(self):
+        """Times of the recorded rows."""
+        return self._ordered(self._t)
+
+    @property
+    def nbytes(self):
+        """Memory held by the recorded arrays."""
+        return sum(a.nbytes for a in (self._u, self._external_input, self._internal_input, self._steps, self._t))
+
+
+def _resized(data, capacity):
+    resized = np.zeros((capacity,) + data.shape[1:], dtype=data.dtype)
+    resized[:len(data)] = data
+    return resized
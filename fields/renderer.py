@@ -0,0 +1,208 @@
+import os
+import shutil
+import subprocess
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+
+
+class ActivityRenderer:
+    """
+    Offscreen (Agg) renderer of recorded field activity, without a display or pyplot.
+
+    The figure is drawn once with its axes, labels and titles, and that background is kept as a bitmap.
+    A frame only restores the background and draws the animated artists on it (the activity lines, the
+    optional input lines and a time label), which is blitting as done by interactive animations.
+    Frames are taken from the recorded history, optionally decimated, and written as PNG files, an
+    animated GIF (Pillow) or a video (ffmpeg, e.g. .mp4).
+
+    Works with Field objects and with the FieldTrace objects of a stored run (see fields.run_output).
+    """
+
+    def __init__(self, fields, plot_inputs=False, panel_size=(6, 4), dpi=80):
+        """
+        :param fields: Fields with a full-field history recorded.
+        :param plot_inputs: Also draw the recorded external and internal inputs.
+        :param panel_size: Size in inches of the panel of one field; panels are laid out side by side.
+        :param dpi: Resolution of the frames.
+        """
+        for field in fields:
+            if len(field.activity) == 0 or len(field.recorder.x) != len(field.x):
+                raise ValueError(f"Field '{field.name}' has no full-field history recorded to render.")
+        self.fields = fields
+        self.plot_inputs = plot_inputs
+        self.steps = np.asarray(fields[0].recorder.steps)
+        self.times = np.asarray(fields[0].recorder.t)
+
+        self.figure = Figure(figsize=(panel_size[0] * len(fields), panel_size[1]), dpi=dpi)
+        self.canvas = FigureCanvasAgg(self.figure)
+        axes = self.figure.subplots(1, len(fields), squeeze=False)[0]
+
+        self.artists = []
+        for ax, field in zip(axes, fields):
+            series = [field.activity]
+            if plot_inputs and field.recorder.inputs:
+                series += [field.history_external_input, field.history_internal_input]
+            low = min(float(values.min()) for values in series)
+            high = max(float(values.max()) for values in series)
+            ax.set_xlim(-field.x_lim, field.x_lim)
+            ax.set_ylim(low, high if high > low else low + 1.0)
+            ax.axhline(field.theta, color="r", linestyle="--", linewidth=0.8)
+            ax.set_xlabel('x')
+            ax.set_ylabel('Activity')
+            ax.set_title(field.name)
+
+            # Animated artists are left out of the background and drawn by each frame
+            lines = [(ax.plot(field.x, field.activity[0], label='Activity', animated=True)[0], field.activity)]
+            if len(series) > 1:
+                lines.append((ax.plot(field.x, series[1][0], linestyle='--', label='External Input',
+                                      animated=True)[0], series[1]))
+                lines.append((ax.plot(field.x, series[2][0], linestyle=':', label='Internal Input',
+                                      animated=True)[0], series[2]))
+            label = ax.text(0.02, 0.95, "", transform=ax.transAxes, va="top", animated=True)
+            self.artists.append((ax, lines, label))
+
+        self.figure.tight_layout()
+        self.canvas.draw()
+        self.background = self.canvas.copy_from_bbox(self.figure.bbox)
+
+    def __len__(self):
+        return len(self.steps)
+
+    @property
+    def frame_shape(self):
+        """Shape (height, width, 4) of the RGBA frames."""
+        width, height = self.canvas.get_width_height()
+        return height, width, 4
+
+    def render(self, row):
+        """
+        Renders the recorded row with the given index.
+        :return: RGBA frame as a (height, width, 4) uint8 array; it is overwritten by the next call.
+        """
+        self.canvas.restore_region(self.background)
+        for ax, lines, label in self.artists:
+            for line, history in lines:
+                line.set_ydata(history[row])
+                ax.draw_artist(line)
+            label.set_text(f"t = {self.times[row]:.2f} (step {self.steps[row]})")
+            ax.draw_artist(label)
+        self.canvas.blit(self.figure.bbox)
+        return np.asarray(self.canvas.buffer_rgba())
+
+    def rows(self, every=1, start=None, stop=None):
+        """
+        Indices of the recorded rows shown as frames.
+        :param every: Keep every Nth recorded row.
+        :param start: First time shown (defaults to the first recorded time).
+        :param stop: Last time shown (defaults to the last recorded time).
+        """
+        if every < 1:
+            raise ValueError("every must be a positive number of rows.")
+        first = 0 if start is None else int(np.searchsorted(self.times, start, side="left"))
+        last = len(self.times) if stop is None else int(np.searchsorted(self.times, stop, side="right"))
+        return range(first, last, every)
+
+    def frames(self, every=1, start=None, stop=None):
+        """Yields (row index, RGBA frame) for the selected rows (see rows and render)."""
+        for row in self.rows(every, start, stop):
+            yield row, self.render(row)
+
+    def save_frames(self, directory, every=1, start=None, stop=None):
+        """
+        Writes the selected frames as numbered PNG files.
+        :return: List of the written paths.
+        """
+        from matplotlib.image import imsave
+
+        os.makedirs(directory, exist_ok=True)
+        paths = []
+        for n, (_, frame) in enumerate(self.frames(every, start, stop)):
+            path = os.path.join(directory, f"frame_{n:06d}.png")
+            imsave(path, frame)
+            paths.append(path)
+        return paths
+
+    def save_video(self, path, fps=25, every=1, start=None, stop=None, ffmpeg_options=None):
+        """
+        Writes the selected frames as an animation at fps frames per second: an animated GIF for a .gif
+        path (needs Pillow), otherwise a video encoded by ffmpeg, whose format follows the file extension.
+        :param ffmpeg_options: Output options passed to ffmpeg (defaults to H.264 with the yuv420p pixel format).
+        :return: Number of frames written.
+        """
+        if path.lower().endswith(".gif"):
+            return self._save_gif(path, fps, every, start, stop)
+
+        ffmpeg = shutil.which("ffmpeg")
+        if ffmpeg is None:
+            raise RuntimeError("ffmpeg is required to write videos; write a .gif or PNG frames instead.")
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        height, width, _ = self.frame_shape
+        options = ffmpeg_options if ffmpeg_options is not None else \
+            ["-vcodec", "libx264", "-pix_fmt", "yuv420p", "-vf", "pad=ceil(iw/2)*2:ceil(ih/2)*2"]
+        command = [ffmpeg, "-y", "-loglevel", "error", "-f", "rawvideo", "-pix_fmt", "rgba",
+                   "-s", f"{width}x{height}", "-r", str(fps), "-i", "-"] + options + [path]
+        count = 0
+        with subprocess.Popen(command, stdin=subprocess.PIPE) as process:
+            for _, frame in self.frames(every, start, stop):
+                process.stdin.write(frame.tobytes())
+                count += 1
+            process.stdin.close()
+            if process.wait() != 0:
+                raise RuntimeError(f"ffmpeg failed to write {path}.")
+        return count
+
+    def _save_gif(self, path, fps, every, start, stop):
+        from PIL import Image
+
+        images = [Image.fromarray(frame.copy()).convert("RGB").quantize()
+                  for _, frame in self.frames(every, start, stop)]
+        if not images:
+            raise ValueError("No frames selected.")
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        images[0].save(path, save_all=True, append_images=images[1:], duration=1000 / fps, loop=0)
+        return len(images)
+
+
+def render_run(run_path, output, fps=25, every=1, plot_inputs=False, field_names=None):
+    """
+    Renders a run stored by RunWriter (see fields.run_output).
+    :param run_path: Directory of the stored run.
+    :param output: Video or GIF path, or a directory receiving PNG frames (a path without extension).
+    :param fps: Frames per second of a video.
+    :param every: Keep every Nth recorded row.
+    :param plot_inputs: Also draw the recorded inputs.
+    :param field_names: Fields to render (defaults to all fields of the run).
+    :return: Number of frames written.
+    """
+    from fields.run_output import load_run
+
+    run = load_run(run_path)
+    fields = run.fields if field_names is None else [run[name] for name in field_names]
+    renderer = ActivityRenderer(fields, plot_inputs=plot_inputs)
+    if os.path.splitext(output)[1]:
+        return renderer.save_video(output, fps=fps, every=every)
+    return len(renderer.save_frames(output, every=every))
+
+
+def render_runs(run_paths, output_dir, suffix=".mp4", fps=25, every=1, plot_inputs=False, processes=None):
+    """
+    Renders stored runs in parallel, one process per run at a time. Each run is written to
+    output_dir/<run directory name><suffix> (suffix "" writes PNG frame directories).
+    :param processes: Number of worker processes (defaults to the number of CPUs).
+    :return: Dictionary of output path -> number of frames, in the order of run_paths.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    outputs = [os.path.join(output_dir, os.path.basename(os.path.normpath(path)) + suffix) for path in run_paths]
+    if len(set(outputs)) != len(outputs):
+        raise ValueError("Runs must have distinct directory names.")
+
+    counts = {}
+    with ProcessPoolExecutor(max_workers=processes) as executor:
+        futures = {executor.submit(render_run, path, output, fps, every, plot_inputs): output
+                   for path, output in zip(run_paths, outputs)}
+        for future in as_completed(futures):
+            counts[futures[future]] = future.result()  # Propagate worker errors
+    return {output: counts[output] for output in outputs}
@@ -0,0 +1,418 @@
+import json
+import os
+import time
+
+import numpy as np
+
+from fields.recorder import HistoryRecorder
+
+
+# Recorded arrays of a field, each stored as a sequence of memmapped .npy chunks (<name>_<chunk>.npy)
+RECORDED_ARRAYS = ("u", "external_input", "internal_input", "steps", "t")
+
+FORMAT_VERSION = 1
+
+
+class ChunkedArray:
+    """
+    Read-only array whose rows are spread over memmapped chunk files. Indexing a range of rows only touches
+    the chunks holding them, so time windows of long runs can be read without loading the whole run.
+    np.asarray() gives the full array.
+    """
+
+    def __init__(self, chunks, rows):
+        """
+        :param chunks: Memmapped chunks, all with the same number of rows (the last one may be partly used).
+        :param rows: Number of valid rows.
+        """
+        self.chunks = chunks
+        self.rows = rows
+        self.chunk_rows = len(chunks[0]) if chunks else 1
+        tail = chunks[0].shape[1:] if chunks else ()
+        self.shape = (rows,) + tail
+        self.dtype = chunks[0].dtype if chunks else np.dtype(float)
+
+    @property
+    def ndim(self):
+        return len(self.shape)
+
+    def __len__(self):
+        return self.rows
+
+    def __getitem__(self, key):
+        key = key if isinstance(key, tuple) else (key,)
+        rows, rest = key[0], key[1:]
+        if isinstance(rows, (int, np.integer)):
+            row = rows + self.rows if rows < 0 else rows
+            if not 0 <= row < self.rows:
+                raise IndexError(f"Row {rows} out of range for {self.rows} rows.")
+            chunk, offset = divmod(row, self.chunk_rows)
+            return np.asarray(self.chunks[chunk][(offset,) + rest])
+        if isinstance(rows, slice):
+            start, stop, step = rows.indices(self.rows)
+            indices = np.arange(start, stop, step)
+        else:
+            indices = np.arange(self.rows)[rows]
+
+        # Gather the rows chunk by chunk, in the requested order
+        parts = []
+        chunk_of = indices // self.chunk_rows
+        bounds = np.flatnonzero(np.diff(chunk_of)) + 1
+        for group in np.split(indices, bounds):
+            if len(group):
+                chunk = self.chunks[group[0] // self.chunk_rows]
+                parts.append(np.asarray(chunk[(group % self.chunk_rows,) + rest]))
+        if not parts:
+            return np.asarray(self.chunks[0][(slice(0, 0),) + rest]) if self.chunks else np.zeros(0)
+        return np.concatenate(parts)
+
+    def __array__(self, dtype=None, copy=None):
+        data = self[:]
+        return data if dtype is None else data.astype(dtype)
+
+    def max(self):
+        return max(self._valid(chunk).max() for chunk in self._chunks_in_use())
+
+    def min(self):
+        return min(self._valid(chunk).min() for chunk in self._chunks_in_use())
+
+    def _chunks_in_use(self):
+        return range((self.rows + self.chunk_rows - 1) // self.chunk_rows)
+
+    def _valid(self, chunk):
+        return self.chunks[chunk][:min(self.chunk_rows, self.rows - chunk * self.chunk_rows)]
+
+
+class ChunkedRecorder(HistoryRecorder):
+    """
+    History recorder writing its rows straight into memmapped .npy chunk files of a directory while the run
+    goes on, so the recorded history is not limited by memory. New chunks are added when a run goes past the
+    time grid (e.g. a streaming session). Supports the every, positions, inputs and enabled policies; ring
+    buffers (last) are not supported.
+    """
+
+    def __init__(self, directory, every=1, positions=None, inputs=True, enabled=True, chunk_bytes=64 * 2 ** 20,
+                 on_chunk=None, mode="w+"):
+        """
+        :param directory: Directory receiving the chunk files.
+        :param chunk_bytes: Approximate size of a chunk of the state array.
+        :param on_chunk: Called after a chunk is completed (e.g. to update the run metadata).
+        :param mode: "w+" to record, "r" to read a recorded history (see ChunkedRecorder.open).
+        """
+        super().__init__(every=every, positions=positions, inputs=inputs, enabled=enabled)
+        self.directory = directory
+        self.chunk_bytes = chunk_bytes
+        self.on_chunk = on_chunk
+        self.mode = mode
+
+    @classmethod
+    def open(cls, directory, info):
+        """Opens a recorded field history read-only from its directory and its run metadata entry."""
+        recorder = cls(directory, every=info["every"], positions=info["positions"], inputs=info["inputs"],
+                       enabled=info["enabled"], mode="r")
+        recorder.indices = None if info["positions"] is None else np.asarray(info["indices"], dtype=np.intp)
+        recorder.grid = np.load(os.path.join(directory, "grid.npy"))
+        recorder.x = recorder.grid if recorder.indices is None else recorder.grid[recorder.indices]
+        recorder.dtype = np.dtype(info["dtype"])
+        recorder.chunk_rows = info["chunk_rows"]
+        recorder.count = info["rows"]
+        n_chunks = (recorder.count + recorder.chunk_rows - 1) // recorder.chunk_rows
+        recorder._chunks = {name: [np.load(recorder._chunk_path(name, k), mmap_mode="r") for k in range(n_chunks)]
+                            for name in recorder._names()}
+        return recorder
+
+    def bind(self, x, t, dtype=np.float64):
+        if self.last is not None:
+            raise ValueError("ChunkedRecorder does not support ring buffers (last).")
+        if self.positions is None:
+            self.indices = None
+            self.x = x
+        else:
+            self.indices = np.array([np.abs(x - position).argmin() for position in self.positions], dtype=np.intp)
+            self.x = x[self.indices]
+        self.dtype = np.dtype(dtype)
+
+        width = len(self.x)
+        arrays = 3 if self.inputs else 1
+        rows_per_chunk = max(1, self.chunk_bytes // max(1, width * self.dtype.itemsize * arrays))
+        self.chunk_rows = int(min(rows_per_chunk, max(1, (len(t) + self.every - 1) // self.every)))
+
+        # Only the full grid is stored; the recorded points follow from the indices kept in the run metadata
+        self.grid = x
+        os.makedirs(self.directory, exist_ok=True)
+        np.save(os.path.join(self.directory, "grid.npy"), self.grid)
+        self._chunks = {name: [] for name in self._names()}
+        self.count = 0
+        return self
+
+    def record(self, i, t, u, external_input=None, internal_input=None):
+        if not self.enabled or i % self.every:
+            return
+
+        chunk, row = divmod(self.count, self.chunk_rows)
+        if chunk == len(self._chunks["u"]):
+            self._add_chunk()
+        chunks = self._chunks
+
+        if self.indices is None:
+            chunks["u"][chunk][row] = u
+            if self.inputs:
+                chunks["external_input"][chunk][row] = external_input
+                chunks["internal_input"][chunk][row] = internal_input
+        else:
+            chunks["u"][chunk][row] = u[self.indices]
+            if self.inputs:
+                chunks["external_input"][chunk][row] = external_input[self.indices]
+                chunks["internal_input"][chunk][row] = internal_input[self.indices]
+
+        chunks["steps"][chunk][row] = i
+        chunks["t"][chunk][row] = t
+        self.count += 1
+
+    def reset(self):
+        self.count = 0
+
+    def trim(self):
+        # Unused rows of the last chunk stay on disk; the metadata records the number of valid rows
+        self.flush()
+
+    def flush(self):
+        """Writes the recorded rows to disk."""
+        for chunks in self._chunks.values():
+            for chunk in chunks:
+                if isinstance(chunk, np.memmap) and self.mode != "r":
+                    chunk.flush()
+
+    def _names(self):
+        return [name for name in RECORDED_ARRAYS
+                if self.inputs or name not in ("external_input", "internal_input")]
+
+    def _chunk_path(self, name, k):
+        return os.path.join(self.directory, f"{name}_{k:06d}.npy")
+
+    def _add_chunk(self):
+        if self._chunks["u"]:
+            self.flush()
+            if self.on_chunk is not None:
+                self.on_chunk()
+        k = len(self._chunks["u"])
+        width = len(self.x)
+        for name in self._names():
+            if name == "steps":
+                shape, dtype = (self.chunk_rows,), np.int64
+            elif name == "t":
+                shape, dtype = (self.chunk_rows,), self.dtype
+            else:
+                shape, dtype = (self.chunk_rows, width), self.dtype
+            self._chunks[name].append(np.lib.format.open_memmap(self._chunk_path(name, k), mode="w+",
+                                                                dtype=dtype, shape=shape))
+
+    def _array(self, name):
+        if name not in self._chunks:
+            return np.zeros((0, len(self.x)), dtype=self.dtype)
+        return ChunkedArray(self._chunks[name], self.count)
+
+    @property
+    def u(self):
+        return self._array("u")
+
+    @property
+    def external_input(self):
+        return self._array("external_input")
+
+    @property
+    def internal_input(self):
+        return self._array("internal_input")
+
+    @property
+    def steps(self):
+        return np.asarray(self._array("steps"))
+
+    @property
+    def t(self):
+        return np.asarray(self._array("t"))
+
+    @property
+    def nbytes(self):
+        return sum(chunk.nbytes for chunks in self._chunks.values() for chunk in chunks)
+
+
+def _field_key(field):
+    return field.name.lower().replace(" ", "_")
+
+
+class RunWriter:
+    """
+    Writes a run to a directory while it is integrated:
+
+        <run>/metadata.json              grids, parameters and recording policy of every field, rows written
+        <run>/<field>/grid.npy           spatial grid of the field
+        <run>/<field>/u_000000.npy, ...  memmapped chunks of the state, external and internal inputs,
+                                         time steps and times (see ChunkedRecorder)
+        <run>/<field>/final_state.npy    state of the whole field at the end of the run
+
+    The writer replaces the fields' recorders with ChunkedRecorders that keep their recording policy.
+    The metadata is rewritten whenever a chunk is completed and on close, so an interrupted run stays readable
+    up to its last completed chunk.
+    """
+
+    def __init__(self, path, fields, metadata=None, chunk_bytes=64 * 2 ** 20, dtype=None):
+        """
+        :param path: Directory of the run; it must not hold another run.
+        :param fields: Fields of the run, before integration.
+        :param metadata: JSON-serializable description of the run (e.g. the input centers).
+        :param chunk_bytes: Approximate size of a chunk of a field's state array.
+        :param dtype: Floating point type of the recorded arrays (defaults to the dtype of each field).
+        """
+        if os.path.exists(os.path.join(path, "metadata.json")):
+            raise ValueError(f"{path} already holds a run.")
+        keys = [_field_key(field) for field in fields]
+        if len(set(keys)) != len(keys):
+            raise ValueError("Fields of a run must have unique names.")
+
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self.fields = fields
+        self.metadata = metadata or {}
+        self.created = time.time()
+        self.complete = False
+        for key, field in zip(keys, fields):
+            policy = field.recorder
+            field.recorder = ChunkedRecorder(
+                os.path.join(path, key), every=policy.every, positions=policy.positions, inputs=policy.inputs,
+                enabled=policy.enabled, chunk_bytes=chunk_bytes, on_chunk=self.flush,
+            ).bind(field.x, field.t, field.dtype if dtype is None else dtype)
+        self.flush()
+
+    def flush(self):
+        """Writes the recorded rows and updates the metadata."""
+        fields = {}
+        for field in self.fields:
+            recorder = field.recorder
+            recorder.flush()
+            fields[field.name] = {
+                "directory": _field_key(field),
+                "field_pars": list(field.field_pars),
+                "kernel_pars": list(field.kernel_pars),
+                "external_inputs": [list(pars) for pars in field.external_input_pars_list],
+                "field_type": field.field_type,
+                "theta": field.theta,
+                "tau_h": field.tau_h,
+                "every": recorder.every,
+                "positions": recorder.positions,
+                "indices": None if recorder.indices is None else recorder.indices.tolist(),
+                "inputs": recorder.inputs,
+                "enabled": recorder.enabled,
+                "dtype": recorder.dtype.str,
+                "chunk_rows": recorder.chunk_rows,
+                "rows": recorder.count,
+            }
+        metadata = {"format_version": FORMAT_VERSION, "created": self.created, "complete": self.complete,
+                    "fields": fields, "metadata": self.metadata}
+        tmp_path = os.path.join(self.path, "metadata.json.tmp")
+        with open(tmp_path, "w") as f:
+            json.dump(metadata, f, indent=1, default=repr)
+        os.replace(tmp_path, os.path.join(self.path, "metadata.json"))
+
+    def close(self, complete=True):
+        """
+        Saves the final states and the metadata.
+        :param complete: Whether the run finished; False keeps it marked as incomplete (e.g. after an error).
+        """
+        for field in self.fields:
+            np.save(os.path.join(self.path, _field_key(field), "final_state.npy"), field.final_state())
+        self.complete = complete
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        # A run interrupted by an exception stays readable up to its last row but is not marked as complete
+        self.close(complete=exc_type is None)
+
+
+class FieldTrace:
+    """
+    Recorded history of one field of a run, read lazily from its memmapped chunks. Offers the attributes
+    used by Plotter (name, x, x_lim, theta, recorder, activity, history inputs, final_state), so a stored run
+    can be plotted like the fields that produced it.
+    """
+
+    def __init__(self, directory, name, info):
+        self.name = name
+        self.info = info
+        self.directory = directory
+        self.field_pars = tuple(info["field_pars"])
+        self.x_lim, self.t_lim, self.dx, self.dt = self.field_pars
+        self.theta = info["theta"]
+        self.field_type = info["field_type"]
+        self.recorder = ChunkedRecorder.open(directory, info)
+        self.x = self.recorder.grid
+
+    @property
+    def history_u(self):
+        return self.recorder.u
+
+    @property
+    def activity(self):
+        return self.recorder.u
+
+    @property
+    def history_external_input(self):
+        return self.recorder.external_input
+
+    @property
+    def history_internal_input(self):
+        return self.recorder.internal_input
+
+    def final_state(self):
+        """Final state of the whole field (the last recorded full-field row if the run was interrupted)."""
+        path = os.path.join(self.directory, "final_state.npy")
+        if os.path.exists(path):
+            return np.load(path)
+        if self.recorder.count and self.recorder.indices is None:
+            return self.recorder.u[-1]
+        raise ValueError(f"No final state stored for field '{self.name}'.")
+
+    def window(self, t_start, t_end):
+        """
+        Returns the recorded rows with t_start <= t <= t_end, reading only the chunks holding them.
+        :return: Tuple (t, u, external_input, internal_input) of the window (inputs are empty if not recorded).
+        """
+        t = self.recorder.t
+        rows = slice(np.searchsorted(t, t_start, side="left"), np.searchsorted(t, t_end, side="right"))
+        inputs = self.recorder.inputs
+        return (t[rows], self.recorder.u[rows], self.recorder.external_input[rows] if inputs else None,
+                self.recorder.internal_input[rows] if inputs else None)
+
+
+class RunData:
+    """A stored run opened for reading (see load_run)."""
+
+    def __init__(self, path):
+        with open(os.path.join(path, "metadata.json")) as f:
+            info = json.load(f)
+        if info.get("format_version") != FORMAT_VERSION:
+            raise ValueError(f"Unsupported run format version {info.get('format_version')} in {path}.")
+        self.path = path
+        self.complete = info["complete"]
+        self.metadata = info["metadata"]
+        self.fields = [FieldTrace(os.path.join(path, field_info["directory"]), name, field_info)
+                       for name, field_info in info["fields"].items()]
+
+    def __getitem__(self, name):
+        for field in self.fields:
+            if field.name == name:
+                return field
+        raise KeyError(name)
+
+
+def load_run(path):
+    """
+    Opens a run written by RunWriter. Arrays are memory-mapped, e.g.
+        run = load_run("runs/recall")
+        t, u, _, _ = run["Action Onset"].window(20.0, 40.0)
+        Plotter(run.fields).plot_activity_at_input_centers(run.metadata["input_centers"])
+    """
+    return RunData(path)
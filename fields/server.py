@@ -0,0 +1,428 @@
+import asyncio
+import itertools
+import json
+import logging
+import time
+from collections import namedtuple
+
+import numpy as np
+
+from fields.engine import BatchedEngine
+from fields.recorder import HistoryRecorder
+from fields.session import StreamingSession
+
+
+logger = logging.getLogger(__name__)
+
+# Counters of the tick loop: ticks run, ticks that overran the tick period, engines built, steps taken,
+# session steps deferred to meet their deadlines and ticks that failed with an exception
+ServerStats = namedtuple("ServerStats", ["ticks", "overruns", "engine_builds", "steps", "deferred", "errors"])
+
+
+class HostedSession(StreamingSession):
+    """
+    StreamingSession hosted by a SessionServer. It is not stepped on its own: on every server tick, the due
+    sessions with compatible networks are stepped together by one BatchedEngine.
+    """
+
+    def __init__(self, session_id, fields, input_centers=None, deadline=None, owner=None):
+        """
+        :param session_id: Identifier of the session on the server.
+        :param fields: Connected list of fields of the session's network.
+        :param input_centers: Positions monitored in the Action Onset field.
+        :param deadline: Largest accepted delay in seconds between the start of a tick and the end of the
+                         session's step in it (None for no deadline). A step expected to end later is deferred
+                         to the next tick.
+        :param owner: Connection that created the session; its events are sent there.
+        """
+        super().__init__(fields, input_centers)
+        self.id = session_id
+        self.network = fields
+        self.deadline = deadline
+        self.owner = owner
+        self.running = False  # Steps on every tick until paused
+        self.pending_steps = 0  # Steps still to take for advance requests
+        self.pending_replies = []  # (request id, step index after which the reply is sent)
+        self.missed_deadlines = 0
+        self.deferred_steps = 0
+        self.deferred = False  # Deferred in the last tick; stepped first in the next one
+        x = fields[0].x
+        self.group_key = (len(x), float(x[0]), fields[0].dx, fields[0].dt, len(fields[0].t), fields[0].dtype.str,
+                          None if input_centers is None else tuple(input_centers))
+
+    @property
+    def due(self):
+        return self.running or self.pending_steps > 0
+
+    def stats(self):
+        """Latency statistics of the session's steps and its numbers of missed deadlines and deferred steps."""
+        return dict(self.latency_stats(), step=self.i, missed_deadlines=self.missed_deadlines,
+                    deferred_steps=self.deferred_steps)
+
+
+class SessionServer:
+    """
+    asyncio service hosting many concurrent controller sessions in one process.
+
+    Each session runs its own network (e.g. the Action Onset / Working Memory / Human Feedback / Robot Feedback
+    network of model_adaptation), built by one of the server's named builders. A tick loop advances every due
+    session by one step per tick: sessions with compatible grids are stepped together by one BatchedEngine,
+    which is rebuilt only when the set of due sessions changes. Sessions of one process share their sampled
+    kernels and spectra (see fields.kernel_cache), so a session costs little more than its state arrays.
+
+    Clients talk to the server over a local TCP or Unix socket with newline-delimited JSON messages (see
+    SessionClient). Requests carry an "op" and an optional "id" echoed in the reply:
+      - create (network, params, input_centers, deadline): builds a session, replies with its id,
+      - start / pause (session): steps the session on every tick (real time) or stops doing so,
+      - advance (session, steps): takes a number of steps on the next ticks, replies when they are done,
+      - push_input (session, field, center, amplitude, width, duration, key) / release_input (session, key),
+      - stats (session), close (session).
+    Threshold events are streamed to the owner of the session as {"type": "event", ...} messages as soon
+    as the tick that detected them ends. Deadlines are enforced: a session whose step is expected (from the
+    last step of its group) to end after its deadline is not stepped late but deferred to the next tick,
+    where it is stepped first; this is reported as {"type": "deadline_deferred", ...}. A step that still ends
+    after the deadline is reported as {"type": "deadline_missed", ...}. Sessions are closed when their
+    connection closes. An exception in a tick is logged and the loop goes on with the next tick.
+    """
+
+    def __init__(self, builders, tick=0.01, max_sessions=None):
+        """
+        :param builders: Dictionary of network name -> callable taking keyword parameters and returning the
+                         connected list of fields of a session (e.g. model_adaptation.create_recall_network).
+        :param tick: Period of the tick loop in seconds.
+        :param max_sessions: Largest number of hosted sessions (None for no limit).
+        """
+        self.builders = builders
+        self.tick = tick
+        self.max_sessions = max_sessions
+        self.sessions = {}
+        self._ids = itertools.count(1)
+        self._engines = {}  # group key -> (session ids, engine)
+        self._step_times = {}  # group key -> duration of the group's last engine step
+        self._server = None
+        self._loop_task = None
+        self.ticks = 0
+        self.overruns = 0
+        self.engine_builds = 0
+        self.steps = 0
+        self.deferred = 0
+        self.errors = 0
+
+    @property
+    def stats(self):
+        return ServerStats(self.ticks, self.overruns, self.engine_builds, self.steps, self.deferred, self.errors)
+
+    async def start(self, host="127.0.0.1", port=0, path=None):
+        """
+        Starts listening and the tick loop.
+        :param host: Host of the TCP socket.
+        :param port: Port of the TCP socket (0 picks a free port, see address).
+        :param path: Path of a Unix socket to listen on instead of TCP.
+        """
+        if path is not None:
+            self._server = await asyncio.start_unix_server(self._serve, path=path)
+        else:
+            self._server = await asyncio.start_server(self._serve, host, port)
+        self._loop_task = asyncio.ensure_future(self._run())
+        return self
+
+    @property
+    def address(self):
+        """Address the server listens on: (host, port) for TCP or the socket path."""
+        return self._server.sockets[0].getsockname()
+
+    async def close(self):
+        """Stops the tick loop, closes the listening socket and all sessions."""
+        if self._loop_task is not None:
+            self._loop_task.cancel()
+            try:
+                await self._loop_task
+            except asyncio.CancelledError:
+                pass
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+        for session_id in list(self.sessions):
+            self.close_session(session_id)
+
+    def create_session(self, network, params=None, input_centers=None, deadline=None, owner=None):
+        """Builds a session (without history recording) and returns it; it is not stepped until started."""
+        if network not in self.builders:
+            raise ValueError(f"Unknown network '{network}', expected one of {sorted(self.builders)}.")
+        if self.max_sessions is not None and len(self.sessions) >= self.max_sessions:
+            raise ValueError(f"The server already hosts {self.max_sessions} sessions.")
+        fields = self.builders[network](**(params or {}))
+        for field in fields:
+            field.recorder = HistoryRecorder.disabled().bind(field.x, field.t, field.dtype)
+        session = HostedSession(next(self._ids), fields, input_centers, deadline, owner)
+        self.sessions[session.id] = session
+        return session
+
+    def close_session(self, session_id):
+        """Removes a session; engines stepping it are dropped."""
+        session = self.sessions.pop(session_id)
+        self._engines.pop(session.group_key, None)
+        self._step_times.pop(session.group_key, None)
+
+    def step_due_sessions(self, tick_start=None):
+        """
+        Advances every due session by one step, batching compatible sessions into one engine step.
+        A session whose step is expected to end after its deadline is deferred to the next tick instead, unless
+        it was already deferred in the last tick.
+        :param tick_start: time.perf_counter() value the deadlines are measured from (defaults to now).
+        :return: List of (session, events, ids of the advance requests finished, delay of the step end if it
+                 missed the session's deadline, else None, whether the step was deferred) in the order of the
+                 steps; deferred sessions have no events or finished requests.
+        """
+        tick_start = time.perf_counter() if tick_start is None else tick_start
+        groups = {}
+        for session in self.sessions.values():
+            if session.due:
+                groups.setdefault(session.group_key, []).append(session)
+
+        # Groups with deferred sessions first, then the groups with the tightest deadline
+        order = sorted(groups.items(), key=lambda item: (not any(s.deferred for s in item[1]),
+                                                         min(s.deadline if s.deadline is not None else np.inf
+                                                             for s in item[1])))
+        results = []
+        for key, sessions in order:
+            # Expected end of the step from the last step of the group; sessions already deferred once are
+            # stepped anyway, so every session keeps advancing
+            expected_end = time.perf_counter() - tick_start + self._step_times.get(key, 0.0)
+            deferred = [session for session in sessions if not session.deferred and session.deadline is not None
+                        and expected_end > session.deadline]
+            for session in deferred:
+                session.deferred = True
+                session.deferred_steps += 1
+                results.append((session, [], [], None, True))
+            self.deferred += len(deferred)
+            sessions = [session for session in sessions if session not in deferred]
+            if not sessions:
+                continue
+
+            engine = self._engine(key, sessions)
+            for session in sessions:
+                session.release_due_inputs()
+            start = time.perf_counter()
+            crossings = engine.step([session.i for session in sessions], sessions[0].input_centers)
+            end = time.perf_counter()
+            self._step_times[key] = end - start
+            latency = (end - start) / len(sessions)
+            for session, session_crossings in zip(sessions, crossings):
+                session.deferred = False
+                events = session.finish_step(session_crossings, latency)
+                if session.pending_steps:
+                    session.pending_steps -= 1
+                replies = [request_id for request_id, step in session.pending_replies if step <= session.i]
+                session.pending_replies = [(request_id, step) for request_id, step in session.pending_replies
+                                           if step > session.i]
+                late = None
+                if session.deadline is not None and end - tick_start > session.deadline:
+                    late = end - tick_start
+                    session.missed_deadlines += 1
+                results.append((session, events, replies, late, False))
+            self.steps += len(sessions)
+        return results
+
+    def _engine(self, key, sessions):
+        # The fields of a session belong to one engine at a time, so the engine of a group is rebuilt (from
+        # the fields' current state) whenever the set of due sessions of the group changes
+        ids = [session.id for session in sessions]
+        cached = self._engines.get(key)
+        if cached is None or cached[0] != ids:
+            cached = (ids, BatchedEngine(networks=[session.network for session in sessions]))
+            self._engines[key] = cached
+            self.engine_builds += 1
+        return cached[1]
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        next_tick = loop.time()
+        while True:
+            try:
+                self._tick()
+            except Exception:
+                # A failing tick must not end the loop serving all other sessions
+                self.errors += 1
+                logger.exception("Session server tick %d failed", self.ticks)
+            self.ticks += 1
+
+            # Missed ticks are skipped instead of being caught up
+            next_tick += self.tick
+            now = loop.time()
+            if now > next_tick:
+                self.overruns += 1
+                next_tick = now
+            await asyncio.sleep(next_tick - now)
+
+    def _tick(self):
+        # Steps the due sessions and sends their events, deadline notices and advance replies
+        for session, events, replies, late, deferred in self.step_due_sessions(time.perf_counter()):
+            owner = session.owner
+            if owner is None:
+                continue
+            if deferred:
+                owner.send({"type": "deadline_deferred", "session": session.id, "step": session.i,
+                            "deadline": session.deadline})
+                continue
+            for event in events:
+                owner.send(dict(event._asdict(), type="event", session=session.id))
+            if late is not None:
+                owner.send({"type": "deadline_missed", "session": session.id, "step": session.i - 1,
+                            "latency": late, "deadline": session.deadline})
+            for request_id in replies:
+                owner.send({"type": "advanced", "id": request_id, "session": session.id, "step": session.i})
+
+    async def _serve(self, reader, writer):
+        connection = _Connection(writer)
+        owned = []
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    request = json.loads(line)
+                except ValueError:
+                    connection.send({"type": "error", "message": "Malformed message."})
+                    continue
+                reply = self._handle(request, connection, owned)
+                if reply is not None:
+                    if "id" in request:
+                        reply["id"] = request["id"]
+                    connection.send(reply)
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            for session_id in owned:
+                if session_id in self.sessions:
+                    self.close_session(session_id)
+            writer.close()
+
+    def _handle(self, request, connection, owned):
+        op = request.get("op")
+        try:
+            if op == "create":
+                session = self.create_session(request["network"], request.get("params"),
+                                              request.get("input_centers"), request.get("deadline"), connection)
+                owned.append(session.id)
+                return {"type": "created", "session": session.id, "dt": session.dt}
+
+            session = self.sessions.get(request.get("session"))
+            if session is None or session.owner is not connection:
+                raise ValueError(f"Unknown session {request.get('session')!r}.")
+            if request.get("field") is not None and request["field"] not in session.fields:
+                raise ValueError(f"Session {session.id} has no field {request['field']!r}, "
+                                 f"expected one of {sorted(session.fields)}.")
+            if op == "start":
+                session.running = True
+            elif op == "pause":
+                session.running = False
+            elif op == "advance":
+                steps = int(request.get("steps", 1))
+                if steps < 1:
+                    raise ValueError("steps must be a positive number of steps.")
+                session.pending_steps += steps
+                session.pending_replies.append((request.get("id"), session.i + session.pending_steps))
+                return None  # Replied when the steps are done
+            elif op == "push_input":
+                key = session.push_input(request["field"], request["center"], request["amplitude"],
+                                         request["width"], request.get("duration"), request.get("key"))
+                return {"type": "ok", "session": session.id, "key": key}
+            elif op == "release_input":
+                session.release_input(request["key"], request.get("field"))
+            elif op == "stats":
+                return {"type": "stats", "session": session.id, "stats": session.stats()}
+            elif op == "close":
+                self.close_session(session.id)
+                owned.remove(session.id)
+                return {"type": "closed", "session": session.id}
+            else:
+                raise ValueError(f"Unknown op {op!r}.")
+            return {"type": "ok", "session": session.id}
+        except (KeyError, ValueError, TypeError) as error:
+            return {"type": "error", "message": str(error)}
+
+
+class _Connection:
+    """Writes newline-delimited JSON messages to a client."""
+
+    def __init__(self, writer):
+        self.writer = writer
+
+    def send(self, message):
+        if not self.writer.is_closing():
+            self.writer.write(json.dumps(message, default=_json_default).encode() + b"\n")
+
+
+class SessionClient:
+    """
+    Minimal client of a SessionServer, e.g. a stand-in for a robot controller in tests:
+        client = await SessionClient.connect(port=server.address[1])
+        session = (await client.request("create", network="recall", input_centers=[0.0, 30.0, -40.0]))["session"]
+        await client.request("advance", session=session, steps=200)
+        events = client.drain_events()
+    """
+
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+        self.events = asyncio.Queue()  # Events and deadline notices streamed by the server
+        self._ids = itertools.count(1)
+        self._waiting = {}
+        self._reader_task = asyncio.ensure_future(self._read())
+
+    @classmethod
+    async def connect(cls, host="127.0.0.1", port=None, path=None):
+        """Connects to a server over TCP (host, port) or a Unix socket (path)."""
+        if path is not None:
+            reader, writer = await asyncio.open_unix_connection(path)
+        else:
+            reader, writer = await asyncio.open_connection(host, port)
+        return cls(reader, writer)
+
+    async def request(self, op, **fields):
+        """Sends a request and waits for its reply."""
+        request_id = next(self._ids)
+        future = asyncio.get_running_loop().create_future()
+        self._waiting[request_id] = future
+        self.writer.write(json.dumps(dict(fields, op=op, id=request_id), default=_json_default).encode() + b"\n")
+        await self.writer.drain()
+        reply = await future
+        if reply["type"] == "error":
+            raise ValueError(reply["message"])
+        return reply
+
+    def drain_events(self):
+        """Returns the streamed messages received so far."""
+        events = []
+        while not self.events.empty():
+            events.append(self.events.get_nowait())
+        return events
+
+    async def close(self):
+        self.writer.close()
+        self._reader_task.cancel()
+        try:
+            await self._reader_task
+        except asyncio.CancelledError:
+            pass
+
+    async def _read(self):
+        while True:
+            line = await self.reader.readline()
+            if not line:
+                break
+            message = json.loads(line)
+            future = self._waiting.pop(message.get("id"), None)
+            if future is not None:
+                future.set_result(message)
+            else:
+                self.events.put_nowait(message)
+
+
+def _json_default(value):
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError(f"Cannot send {type(value).__name__}.")
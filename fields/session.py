@@ -0,0 +1,165 @@
+import time
+from collections import deque
+
+import numpy as np
+
+from fields.checkpoint import Checkpoint
+from fields.engine import BatchedEngine
+from fields.events import ThresholdEvent
+
+
+class StreamingSession:
+    """
+    Runs a network step by step for closed-loop use, e.g. driving the Action Onset / Robot Feedback loop
+    from a live robot at a fixed control rate.
+
+    Unlike simultaneous_integration, a session is not bound to the precomputed time grid: it advances one
+    dt per call (or as many steps as fit before a wall-clock deadline), accepts sensor-driven inputs pushed
+    between steps and reports threshold crossings as soon as they happen. Fields keep recording according
+    to their history policy, so long sessions should use a ring buffer or no history.
+    """
+
+    def __init__(self, fields, input_centers=None, latency_window=1000):
+        """
+        :param fields: List of Field objects forming the network.
+        :param input_centers: Positions monitored in the Action Onset field.
+        :param latency_window: Number of recent step latencies kept for latency_stats.
+        """
+        self._engine = None
+        self.fields = {field.name: field for field in fields}
+        self.input_centers = input_centers
+        self.dt = fields[0].dt
+        self.i = 0  # Index of the next step
+        self.latencies = deque(maxlen=latency_window)
+        self._input_count = 0
+        self._timed_inputs = {}  # key -> (field name, step at which the input is released)
+
+    @property
+    def engine(self):
+        """BatchedEngine stepping the network, built on the first step (hosted sessions share one, see
+        fields.server)."""
+        if self._engine is None:
+            self._engine = BatchedEngine(list(self.fields.values()))
+        return self._engine
+
+    @property
+    def time(self):
+        """Simulated time reached by the session."""
+        return self.i * self.dt
+
+    def push_input(self, field_name, center, amplitude, width, duration=None, key=None):
+        """
+        Pushes a Gaussian input into a field; it applies from the next step on.
+        :param field_name: Name of the field receiving the input.
+        :param center: Center of the Gaussian input.
+        :param amplitude: Amplitude of the Gaussian input.
+        :param width: Width of the Gaussian input.
+        :param duration: Simulated time after which the input is released automatically (None keeps it on).
+        :param key: Identifier of the input; pushing an existing key replaces that input.
+        :return: The key needed to release the input.
+        """
+        if key is None:
+            key = f"input_{self._input_count}"
+            self._input_count += 1
+
+        self.fields[field_name].push_input(key, center, amplitude, width)
+        if duration is not None:
+            self._timed_inputs[key] = (field_name, self.i + int(round(duration / self.dt)))
+        return key
+
+    def release_input(self, key, field_name=None):
+        """
+        Releases a pushed input.
+        :param key: Key returned by push_input.
+        :param field_name: Field holding the input; all fields are searched if not given.
+        """
+        self._timed_inputs.pop(key, None)
+        fields = [self.fields[field_name]] if field_name is not None else self.fields.values()
+        for field in fields:
+            field.release_input(key)
+
+    def step(self):
+        """
+        Advances the network by one dt.
+        :return: List of ThresholdEvent detected in this step.
+        """
+        start = time.perf_counter()
+        self.release_due_inputs()
+        threshold_crossings = self.engine.step(self.i, self.input_centers)[0]
+        return self.finish_step(threshold_crossings, time.perf_counter() - start)
+
+    def release_due_inputs(self):
+        """Releases the timed inputs that expire at the next step; called before the step is taken."""
+        for key, (field_name, release_step) in list(self._timed_inputs.items()):
+            if release_step <= self.i:
+                self.release_input(key, field_name)
+
+    def finish_step(self, threshold_crossings, latency):
+        """
+        Completes a step taken by an engine: turns its threshold crossings into events and advances the index.
+        :param threshold_crossings: List of (position, time) crossings of the Action Onset field, or None.
+        :param latency: Wall-clock duration of the step in seconds.
+        :return: List of ThresholdEvent.
+        """
+        events = [ThresholdEvent("Action Onset", position, crossing_time, self.i, "up")
+                  for position, crossing_time in threshold_crossings or []]
+        self.i += 1
+        self.latencies.append(latency)
+        return events
+
+    def stream(self, n_steps=None, deadline=None):
+        """
+        Advances the network and yields threshold events as they happen.
+        Stops after n_steps, or when the next step would not finish before the deadline.
+        :param n_steps: Maximum number of steps to take (None for no limit).
+        :param deadline: Wall-clock deadline as a time.perf_counter() value (None for no limit).
+        """
+        if n_steps is None and deadline is None:
+            raise ValueError("stream needs n_steps or a deadline.")
+
+        taken = 0
+        while n_steps is None or taken < n_steps:
+            if deadline is not None:
+                expected = np.mean(self.latencies) if self.latencies else 0.0
+                if time.perf_counter() + expected > deadline:
+                    return
+            yield from self.step()
+            taken += 1
+
+    def advance(self, n_steps=1, deadline=None):
+        """
+        Advances the network by n_steps (or until the deadline) and returns all events at once.
+        :param n_steps: Maximum number of steps to take (None for no limit, then a deadline is required).
+        :param deadline: Wall-clock deadline as a time.perf_counter() value.
+        :return: List of ThresholdEvent detected while advancing.
+        """
+        return list(self.stream(n_steps, deadline))
+
+    def checkpoint(self):
+        """Captures the state of the session (network state, step, timed inputs) as a Checkpoint."""
+        extra = {"input_count": self._input_count,
+                 "timed_inputs": {key: list(value) for key, value in self._timed_inputs.items()}}
+        return Checkpoint.capture(list(self.fields.values()), self.i - 1, engine=self._engine, extra=extra)
+
+    def restore(self, checkpoint):
+        """Continues the session from a checkpoint captured by a session over a network built the same way."""
+        self.i = checkpoint.restore(list(self.fields.values()))
+        if checkpoint.meta["engine"] is not None:
+            checkpoint.restore_engine(self.engine)
+        extra = checkpoint.meta["extra"] or {}
+        self._input_count = extra.get("input_count", 0)
+        self._timed_inputs = {key: tuple(value) for key, value in extra.get("timed_inputs", {}).items()}
+
+    def latency_stats(self):
+        """Returns step latency statistics (in seconds) over the recent window."""
+        if not self.latencies:
+            return {"count": 0}
+        latencies = np.array(self.latencies)
+        return {
+            "count": len(latencies),
+            "last": latencies[-1],
+            "mean": latencies.mean(),
+            "p50": np.percentile(latencies, 50),
+            "p99": np.percentile(latencies, 99),
+            "max": latencies.max(),
+        }
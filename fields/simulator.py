@@ -1,26 +1,104 @@
-def simultaneous_integration(fields, input_centers):
+import time
+
+from fields import profiling
+from fields.checkpoint import Checkpoint
+from fields.engine import BatchedEngine
+from fields.stopping import StopReport, as_conditions, check_stop, finish_run
+
+
+def simultaneous_integration(fields, input_centers, batched=False, integrator=None, stop=None, resume_from=None,
+                             checkpoint_every=None, on_checkpoint=None, active_set=None):
     """
     Integrates multiple fields over time and monitors action_onset at input_centers.
     :param fields: List of Field objects
     :param input_centers: Positions (x values) to monitor in the action_onset field
+    :param batched: If True, step all fields together as one stacked array (see BatchedEngine)
+    :param integrator: Optional network integrator, e.g. fields.integrators.ExponentialIntegrator() for
+                       adaptive steps; the fields' histories are resampled to their time grid.
+    :param stop: Optional stop condition or list of conditions (see fields.stopping), checked after every
+                 step; when one is met the run ends there and the histories are trimmed.
+    :param resume_from: Optional Checkpoint restored into the fields before continuing from the step after it.
+                        The same checkpoint can be resumed in several networks (what-if forks).
+    :param checkpoint_every: Capture a Checkpoint every N steps and pass it to on_checkpoint.
+    :param on_checkpoint: Callable receiving the checkpoints, e.g. lambda c: c.save(f"run_{c.step}.npz").
+    :param active_set: Optional fields.active_set.ActiveSet, which skips the steps of quiescent fields (below
+                       threshold with constant inputs) and advances them in closed form instead.
+    :return: StopReport with the reason ("completed" if the whole time grid was integrated), step and time.
     """
+    if checkpoint_every and on_checkpoint is None:
+        raise ValueError("checkpoint_every needs an on_checkpoint callable receiving the checkpoints.")
+    if active_set is not None and (batched or integrator is not None):
+        raise ValueError("Active-set scheduling is only supported by the per-field fixed-step integration.")
+
+    if integrator is not None:
+        if resume_from is not None or checkpoint_every:
+            raise ValueError("Checkpoints are only supported by the fixed-step integration.")
+        return integrator.run(BatchedEngine(fields), input_centers, stop)
+
+    start = resume_from.restore(fields) if resume_from is not None else 0
+
+    if batched:
+        engine = BatchedEngine(fields)
+        if resume_from is not None:
+            resume_from.restore_engine(engine)
+        return engine.run(input_centers, stop, start, checkpoint_every, on_checkpoint)
+
+    conditions = as_conditions(stop)
+
     num_time_steps = len(fields[0].t)
 
-    # Find the fields
+    # Find the fields; fields with delayed inputs (e.g. Robot Feedback) react to the Action Onset crossings
     action_onset_field = next((field for field in fields if field.name == "Action Onset"), None)
-    robot_feedback_field = next((field for field in fields if field.name == "Robot Feedback"), None)
+    feedback_fields = [field for field in fields if field.delayed_inputs.connections]
+
+    # Fields are stepped through the active set if given, which skips the steps of sleeping fields
+    if active_set is not None:
+        active_set.start(fields, start)
+        integrate = active_set.integrate
+    else:
+        integrate = _integrate
+
+    profiler = profiling.active  # Step latencies are recorded when profiling is on
+    for i in range(start, num_time_steps):
+        if profiler is not None:
+            step_start = time.perf_counter()
 
-    for i in range(num_time_steps):
         # Step 1: Integrate all fields
         for field in fields:
-            if field.name != "Robot Feedback":
-                field.integrate_single_step(i)  # Regular integration for other fields
+            if not field.delayed_inputs.connections:
+                integrate(field, i)  # Regular integration for other fields
 
         # Step 2: After each integration step, monitor the action_onset field
         threshold_crossings = None
         if action_onset_field and input_centers is not None:
             threshold_crossings = action_onset_field.monitor_action_onset(input_centers, i)
 
-        # Step 3: Pass threshold_crossings to Human feedback field and integrate it
-        if robot_feedback_field:
-            robot_feedback_field.integrate_single_step(i, threshold_crossings)
+        # Step 3: Pass threshold_crossings to the feedback fields and integrate them
+        for field in feedback_fields:
+            integrate(field, i, threshold_crossings)
+
+        if profiler is not None:
+            profiler.record_step(time.perf_counter() - step_start)
+
+        if checkpoint_every and (i + 1) % checkpoint_every == 0:
+            if active_set is not None:
+                active_set.wake_all(i)
+            on_checkpoint(Checkpoint.capture(fields, i))
+
+        # Step 4: End the run early if a stop condition is met
+        if conditions:
+            if active_set is not None:
+                active_set.synchronize(i)
+            report = check_stop(conditions, i, fields[0].time_at(i), fields)
+            if report is not None:
+                if active_set is not None:
+                    active_set.wake_all(i)
+                return finish_run(fields, report)
+
+    if active_set is not None:
+        active_set.wake_all(num_time_steps - 1)
+    return StopReport("completed", num_time_steps - 1, fields[0].time_at(num_time_steps - 1))
+
+
+def _integrate(field, i, threshold_crossings=None):
+    field.integrate_single_step(i, threshold_crossings)
@@ -0,0 +1,162 @@
+from collections import namedtuple
+
+import numpy as np
+
+
+# Outcome of a run: why it stopped ("completed" when it reached the end of the time grid), at which step and time
+StopReport = namedtuple("StopReport", ["reason", "step", "time"])
+
+
+class Settled:
+    """
+    Stops a run once the fields have settled: their state changes by less than tolerance per unit time
+    for a number of consecutive checks, and no external input will switch on or off and no delayed input
+    is pending anymore.
+
+    With h_u adaptation (e.g. a sequence memory) the state of active regions keeps growing with h_u at rate
+    1/tau_h after their pattern has settled. This drift is ignored by default: the states are compared
+    relative to h_u (u - h_u). Use output=True to only wait for the thresholded output (the bump pattern).
+    A run stopped early ends with less adaptation than a complete run, so e.g. a sequence memory learned with
+    a stop condition differs from the one of the full learning run (by up to a few units in the active
+    regions); such memories are stored under their own key (see fields.memory_store.learning_scenario).
+    """
+    reason = "settled"
+
+    def __init__(self, tolerance=1e-3, steps=50, output=False, field_names=None, include_h_u=False):
+        """
+        :param tolerance: Largest change of the state per unit time still considered settled.
+        :param steps: Number of consecutive settled checks required.
+        :param output: Compare the thresholded outputs instead of the states.
+        :param field_names: Fields that have to settle (defaults to all fields of the run).
+        :param include_h_u: Compare the states themselves, so the growth of h_u counts as a change.
+        """
+        if steps < 1:
+            raise ValueError("steps must be a positive number of checks.")
+        self.tolerance = tolerance
+        self.steps = steps
+        self.output = output
+        self.field_names = field_names
+        self.include_h_u = include_h_u
+        self.reset()
+
+    def __repr__(self):
+        return (f"Settled(tolerance={self.tolerance!r}, steps={self.steps!r}, output={self.output!r}, "
+                f"field_names={self.field_names!r}, include_h_u={self.include_h_u!r})")
+
+    def reset(self):
+        self.previous = None
+        self.previous_time = None
+        self.count = 0
+
+    def __call__(self, i, time, fields):
+        watched = [field for field in fields if self.field_names is None or field.name in self.field_names]
+        if self.output:
+            current = [field.u_field >= field.theta for field in watched]
+        elif self.include_h_u:
+            current = [field.u_field.copy() for field in watched]
+        else:
+            current = [field.u_field - field.h_u for field in watched]
+
+        if self.previous is None or time <= self.previous_time:
+            settled = False
+        elif self.output:
+            settled = all(np.array_equal(a, b) for a, b in zip(current, self.previous))
+        else:
+            rate = max(np.abs(a - b).max() for a, b in zip(current, self.previous)) / (time - self.previous_time)
+            settled = rate < self.tolerance
+        self.previous, self.previous_time = current, time
+
+        # Inputs still to come would wake the fields up again
+        if settled and any(field.input_schedule.next_event_time() is not None or field.delayed_inputs.pending
+                           for field in fields):
+            settled = False
+
+        self.count = self.count + 1 if settled else 0
+        return self.reason if self.count >= self.steps else None
+
+
+class EventsFired:
+    """
+    Stops a run once every monitored position of a field has crossed the threshold (e.g. all action onsets
+    of a recall) and the delayed inputs they triggered (e.g. robot feedback) have been applied.
+    """
+    reason = "events_fired"
+
+    def __init__(self, field_name="Action Onset", wait_for_feedback=True):
+        """
+        :param field_name: Name of the monitored field.
+        :param wait_for_feedback: Also wait until no delayed input is pending in any field.
+        """
+        self.field_name = field_name
+        self.wait_for_feedback = wait_for_feedback
+
+    def __repr__(self):
+        return f"EventsFired(field_name={self.field_name!r}, wait_for_feedback={self.wait_for_feedback!r})"
+
+    def reset(self):
+        pass
+
+    def __call__(self, i, time, fields):
+        field = next((field for field in fields if field.name == self.field_name), None)
+        if field is None:
+            return None
+        monitors = [monitor for monitor in field.monitors.values() if monitor.positions is not None]
+        if not monitors or not all(monitor.fired_up.all() for monitor in monitors):
+            return None
+        if self.wait_for_feedback and any(other.delayed_inputs.pending for other in fields):
+            return None
+        return self.reason
+
+
+class Predicate:
+    """Stops a run when a user function returns True; it is called as function(i, time, fields)."""
+
+    def __init__(self, function, reason="predicate"):
+        self.function = function
+        self.reason = reason
+
+    def __repr__(self):
+        name = getattr(self.function, "__qualname__", None)
+        if name is not None:
+            name = f"{getattr(self.function, '__module__', None)}.{name}"
+        return f"Predicate({name if name is not None else self.function!r}, reason={self.reason!r})"
+
+    def reset(self):
+        pass
+
+    def __call__(self, i, time, fields):
+        return self.reason if self.function(i, time, fields) else None
+
+
+def check_stop(conditions, i, time, fields):
+    """
+    Evaluates stop conditions after a step.
+    :param conditions: List of stop conditions (callables returning a reason or None).
+    :param i: Index of the step just taken.
+    :param time: Time of the step.
+    :param fields: Fields of the run.
+    :return: StopReport of the first condition that is met, or None.
+    """
+    for condition in conditions:
+        reason = condition(i, time, fields)
+        if reason is not None:
+            return StopReport(reason, i, time)
+    return None
+
+
+def as_conditions(stop):
+    """Normalizes a stop argument (None, a condition or a list of conditions) into a list of reset conditions."""
+    if stop is None:
+        return []
+    conditions = list(stop) if isinstance(stop, (list, tuple)) else [stop]
+    for condition in conditions:
+        condition.reset()
+    return conditions
+
+
+def finish_run(fields, report):
+    """Releases the history storage left unused by a run that stopped early."""
+    if report.reason != "completed":
+        for field in fields:
+            field.recorder.trim()
+    return report
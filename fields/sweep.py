@@ -0,0 +1,245 @@
+import importlib
+import itertools
+import json
+import os
+import shutil
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+from fields.engine import BatchedEngine
+from fields.recorder import HistoryRecorder
+from fields.run_output import RunWriter, load_run
+from fields.stopping import StopReport, as_conditions, check_stop
+
+
+# Compact result of one sweep trial
+TrialSummary = namedtuple("TrialSummary", ["params", "crossings", "final_states", "peaks", "stop"],
+                          defaults=[None])
+
+
+def parameter_grid(**axes):
+    """
+    Builds the cartesian product of parameter values.
+    Example: parameter_grid(tau_h=[10, 20], theta=[0.8, 1.0]) gives four parameter sets.
+    :return: List of dictionaries, one per parameter set.
+    """
+    names = list(axes)
+    return [dict(zip(names, values)) for values in itertools.product(*(axes[name] for name in names))]
+
+
+def find_peaks(x, u, theta):
+    """Returns the positions of the local maxima of u that are at or above theta (bump centers)."""
+    interior = (u[1:-1] >= theta) & (u[1:-1] > u[:-2]) & (u[1:-1] >= u[2:])
+    return x[1:-1][interior]
+
+
+def run_sweep(build_network, parameter_sets, input_centers=None, batch_size=64, record_history=False,
+              stop=None):
+    """
+    Runs one trial per parameter set, stepping the trials of a batch together as independent networks
+    of one BatchedEngine, so all their fields share one batched FFT per step.
+    :param build_network: Callable taking the parameters of a trial as keyword arguments and returning
+                          the connected list of Field objects of that trial (e.g. a wrapper around
+                          model_adaptation.create_recall_network). All trials must share the same grids.
+    :param parameter_sets: List of parameter dictionaries (e.g. from parameter_grid).
+    :param input_centers: Positions monitored in the Action Onset fields.
+    :param batch_size: Number of trials stepped together; bounds the memory of a sweep.
+    :param record_history: If False, the fields of a trial record no history, only summaries are kept.
+    :param stop: Optional callable returning fresh stop conditions for one trial (see fields.stopping).
+                 A trial is summarized at the step its condition is met, and a batch ends as soon as all its
+                 trials have stopped.
+    :return: List of TrialSummary, in the order of parameter_sets.
+    """
+    summaries = []
+    for start in range(0, len(parameter_sets), batch_size):
+        batch = parameter_sets[start:start + batch_size]
+        networks = [build_network(**params) for params in batch]
+        if not record_history:
+            for network in networks:
+                for field in network:
+                    field.recorder = HistoryRecorder.disabled().bind(field.x, field.t, field.dtype)
+
+        engine = BatchedEngine(networks=networks)
+        conditions = [as_conditions(stop() if stop is not None else None) for _ in networks]
+        crossings = [[] for _ in networks]
+        results = [None] * len(networks)
+        for i in range(len(engine.t)):
+            for n, network_crossings in enumerate(engine.step(i, input_centers)):
+                if network_crossings and results[n] is None:
+                    crossings[n].extend(network_crossings)
+
+            # Trials that stop are summarized now; the batch keeps stepping them until all have stopped
+            for n, network in enumerate(networks):
+                if results[n] is None and conditions[n]:
+                    report = check_stop(conditions[n], i, engine.t[i], network)
+                    if report is not None:
+                        results[n] = _summarize(batch[n], network, crossings[n], report)
+            if all(result is not None for result in results):
+                break
+
+        last = StopReport("completed", len(engine.t) - 1, engine.t[-1])
+        summaries.extend(result if result is not None else _summarize(params, network, network_crossings, last)
+                         for result, params, network, network_crossings in zip(results, batch, networks, crossings))
+    return summaries
+
+
+def _summarize(params, network, crossings, report):
+    return TrialSummary(
+        params=params,
+        crossings=crossings,
+        final_states={field.name: field.final_state() for field in network},
+        peaks={field.name: find_peaks(field.x, field.u_field, field.theta) for field in network},
+        stop=report,
+    )
+
+
+def crossing_times(summary, positions):
+    """
+    Returns the first crossing time at each of the given positions for a trial (NaN if it never crossed).
+    :param summary: TrialSummary of the trial.
+    :param positions: Positions to look up, e.g. the input centers.
+    """
+    times = np.full(len(positions), np.nan)
+    for position, time in summary.crossings:
+        k = int(np.abs(np.asarray(positions) - position).argmin())
+        if np.isnan(times[k]):
+            times[k] = time
+    return times
+
+
+def run_network_scenario(spec, directory=None):
+    """
+    Scenario runner for run_parallel_sweep that builds a network from a builder function, integrates it
+    with the batched engine and returns its summary arrays.
+    :param spec: Dictionary with "builder" ("module:function" returning the connected list of fields, e.g.
+                 "model_adaptation:create_recall_network"), optional "params" passed to the builder,
+                 optional "input_centers" and optional "record_history" (store every field's history_u).
+    :param directory: Output directory of the scenario, given by run_parallel_sweep. Histories are then
+                      recorded straight into the memmapped chunks of a run stored in <directory>/run (see
+                      fields.run_output.RunWriter) instead of being built in memory.
+    :return: Dictionary of arrays: crossings (n, 2) of (position, time), and per field final_<name> and,
+             if histories are requested without a directory, history_<name>.
+    """
+    module_name, function_name = spec["builder"].split(":")
+    build_network = getattr(importlib.import_module(module_name), function_name)
+    network = build_network(**spec.get("params", {}))
+    record_history = spec.get("record_history", False)
+    writer = None
+    if not record_history:
+        for field in network:
+            field.recorder = HistoryRecorder.disabled().bind(field.x, field.t, field.dtype)
+    elif directory is not None:
+        writer = RunWriter(os.path.join(directory, "run"), network, metadata=spec)
+
+    engine = BatchedEngine(network)
+    crossings = []
+    for i in range(len(engine.t)):
+        crossings.extend(engine.step(i, spec.get("input_centers"))[0] or [])
+    if writer is not None:
+        writer.close()
+
+    results = {"crossings": np.array(crossings, dtype=float).reshape(-1, 2)}
+    for field in network:
+        key = field.name.lower().replace(" ", "_")
+        results[f"final_{key}"] = field.final_state()
+        if record_history and writer is None:
+            results[f"history_{key}"] = field.history_u
+    return results
+
+
+def run_parallel_sweep(run_scenario, scenarios, output_dir, processes=None, resume=True):
+    """
+    Runs scenarios that cannot be batched together (different grids or topologies) over a process pool.
+    Each worker writes the arrays returned by run_scenario as .npy files into output_dir/<index>/, so large
+    histories are never pickled back to the parent; run_scenario may also record them directly into that
+    directory (run_network_scenario stores them as a run, see fields.run_output). A scenario directory is
+    renamed into place only when all its arrays are written, so after a crash the sweep can be resumed and
+    only unfinished scenarios rerun.
+    :param run_scenario: Picklable (module-level) function taking a scenario spec and the scenario's output
+                         directory and returning a dictionary of numpy arrays, e.g. run_network_scenario.
+    :param scenarios: List of scenario specs (JSON-serializable), identified by their position in the list.
+    :param output_dir: Directory receiving the results.
+    :param processes: Number of worker processes (defaults to the number of CPUs).
+    :param resume: Keep finished scenarios of a previous run of the same sweep; if False they are rerun.
+    :return: Results in scenario order, as loaded by load_sweep_results.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    manifest_path = os.path.join(output_dir, "scenarios.json")
+    manifest = json.dumps(scenarios, sort_keys=True, default=repr)
+    if os.path.exists(manifest_path):
+        with open(manifest_path) as f:
+            if f.read() != manifest:
+                raise ValueError(f"{output_dir} holds results of a different sweep.")
+    else:
+        with open(manifest_path, "w") as f:
+            f.write(manifest)
+
+    pending = []
+    for index in range(len(scenarios)):
+        path = _scenario_dir(output_dir, index)
+        shutil.rmtree(path + ".tmp", ignore_errors=True)  # Leftover of an interrupted run
+        if os.path.isdir(path):
+            if resume:
+                continue
+            shutil.rmtree(path)
+        pending.append(index)
+
+    if pending:
+        with ProcessPoolExecutor(max_workers=processes) as executor:
+            futures = [executor.submit(_run_and_store, run_scenario, scenarios[index],
+                                       _scenario_dir(output_dir, index)) for index in pending]
+            for future in as_completed(futures):
+                future.result()  # Propagate worker errors
+
+    return load_sweep_results(output_dir, len(scenarios))
+
+
+def load_sweep_results(output_dir, count=None, mmap=True):
+    """
+    Loads the results of run_parallel_sweep in scenario order.
+    :param output_dir: Directory of the sweep.
+    :param count: Number of scenarios (read from the manifest if not given).
+    :param mmap: Memory-map the arrays instead of reading them into memory.
+    :return: List of dictionaries of arrays (None for scenarios that have not finished); histories stored as a
+             run are read lazily from their memmapped chunks (see fields.run_output.ChunkedArray).
+    """
+    if count is None:
+        with open(os.path.join(output_dir, "scenarios.json")) as f:
+            count = len(json.load(f))
+
+    results = []
+    for index in range(count):
+        path = _scenario_dir(output_dir, index)
+        if not os.path.isdir(path):
+            results.append(None)
+            continue
+        arrays = {name[:-4]: np.load(os.path.join(path, name), mmap_mode="r" if mmap else None)
+                  for name in sorted(os.listdir(path)) if name.endswith(".npy")}
+        # Histories recorded as a run by the worker (see run_network_scenario)
+        if os.path.isdir(os.path.join(path, "run")):
+            for field in load_run(os.path.join(path, "run")).fields:
+                history = field.history_u if mmap else np.asarray(field.history_u)
+                arrays[f"history_{field.name.lower().replace(' ', '_')}"] = history
+        results.append(arrays)
+    return results
+
+
+def _scenario_dir(output_dir, index):
+    return os.path.join(output_dir, f"{index:06d}")
+
+
+def _run_and_store(run_scenario, spec, path):
+    # Runs in a worker process: write every array into a memmapped .npy file, then publish the directory
+    tmp_path = path + ".tmp"
+    os.makedirs(tmp_path, exist_ok=True)
+    results = run_scenario(spec, tmp_path)
+    for name, array in results.items():
+        array = np.asarray(array)
+        block = np.lib.format.open_memmap(os.path.join(tmp_path, f"{name}.npy"), mode="w+",
+                                          dtype=array.dtype, shape=array.shape)
+        block[...] = array
+        block.flush()
+        del block
+    os.replace(tmp_path, path)
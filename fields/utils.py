@@ -2,6 +2,7 @@ import os
 import numpy as np
 from datetime import datetime
 import json
+from fields.memory_store import MemoryStore
 
 
 # Example kernel function (oscillatory behavior)
@@ -28,6 +29,12 @@ def external_input_function(x, t, input_pars):
 
 
 
+def nearest_indices(x, positions):
+    """Returns the indices of the grid points of x closest to each of the positions."""
+    positions = np.atleast_1d(np.asarray(positions, dtype=float))
+    return np.abs(x[None, :] - positions[:, None]).argmin(axis=1)
+
+
 def save_final_state(data, name):
     # Create the 'data' directory if it doesn't exist
     os.makedirs('data', exist_ok=True)
@@ -41,8 +48,21 @@ def save_final_state(data, name):
     print(f"Final state saved to {file_name}")
 
 
-def load_sequence_memory(filename=None):
+# Loaded memory files, keyed by (path, modification time, size); shared read-only by all fields
+_loaded_memories = {}
+
+
+def load_sequence_memory(filename=None, store=None):
+    """
+    Loads a learned sequence memory as a read-only (1, n) array, read from disk once and shared by all callers.
+    Without a filename, the most recently used memory of the memory store is returned, or the most recently
+    modified .npy file in the 'data' folder if the store is empty.
+    """
     if filename is None:
+        data = (store if store is not None else MemoryStore()).latest()
+        if data is not None:
+            return data
+
         files = [f for f in os.listdir('data') if f.endswith('.npy')]
         if not files:
             raise FileNotFoundError("No .npy files found in the 'data' folder.")
@@ -50,13 +70,17 @@ def load_sequence_memory(filename=None):
         latest_file = max([os.path.join('data', f) for f in files], key=os.path.getmtime)
         filename = latest_file
 
-    data = np.load(filename)
-    print(f"Loaded sequence memory from {filename}")
-
-    # Ensure the data is at least 2D
-    if data.ndim == 1:  # If it's 1D, reshape to 2D (1 row, many columns)
-        data = data.reshape(1, -1)
-    return data
+    key = (os.path.abspath(filename), os.path.getmtime(filename), os.path.getsize(filename))
+    if key not in _loaded_memories:
+        data = np.load(filename)
+        print(f"Loaded sequence memory from {filename}")
+
+        # Ensure the data is at least 2D
+        if data.ndim == 1:  # If it's 1D, reshape to 2D (1 row, many columns)
+            data = data.reshape(1, -1)
+        data.flags.writeable = False
+        _loaded_memories[key] = data
+    return _loaded_memories[key]
 
 
 def save_external_input_params(params, filename="external_input_params.json"):
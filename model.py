@@ -1,11 +1,13 @@
+import numpy as np
+
 from fields.field import Field
 from fields.utils import (
-    save_final_state,
     save_external_input_params,
     load_external_input_params,
 )
-from fields.plotter import Plotter
+from fields.memory_store import MemoryStore, learning_scenario, scenario_key
 from fields.simulator import simultaneous_integration
+from fields.events import format_event
 
 # Constants
 KERNEL_SM = (1, 0.7, 0.9)
@@ -21,7 +23,7 @@ EXTERNAL_INPUT_PARS_SM = [
 ]
 
 
-def create_sequence_memory():
+def create_sequence_memory(dtype=np.float64):
     """Create and return the Sequence Memory field."""
     return Field(
         KERNEL_SM,
@@ -31,11 +33,15 @@ def create_sequence_memory():
         name="Sequence Memory",
         field_type="sequence_memory",
         theta=1.5,
+        dtype=dtype,
     )
 
 
-def create_recall_fields():
-    """Create and return the Action Onset and Working Memory fields."""
+def create_recall_fields(dtype=np.float64, sequence_memory=None):
+    """
+    Create and return the Action Onset and Working Memory fields.
+    The Action Onset field is preloaded with sequence_memory, or with the latest learned memory if None.
+    """
     action_onset = Field(
         KERNEL_ACTION,
         FIELD_PARS,
@@ -45,6 +51,8 @@ def create_recall_fields():
         name="Action Onset",
         field_type="decision",
         theta=1,
+        sequence_memory=sequence_memory,
+        dtype=dtype,
     )
 
     working_memory = Field(
@@ -54,29 +62,66 @@ def create_recall_fields():
         h_0=-1.0,
         name="Working Memory",
         theta=0.5,
+        dtype=dtype,
     )
 
     return action_onset, working_memory
 
 
-def run_learning_mode(plot_options):
+def create_recall_network(dtype=np.float64, sequence_memory=None):
+    """Create the recall fields, connect them and return them in integration order."""
+    action_onset, working_memory = create_recall_fields(dtype, sequence_memory)
+
+    # Add connections
+    working_memory.add_connection(action_onset, weight=1.0, connection_params={'threshold': 1})
+    action_onset.add_connection(working_memory, weight=-5.0, connection_params={'threshold': 0.5})
+
+    return [action_onset, working_memory]
+
+
+def make_plotter(fields, plot_options):
+    """Returns a Plotter for the fields if any plot is requested, otherwise None."""
+    if not any(plot_options.values()):
+        return None
+    from fields.plotter import Plotter
+    return Plotter(fields)
+
+
+def run_learning_mode(plot_options, stop=None, store=None):
 
     # Extract input centers and plot the evolution of fields' activities
     input_centers = [param[0] for param in EXTERNAL_INPUT_PARS_SM]
 
-    """Execute the learning mode."""
+    """
+    Execute the learning mode; stop optionally ends the run early (see fields.stopping).
+    The learned memory is kept in the memory store; learning is skipped if the same scenario was learned before
+    and no history plot is requested. The stop condition is part of the scenario: a run stopped early ends
+    with less h_u adaptation, so its memory differs from the one of the complete learning run.
+    """
+    store = store if store is not None else MemoryStore()
     sequence_memory = create_sequence_memory()
-    simultaneous_integration([sequence_memory], input_centers)
-
-    # Initialize plotter
-    plotter = Plotter([sequence_memory])
+    scenario = learning_scenario(sequence_memory, stop=None if stop is None else repr(stop))
+    key = scenario_key(scenario)
+
+    needs_history = plot_options.get("plot_activity_at_input_centers", False) or \
+        plot_options.get("animate_activity", False)
+    if key in store and not needs_history:
+        print(f"Sequence memory {key[:12]} already learned, skipping the learning run")
+        sequence_memory.u_field[:] = store.get(key).ravel()
+    else:
+        report = simultaneous_integration([sequence_memory], input_centers, stop=stop)
+        if report.reason != "completed":
+            print(f"Learning stopped ({report.reason}) at time {report.time:.2f}")
+
+    # Initialize plotter; plotting (and matplotlib) is only loaded when a plot is requested
+    plotter = make_plotter([sequence_memory], plot_options)
 
     # Plot final states if specified
     if plot_options.get("plot_final_states", False):
         plotter.plot_final_states()
 
-    # Save the final state of sequence_memory
-    save_final_state(sequence_memory.history_u[-1, :], sequence_memory.name)
+    # Save the final state of sequence_memory (stored once per scenario, recalled as the latest memory)
+    store.put(key, sequence_memory.final_state(), scenario)
 
     # Save the parameters of external inputs
     save_external_input_params(EXTERNAL_INPUT_PARS_SM)
@@ -95,16 +140,15 @@ def run_learning_mode(plot_options):
 
 def run_recall_mode(plot_options, input_centers):
     """Execute the recall mode."""
-    action_onset, working_memory = create_recall_fields()
-
-    # Add connections
-    working_memory.add_connection(action_onset, weight=1.0, connection_params={'threshold': 1})
-    action_onset.add_connection(working_memory, weight=-5.0, connection_params={'threshold': 0.5})
+    fields = create_recall_network()  # Action Onset, Working Memory
+    simultaneous_integration(fields, input_centers)
 
-    simultaneous_integration([action_onset, working_memory], input_centers)
+    # Report the action onsets and feedback events of the run
+    for event in sorted((event for field in fields for event in field.event_log), key=lambda event: event.step):
+        print(format_event(event))
 
-    # Initialize plotter
-    plotter = Plotter([action_onset, working_memory])
+    # Initialize plotter; plotting (and matplotlib) is only loaded when a plot is requested
+    plotter = make_plotter(fields, plot_options)
 
     # Plot final states if specified
     if plot_options.get("plot_final_states", False):
@@ -1,11 +1,13 @@
+import numpy as np
+
 from fields.field import Field
 from fields.utils import (
-    save_final_state,
     save_external_input_params,
     load_external_input_params,
 )
-from fields.plotter import Plotter
+from fields.memory_store import MemoryStore, learning_scenario, scenario_key
 from fields.simulator import simultaneous_integration
+from fields.events import format_event
 
 # Constants
 KERNEL_SM = (1, 0.7, 0.9)
@@ -27,7 +29,7 @@ EXTERNAL_INPUT_PARS_H = [
 ]
 
 
-def create_sequence_memory():
+def create_sequence_memory(dtype=np.float64):
     """Create and return the Sequence Memory field."""
     return Field(
         KERNEL_SM,
@@ -37,11 +39,15 @@ def create_sequence_memory():
         name="Sequence Memory",
         field_type="sequence_memory",
         theta=1.5,
+        dtype=dtype,
     )
 
 
-def create_recall_fields():
-    """Create and return the Action Onset and Working Memory fields."""
+def create_recall_fields(dtype=np.float64, sequence_memory=None):
+    """
+    Create and return the Action Onset and Working Memory fields.
+    The Action Onset field is preloaded with sequence_memory, or with the latest learned memory if None.
+    """
     action_onset = Field(
         KERNEL_ACTION,
         FIELD_PARS,
@@ -51,6 +57,8 @@ def create_recall_fields():
         name="Action Onset",
         field_type="decision",
         theta=1,
+        sequence_memory=sequence_memory,
+        dtype=dtype,
     )
 
     working_memory = Field(
@@ -60,6 +68,7 @@ def create_recall_fields():
         h_0=-1.0,
         name="Working Memory",
         theta=0.5,
+        dtype=dtype,
     )
 
     human_feedback = Field(
@@ -70,6 +79,7 @@ def create_recall_fields():
         h_0=0,
         name="Human Feedback",
         theta=1,
+        dtype=dtype,
     )
 
     robot_feedback = Field(
@@ -80,30 +90,72 @@ def create_recall_fields():
         h_0=0,
         name="Robot Feedback",
         theta=1,
+        dtype=dtype,
     )
 
     return action_onset, working_memory, human_feedback, robot_feedback
 
 
-def run_learning_mode(plot_options):
+def create_recall_network(dtype=np.float64, sequence_memory=None):
+    """Create the recall fields, connect them and return them in integration order."""
+    action_onset, working_memory, human_feedback, robot_feedback = create_recall_fields(dtype, sequence_memory)
+
+    # Add connections
+    working_memory.add_gated_connection([human_feedback, robot_feedback], gain=3.0, threshold=1.0)
+    action_onset.add_connection(working_memory, weight=-5.0, connection_params={'threshold': 0.5})
+    human_feedback.add_connection(working_memory, weight=-5.0, connection_params={'threshold': 0.5})
+    robot_feedback.add_connection(working_memory, weight=-5.0, connection_params={'threshold': 0.5})
+
+    # Robot feedback follows each Action Onset crossing after 14, 16 and 22 steps (first, second, third crossing)
+    robot_feedback.add_delayed_input("Action Onset", delays=(14, 16, 22), amplitude=3.0, width=1.5)
+
+    return [action_onset, working_memory, human_feedback, robot_feedback]
+
+
+def make_plotter(fields, plot_options):
+    """Returns a Plotter for the fields if any plot is requested, otherwise None."""
+    if not any(plot_options.values()):
+        return None
+    from fields.plotter import Plotter
+    return Plotter(fields)
+
+
+def run_learning_mode(plot_options, stop=None, store=None):
 
     # Extract input centers and plot the evolution of fields' activities
     input_centers = [param[0] for param in EXTERNAL_INPUT_PARS_SM]
 
-    """Execute the learning mode."""
+    """
+    Execute the learning mode; stop optionally ends the run early (see fields.stopping).
+    The learned memory is kept in the memory store; learning is skipped if the same scenario was learned before
+    and no history plot is requested. The stop condition is part of the scenario: a run stopped early ends
+    with less h_u adaptation, so its memory differs from the one of the complete learning run.
+    """
+    store = store if store is not None else MemoryStore()
     sequence_memory = create_sequence_memory()
-    simultaneous_integration([sequence_memory], input_centers)
+    scenario = learning_scenario(sequence_memory, stop=None if stop is None else repr(stop))
+    key = scenario_key(scenario)
+
+    needs_history = plot_options.get("plot_activity_at_input_centers", False) or \
+        plot_options.get("animate_activity", False)
+    if key in store and not needs_history:
+        print(f"Sequence memory {key[:12]} already learned, skipping the learning run")
+        sequence_memory.u_field[:] = store.get(key).ravel()
+    else:
+        report = simultaneous_integration([sequence_memory], input_centers, stop=stop)
+        if report.reason != "completed":
+            print(f"Learning stopped ({report.reason}) at time {report.time:.2f}")
     # simultaneous_integration(fields, input_centers)
 
-    # Initialize plotter
-    plotter = Plotter([sequence_memory])
+    # Initialize plotter; plotting (and matplotlib) is only loaded when a plot is requested
+    plotter = make_plotter([sequence_memory], plot_options)
 
     # Plot final states if specified
     if plot_options.get("plot_final_states", False):
         plotter.plot_final_states()
 
-    # Save the final state of sequence_memory
-    save_final_state(sequence_memory.history_u[-1, :], sequence_memory.name)
+    # Save the final state of sequence_memory (stored once per scenario, recalled as the latest memory)
+    store.put(key, sequence_memory.final_state(), scenario)
 
     # Save the parameters of external inputs
     save_external_input_params(EXTERNAL_INPUT_PARS_SM)
@@ -121,21 +173,15 @@ def run_learning_mode(plot_options):
 
 def run_recall_mode(plot_options, input_centers):
     """Execute the recall mode."""
-    action_onset, working_memory, human_feedback, robot_feedback = create_recall_fields()
-
-    # Add connections
-    working_memory.add_connection(human_feedback, weight=1.0, connection_params={'threshold': 1})
-    working_memory.add_connection(robot_feedback, weight=1.0, connection_params={'threshold': 1})
-    action_onset.add_connection(working_memory, weight=-5.0, connection_params={'threshold': 0.5})
-    human_feedback.add_connection(working_memory, weight=-5.0, connection_params={'threshold': 0.5})
-    robot_feedback.add_connection(working_memory, weight=-5.0, connection_params={'threshold': 0.5})
-
-    # simultaneous_integration([action_onset, working_memory, human_feedback])
-    fields = [action_onset, working_memory, human_feedback, robot_feedback]  # List of Field instances
+    fields = create_recall_network()  # Action Onset, Working Memory, Human Feedback, Robot Feedback
     simultaneous_integration(fields, input_centers)
 
-    # Initialize plotter
-    plotter = Plotter([action_onset, working_memory, human_feedback, robot_feedback])
+    # Report the action onsets and feedback events of the run
+    for event in sorted((event for field in fields for event in field.event_log), key=lambda event: event.step):
+        print(format_event(event))
+
+    # Initialize plotter; plotting (and matplotlib) is only loaded when a plot is requested
+    plotter = make_plotter(fields, plot_options)
 
     # Plot final states if specified
     if plot_options.get("plot_final_states", False):
@@ -0,0 +1,54 @@
+"""
+Runs the headless benchmark suite (see fields.benchmark) and compares it against a baseline.
+
+The baseline is benchmarks/baseline.json by default. It is not part of the repository, since timings only
+compare on the machine that recorded them: the first run on a machine writes it, later runs compare
+against it. Refresh it after an intended change of performance (or of machine) with:
+    python run_benchmarks.py --update-baseline
+Use several repeats (e.g. --repeats 10) for a baseline on a machine with noisy timings.
+"""
+import argparse
+import os
+import sys
+
+from fields.benchmark import run_suite, save_results, load_results, compare
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmarks", "baseline.json")
+
+
+def main(argv=None):
+    """Run the headless benchmark suite and compare it against the stored baseline."""
+    parser = argparse.ArgumentParser(description="Benchmarks of the simulation hot paths.")
+    parser.add_argument("--repeats", type=int, default=5, help="timed runs per case")
+    parser.add_argument("--filter", default=None, help="only run cases whose name contains this string")
+    parser.add_argument("--no-memory", action="store_true", help="skip the peak memory measurement")
+    parser.add_argument("--output", default=None, help="write the results to this JSON file")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE,
+                        help="compare against the results in this JSON file (written if it does not exist)")
+    parser.add_argument("--update-baseline", action="store_true", help="overwrite the baseline with this run")
+    parser.add_argument("--time-threshold", type=float, default=0.25, help="accepted relative slowdown")
+    parser.add_argument("--memory-threshold", type=float, default=0.10, help="accepted relative memory growth")
+    args = parser.parse_args(argv)
+
+    results = run_suite(repeats=args.repeats, pattern=args.filter, measure_memory=not args.no_memory)
+    if args.output:
+        save_results(results, args.output)
+
+    if args.update_baseline or not os.path.exists(args.baseline):
+        os.makedirs(os.path.dirname(os.path.abspath(args.baseline)), exist_ok=True)
+        save_results(results, args.baseline)
+        print(f"Baseline written to {args.baseline}")
+        return 0
+
+    regressions = compare(results, load_results(args.baseline), args.time_threshold, args.memory_threshold)
+    for regression in regressions:
+        print(f"REGRESSION {regression.name} {regression.metric}: {regression.baseline:.6g} -> "
+              f"{regression.current:.6g} ({regression.ratio:.2f}x)")
+    if regressions:
+        return 1
+    print("No regressions against the baseline")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
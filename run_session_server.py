@@ -0,0 +1,21 @@
+import asyncio
+
+from model_adaptation import create_recall_network
+from fields.server import SessionServer
+
+
+async def main(host, port, tick):
+    """Host recall sessions of the adaptation model until interrupted."""
+    server = await SessionServer({"recall": create_recall_network}, tick=tick).start(host, port)
+    print(f"Serving recall sessions on {server.address}")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await server.close()
+
+
+if __name__ == "__main__":
+    # Control period of the sessions in seconds; every running session advances one dt per tick
+    tick = 0.01
+
+    asyncio.run(main("127.0.0.1", 8765, tick))
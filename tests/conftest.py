@@ -0,0 +1,79 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+# The fields package and the model modules live at the root of the repository
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fields.utils import kernel_osc  # noqa: E402
+
+X_LIM, DX = 80, 0.1
+KERNEL_ACTION = (1.5, 0.9, 0.0)
+KERNEL_WM = (1.5, 0.5, 0.75)
+
+
+@pytest.fixture
+def dx():
+    """Spatial step of the grid."""
+    return DX
+
+
+@pytest.fixture
+def x():
+    """Spatial grid of the models (1601 points)."""
+    return np.arange(-X_LIM, X_LIM + DX, DX)
+
+
+@pytest.fixture
+def kernels(x):
+    """Stack of the Action Onset and Working Memory kernels sampled on the grid."""
+    return np.stack([kernel_osc(x, *KERNEL_ACTION), kernel_osc(x, *KERNEL_WM)])
+
+
+@pytest.fixture
+def bumps(x):
+    """Thresholded outputs of the stack: a few bumps, one of them touching the end of the grid."""
+    f = np.zeros((2, len(x)))
+    for row, centers in enumerate([(-40.0, 0.0, 79.5), (-79.8, 30.0)]):
+        for center in centers:
+            f[row, np.abs(x - center) <= 1.5] = 1.0
+    return f
+
+
+INPUT_CENTERS = [0.0, 30.0, -40.0]
+
+
+@pytest.fixture
+def input_centers():
+    """Positions monitored in the Action Onset fields."""
+    return list(INPUT_CENTERS)
+
+
+@pytest.fixture(scope="session")
+def learned_memories():
+    """Sequence memory learned by each model module, computed once per test session."""
+    import model
+    import model_adaptation
+    from fields.recorder import HistoryRecorder
+    from fields.simulator import simultaneous_integration
+
+    memories = {}
+    for module in (model, model_adaptation):
+        field = module.create_sequence_memory()
+        field.recorder = HistoryRecorder.disabled().bind(field.x, field.t, field.dtype)
+        simultaneous_integration([field], INPUT_CENTERS)
+        memories[module.__name__] = field.final_state()
+    return memories
+
+
+@pytest.fixture
+def build_recall(learned_memories):
+    """Returns a builder of the recall network of a model module, preloaded with its learned memory."""
+    import importlib
+
+    def build(module="model_adaptation", **kwargs):
+        return importlib.import_module(module).create_recall_network(sequence_memory=learned_memories[module],
+                                                                     **kwargs)
+    return build
@@ -0,0 +1,54 @@
+import numpy as np
+import pytest
+
+from fields.active_set import ActiveSet
+from fields.simulator import simultaneous_integration
+
+
+@pytest.fixture
+def reference(build_recall, input_centers):
+    fields = build_recall()
+    simultaneous_integration(fields, input_centers)
+    return fields
+
+
+def run_active_set(build_recall, input_centers, tolerance):
+    fields = build_recall()
+    active_set = ActiveSet(tolerance=tolerance)
+    simultaneous_integration(fields, input_centers, active_set=active_set)
+    return fields, active_set
+
+
+def max_difference(fields, reference):
+    return max(np.abs(field.history_u - expected.history_u).max() for field, expected in zip(fields, reference))
+
+
+def assert_same_events(fields, reference):
+    for field, expected in zip(fields, reference):
+        assert [(event.step, event.position) for event in field.event_log] == \
+            [(event.step, event.position) for event in expected.event_log]
+
+
+def test_zero_tolerance_matches_step_by_step_integration(build_recall, input_centers, reference):
+    fields, active_set = run_active_set(build_recall, input_centers, 0.0)
+    assert active_set.stats["skipped"] > 0
+    assert max_difference(fields, reference) < 1e-10
+    assert_same_events(fields, reference)
+
+
+@pytest.mark.parametrize("tolerance", [1e-3, 1e-2, 5e-2])
+def test_states_stay_within_tolerance(tolerance, build_recall, input_centers, reference):
+    fields, active_set = run_active_set(build_recall, input_centers, tolerance)
+    _, exact = run_active_set(build_recall, input_centers, 0.0)
+    assert active_set.stats["skipped"] > exact.stats["skipped"]
+    assert max_difference(fields, reference) <= tolerance
+    assert_same_events(fields, reference)
+
+
+def test_invalid_settings_are_rejected(build_recall, input_centers):
+    with pytest.raises(ValueError):
+        ActiveSet(tolerance=-1.0)
+    with pytest.raises(ValueError):
+        ActiveSet(min_sleep=0)
+    with pytest.raises(ValueError):
+        simultaneous_integration(build_recall(), input_centers, batched=True, active_set=ActiveSet())
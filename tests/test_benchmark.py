@@ -0,0 +1,25 @@
+import json
+
+import run_benchmarks
+from fields.benchmark import check_headless_imports
+
+
+def test_first_run_writes_the_baseline_then_compares(tmp_path, capsys):
+    baseline = tmp_path / "benchmarks" / "baseline.json"
+    argv = ["--filter", "construction/plain", "--repeats", "1", "--no-memory", "--baseline", str(baseline)]
+    assert run_benchmarks.main(argv) == 0
+    assert "Baseline written" in capsys.readouterr().out
+    assert list(json.loads(baseline.read_text())["results"]) == ["construction/plain"]
+
+    # A huge accepted slowdown, so the comparison cannot fail on timing noise
+    assert run_benchmarks.main(argv + ["--time-threshold", "1000"]) == 0
+    assert "No regressions" in capsys.readouterr().out
+
+
+def test_simulation_core_imports_without_matplotlib():
+    seconds, loaded = check_headless_imports()
+    assert loaded == []
+    assert seconds > 0
+
+    # The check itself reports a plotting package leaking into the imports
+    assert check_headless_imports(modules=["fields.plotter"])[1] == ["matplotlib"]
@@ -0,0 +1,60 @@
+import numpy as np
+import pytest
+
+from fields.checkpoint import Checkpoint
+from fields.convolution import make_convolution
+from fields.simulator import simultaneous_integration
+
+
+def assert_resumed_run(fields, reference, step):
+    for field, expected in zip(fields, reference):
+        np.testing.assert_array_equal(field.u_field, expected.u_field)
+        np.testing.assert_array_equal(field.h_u, expected.h_u)
+        np.testing.assert_array_equal(field.recorder.steps, np.arange(step + 1, len(field.t)))
+        np.testing.assert_array_equal(field.history_u, expected.history_u[step + 1:])
+        assert list(field.event_log) == list(expected.event_log)
+
+
+@pytest.mark.parametrize("batched", [False, True])
+def test_resume_from_saved_checkpoint_matches_uninterrupted_run(batched, build_recall, input_centers, tmp_path):
+    reference = build_recall()
+    checkpoints = []
+    simultaneous_integration(reference, input_centers, batched=batched, checkpoint_every=50,
+                             on_checkpoint=checkpoints.append)
+
+    # Action Onset crosses at step 48, so the Robot Feedback input is still pending at step 49
+    checkpoint = checkpoints[0]
+    assert checkpoint.step == 49
+    assert any(info["pending"] for info in checkpoint.meta["fields"])
+    checkpoint.save(tmp_path / "checkpoint.npz")
+
+    fields = build_recall()
+    simultaneous_integration(fields, input_centers, batched=batched,
+                             resume_from=Checkpoint.load(tmp_path / "checkpoint.npz"))
+    assert_resumed_run(fields, reference, checkpoint.step)
+
+
+def test_resume_restores_incremental_convolution_state(build_recall, input_centers):
+    def build():
+        fields = build_recall()
+        for field in fields:
+            field.convolution = make_convolution("delta", field.kernel, field.dx)
+        return fields
+
+    reference = build()
+    checkpoints = []
+    simultaneous_integration(reference, input_centers, checkpoint_every=200, on_checkpoint=checkpoints.append)
+
+    fields = build()
+    simultaneous_integration(fields, input_centers, resume_from=checkpoints[0])
+    assert checkpoints[0].meta["fields"][0]["convolution"] is not None
+    assert_resumed_run(fields, reference, checkpoints[0].step)
+
+
+def test_restore_rejects_a_different_network(build_recall, input_centers):
+    fields = build_recall("model")
+    simultaneous_integration(fields, input_centers, batched=True)
+    checkpoint = Checkpoint.capture(fields, len(fields[0].t) - 1)
+    with pytest.raises(ValueError):
+        checkpoint.restore(build_recall())
+
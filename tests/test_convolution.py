@@ -0,0 +1,87 @@
+import numpy as np
+import pytest
+
+from fields.convolution import (
+    DeltaConvolution,
+    DirectConvolution,
+    FFTConvolution,
+    RFFTConvolution,
+    make_convolution,
+)
+
+
+def test_rfft_matches_fft_reference(kernels, bumps, dx):
+    expected = FFTConvolution(kernels, dx)(bumps)
+    np.testing.assert_allclose(RFFTConvolution(kernels, dx)(bumps), expected, rtol=0, atol=1e-12)
+
+
+def test_rfft_single_field_matches_stack(kernels, bumps, dx):
+    stacked = RFFTConvolution(kernels, dx)(bumps).copy()
+    for row in range(len(kernels)):
+        np.testing.assert_array_equal(RFFTConvolution(kernels[row], dx)(bumps[row]), stacked[row])
+
+
+def test_rfft_float32_stays_close_to_float64(kernels, bumps, dx):
+    expected = RFFTConvolution(kernels, dx)(bumps)
+    result = RFFTConvolution(kernels.astype(np.float32), dx)(bumps.astype(np.float32))
+    assert result.dtype == np.float32
+    np.testing.assert_allclose(result, expected, rtol=0, atol=1e-5)
+
+
+def test_delta_follows_the_exact_convolution_through_flips(kernels, bumps, dx):
+    delta = DeltaConvolution(kernels, dx, max_flips=8, check_every=1000)
+    exact = RFFTConvolution(kernels, dx)
+    f = bumps.copy()
+    rng = np.random.default_rng(0)
+    for _ in range(50):
+        f.flat[rng.integers(0, f.size, size=3)] = rng.integers(0, 2, size=3)
+        np.testing.assert_allclose(delta(f), exact(f), rtol=0, atol=1e-9)
+    assert delta.full_steps == 1
+    assert delta.incremental_steps == 49
+
+
+def test_delta_recomputes_when_too_many_sites_flip(kernels, bumps, dx):
+    delta = DeltaConvolution(kernels, dx, max_flips=2)
+    delta(bumps)
+    shifted = np.roll(bumps, 5, axis=-1)
+    np.testing.assert_allclose(delta(shifted), RFFTConvolution(kernels, dx)(shifted), rtol=0, atol=1e-12)
+    assert delta.full_steps == 2
+
+
+def test_delta_state_round_trip(kernels, bumps, dx):
+    delta = DeltaConvolution(kernels, dx)
+    delta(bumps)
+    state = delta.get_state()
+    f = bumps.copy()
+    f[0, 100] = 1.0
+    expected = delta(f).copy()
+
+    restored = DeltaConvolution(kernels, dx)
+    restored.set_state(state)
+    np.testing.assert_array_equal(restored(f), expected)
+    assert restored.full_steps == 0
+
+
+def test_direct_matches_rfft_up_to_the_truncation(kernels, bumps, dx):
+    expected = RFFTConvolution(kernels, dx)(bumps)
+    np.testing.assert_allclose(DirectConvolution(kernels, dx, tolerance=1e-12)(bumps), expected, rtol=0,
+                               atol=1e-9)
+
+
+@pytest.mark.parametrize("backend", [RFFTConvolution, DirectConvolution])
+def test_zero_boundary_is_linear_convolution(backend, kernels, bumps, dx):
+    result = backend(kernels, dx, boundary="zero")(bumps)
+    for row in range(len(kernels)):
+        expected = dx * np.convolve(bumps[row], kernels[row], mode="same")
+        np.testing.assert_allclose(result[row], expected, rtol=0, atol=1e-8)
+
+
+def test_auto_picks_a_backend_matching_rfft(kernels, bumps, dx):
+    convolution = make_convolution("auto", kernels, dx)
+    assert convolution.kind in ("direct", "rfft")
+    np.testing.assert_allclose(convolution(bumps), RFFTConvolution(kernels, dx)(bumps), rtol=0, atol=1e-8)
+
+
+def test_unknown_boundary_is_rejected(kernels, dx):
+    with pytest.raises(ValueError):
+        DirectConvolution(kernels, dx, boundary="reflect")
@@ -0,0 +1,65 @@
+import numpy as np
+import pytest
+
+from fields.engine import BatchedEngine
+from fields.simulator import simultaneous_integration
+
+
+def assert_same_run(fields, reference):
+    for field, expected in zip(fields, reference):
+        assert field.name == expected.name
+        np.testing.assert_array_equal(field.history_u, expected.history_u)
+        np.testing.assert_array_equal(field.h_u, expected.h_u)
+        assert [(event.step, event.position) for event in field.event_log] == \
+            [(event.step, event.position) for event in expected.event_log]
+
+
+@pytest.mark.parametrize("module", ["model", "model_adaptation"])
+def test_batched_matches_per_field(module, build_recall, input_centers):
+    reference = build_recall(module)
+    simultaneous_integration(reference, input_centers)
+    fields = build_recall(module)
+    simultaneous_integration(fields, input_centers, batched=True)
+    assert_same_run(fields, reference)
+    assert any(len(field.event_log) for field in fields)
+
+
+def test_delayed_input_is_not_seen_by_fields_updated_before_it(learned_memories, input_centers):
+    # With a weaker memory, Robot Feedback's delayed input fires while Working Memory reads it through its gate
+    import model_adaptation
+
+    def build():
+        return model_adaptation.create_recall_network(
+            sequence_memory=0.8 * learned_memories["model_adaptation"])
+
+    reference = build()
+    simultaneous_integration(reference, input_centers)
+    fields = build()
+    simultaneous_integration(fields, input_centers, batched=True)
+    assert_same_run(fields, reference)
+    assert len(fields[-1].event_log)
+
+
+def test_networks_stepped_together_match_separate_runs(build_recall, input_centers):
+    # Two trials with a different Action Onset time scale, as in a sweep
+    def build(tau_h):
+        network = build_recall()
+        network[0].tau_h = tau_h
+        return network
+
+    references = [build(20), build(15)]
+    for reference in references:
+        simultaneous_integration(reference, input_centers)
+
+    networks = [build(20), build(15)]
+    BatchedEngine(networks=networks).run(input_centers)
+    for network, reference in zip(networks, references):
+        assert_same_run(network, reference)
+    assert not np.array_equal(networks[0][0].u_field, networks[1][0].u_field)
+
+
+def test_fields_must_share_the_grid(build_recall):
+    fields = build_recall()
+    other = build_recall("model")
+    with pytest.raises(ValueError):
+        BatchedEngine(fields + other)
@@ -0,0 +1,80 @@
+import numpy as np
+
+from fields.field import Field
+
+KERNEL_ACTION = (1.5, 0.9, 0.0)
+FIELD_PARS = (80, 120, 0.1, 0.2)
+
+# Action Onset crossings (step -> positions). With delays (14, 16, 22) for the first, second and third
+# crossing (cycling), the inputs of crossings 2 and 3 are both due at step 24, those of 5 and 6 at step 34.
+CROSSINGS = {0: [-40.0], 1: [0.0], 2: [30.0], 10: [0.0, 30.0], 12: [-40.0], 20: [0.0]}
+
+
+def scan_lists(field, steps, delays):
+    """
+    The previous bookkeeping: parallel lists of crossing steps, delays and positions scanned every step,
+    applying every input that is due.
+    """
+    crossing_times, delay_queue, crossing_positions = [], [], []
+    fired, count = [], 0
+    for i in range(steps):
+        for position in CROSSINGS.get(i, []):
+            crossing_times.append(i)
+            delay_queue.append(delays[count % len(delays)])
+            crossing_positions.append(position)
+            count += 1
+        j = 0
+        while j < len(crossing_times):
+            if i >= crossing_times[j] + delay_queue[j]:
+                field.u_field += 3.0 * np.exp(-0.5 * ((field.x - crossing_positions[j]) / 1.5) ** 2)
+                fired.append((i, crossing_positions[j]))
+                crossing_times.pop(j)
+                delay_queue.pop(j)
+                crossing_positions.pop(j)
+            else:
+                j += 1
+    return fired
+
+
+def test_scheduler_fires_every_due_input_like_the_list_scan():
+    reference = Field(KERNEL_ACTION, FIELD_PARS, name="Robot Feedback")
+    expected = scan_lists(reference, 50, (14, 16, 22))
+
+    field = Field(KERNEL_ACTION, FIELD_PARS, name="Robot Feedback")
+    field.add_delayed_input("Action Onset", delays=(14, 16, 22), amplitude=3.0, width=1.5)
+    fired = []
+    for i in range(50):
+        crossings = [(position, field.t[i]) for position in CROSSINGS.get(i, [])]
+        field.delayed_inputs.schedule("Action Onset", crossings, i)
+        fired.extend((event.step, event.position) for event in field.delayed_inputs.fire_due(i))
+
+    assert fired == expected
+    assert [step for step, _ in fired].count(24) == 2 and [step for step, _ in fired].count(34) == 2
+    assert not field.delayed_inputs.pending
+    np.testing.assert_array_equal(field.u_field, reference.u_field)
+    assert [(event.step, event.position) for event in field.event_log] == expected
+
+
+def test_monitor_reports_each_crossing_once():
+    field = Field(KERNEL_ACTION, FIELD_PARS, name="Action Onset")
+    at_zero = np.exp(-0.5 * (field.x / 2.0) ** 2)
+    at_minus_40 = np.exp(-0.5 * ((field.x + 40) / 2.0) ** 2)
+    # Activity at 0 crosses the threshold, falls back and crosses again; -40 crosses later and 30 never does
+    levels = [(0.5, 0.0), (0.5, 0.0), (1.2, 0.0), (1.5, 0.0), (0.5, 0.0), (1.2, 0.0), (1.2, 1.5), (1.2, 1.5)]
+    reported = {}
+    for i, (level_zero, level_minus_40) in enumerate(levels):
+        field.u_field[:] = level_zero * at_zero + level_minus_40 * at_minus_40
+        crossings = field.monitor_action_onset([-40.0, 0.0, 30.0], i)
+        if crossings:
+            reported[i] = [position for position, _ in crossings]
+
+    assert reported == {2: [field.x[800]], 6: [field.x[400]]}
+    assert [(event.step, event.time) for event in field.event_log] == [(2, field.t[2]), (6, field.t[6])]
+
+    # Watching the whole field, every new bump is reported once at its peak, in both directions
+    monitor = field.get_monitor(direction="both")
+    assert [(event.position, event.direction) for event in monitor.check(8)] == \
+        [(field.x[400], "up"), (field.x[800], "up")]
+    assert monitor.check(9) == []
+    field.u_field[:] = 0.0
+    assert [event.direction for event in monitor.check(10)] == ["down", "down"]
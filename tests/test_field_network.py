@@ -0,0 +1,45 @@
+import numpy as np
+import pytest
+
+from fields.field_network import CompiledCoupling, FieldNetwork
+
+
+def test_validate_rejects_duplicate_names_and_foreign_sources(build_recall):
+    fields = build_recall()
+    FieldNetwork(fields).validate()
+
+    fields[2].name = fields[3].name
+    with pytest.raises(ValueError):
+        FieldNetwork(fields).validate()
+
+    fields = build_recall()
+    with pytest.raises(ValueError):
+        FieldNetwork(fields[:2]).validate()  # Working Memory reads the feedback fields
+
+
+def test_update_stages_reject_a_bad_order(build_recall):
+    fields = build_recall()
+    network = FieldNetwork(fields)
+    # Human Feedback reads the Working Memory state updated before it, so it goes to a later stage
+    assert network.update_stages(fields[:3]) == [0, 0, 1]
+    with pytest.raises(ValueError):
+        network.update_stages([fields[0], fields[1], fields[0]])
+    with pytest.raises(ValueError):
+        network.update_stages(fields[:2] + [build_recall()[2]])
+
+
+def test_gated_connection_matches_the_hand_written_gate(build_recall):
+    fields = build_recall()
+    action_onset, working_memory, human_feedback, robot_feedback = fields
+    rng = np.random.default_rng(0)
+    for field in fields:
+        field.u_field[:] = rng.uniform(-1.0, 3.0, size=field.u_field.shape)
+
+    # The Working Memory input previously hard-coded in Field.get_internal_input
+    expected = 3.0 * (human_feedback.u_field > 1) * (robot_feedback.u_field > 1)
+    np.testing.assert_array_equal(working_memory.get_internal_input(0), expected)
+
+    row_of = {id(field): k for k, field in enumerate(fields)}
+    coupling = CompiledCoupling([working_memory], [1], row_of)
+    out = np.empty((1, len(working_memory.x)))
+    np.testing.assert_array_equal(coupling(np.stack([field.u_field for field in fields]), out)[0], expected)
@@ -0,0 +1,42 @@
+import numpy as np
+import pytest
+
+import model_adaptation
+from fields.inputs import InputSchedule
+from fields.utils import external_input_function
+
+# Overlapping inputs, one switching on exactly when another switches off, and one that starts active
+INPUT_PARS = model_adaptation.EXTERNAL_INPUT_PARS_SM + model_adaptation.EXTERNAL_INPUT_PARS_H + [
+    (10.0, 2.0, 3.0, 15, 30), (-20.0, 1.0, 0.5, 0, 4.4)]
+
+
+def per_step_input(x, t):
+    # The previous Field.get_external_input
+    total_input = np.zeros_like(x)
+    for input_pars in INPUT_PARS:
+        total_input += external_input_function(x, t, input_pars)
+    return total_input
+
+
+@pytest.fixture
+def t():
+    return np.arange(0, 120 + 0.2, 0.2)
+
+
+def test_schedule_matches_the_per_step_input_bit_for_bit(x, t):
+    schedule = InputSchedule(x, INPUT_PARS, tolerance=0.0)
+    for time in t:
+        np.testing.assert_array_equal(schedule(time), per_step_input(x, time))
+
+
+def test_truncated_profiles_stay_within_the_tolerance(x, t):
+    schedule = InputSchedule(x, INPUT_PARS)
+    for time in t:
+        np.testing.assert_allclose(schedule(time), per_step_input(x, time), rtol=0, atol=1e-11)
+
+
+def test_going_back_in_time_rewinds_the_schedule(x, t):
+    schedule = InputSchedule(x, INPUT_PARS, tolerance=0.0)
+    schedule(t[-1])
+    np.testing.assert_array_equal(schedule(11.0), per_step_input(x, 11.0))
+    assert schedule.next_event_time() == 15
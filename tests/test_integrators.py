@@ -0,0 +1,41 @@
+import numpy as np
+import pytest
+
+from fields.field import Field
+from fields.integrators import ExponentialIntegrator
+from fields.simulator import simultaneous_integration
+
+
+def build(dt):
+    # A bump forming under an input switched on at t=1 (and off at t=15, after the end of the run)
+    return Field((1.5, 0.9, 0.0), (20, 10, 0.1, dt), [(0.0, 3.0, 1.5, 1, 15)], tau_h=20, h_0=-1.0)
+
+
+def run(integrator=None):
+    field = build(0.1)
+    simultaneous_integration([field], None, integrator=integrator)
+    return np.asarray(field.history_u)[:100]
+
+
+@pytest.fixture(scope="module")
+def reference():
+    # Euler at a hundredth of the grid dt; history row i holds the state at t[i] + dt
+    field = build(0.001)
+    simultaneous_integration([field], None)
+    return np.asarray(field.history_u)[99::100]
+
+
+def test_fixed_step_exponential_integrator_is_closer_than_euler(reference):
+    error = np.abs(run(ExponentialIntegrator(adaptive=False)) - reference).max()
+    assert error < 0.02
+    assert error < np.abs(run() - reference).max() / 3
+    assert reference[-1].max() > 4  # The bump has formed
+
+
+def test_adaptive_exponential_integrator_follows_its_tolerance(reference):
+    integrator = ExponentialIntegrator()
+    history = run(integrator)
+    assert integrator.stats["accepted"] < 100  # Long steps on the plateaus
+    assert np.abs(history[-1] - reference[-1]).max() < 5e-3
+
+    assert np.abs(run(ExponentialIntegrator(rtol=1e-4, atol=1e-4)) - reference).max() < 2e-3
@@ -0,0 +1,41 @@
+import numpy as np
+import pytest
+
+from fields.field import Field
+from fields.kernel_cache import KernelCache
+
+
+def test_fields_share_their_kernel():
+    first = Field((1.5, 0.9, 0.0), (20, 10, 0.1, 0.1))
+    second = Field((1.5, 0.9, 0.0), (20, 10, 0.1, 0.1))
+    other = Field((1.5, 0.8, 0.0), (20, 10, 0.1, 0.1))
+    assert first.kernel is second.kernel
+    assert other.kernel is not first.kernel
+    with pytest.raises(ValueError):
+        first.kernel[0] = 0.0
+
+
+def test_least_recently_used_entries_are_evicted():
+    cache = KernelCache(max_bytes=2 * 80)  # Two arrays of 10 float64
+    calls = []
+
+    def compute(value):
+        calls.append(value)
+        return np.zeros(10)
+
+    cache.get(("a",), lambda: compute("a"))
+    cache.get(("b",), lambda: compute("b"))
+    cache.get(("a",), lambda: compute("a"))  # Hit: "b" is now the least recently used
+    cache.get(("c",), lambda: compute("c"))
+    assert (len(cache), cache.nbytes) == (2, 160)
+    cache.get(("a",), lambda: compute("a"))
+    cache.get(("b",), lambda: compute("b"))
+    assert calls == ["a", "b", "c", "b"]
+    assert (cache.hits, cache.misses) == (2, 4)
+
+
+def test_entries_are_shared_through_the_disk_layer(tmp_path):
+    data = KernelCache(root=str(tmp_path)).get(("a",), lambda: np.arange(10.0))
+    loaded = KernelCache(root=str(tmp_path)).get(("a",), lambda: pytest.fail("recomputed"))
+    np.testing.assert_array_equal(loaded, data)
+    assert isinstance(loaded, np.memmap) and not loaded.flags.writeable
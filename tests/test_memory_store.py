@@ -0,0 +1,51 @@
+import itertools
+import os
+
+import numpy as np
+import pytest
+
+from fields import memory_store
+from fields.field import Field
+from fields.memory_store import MemoryStore
+
+
+def build(tau_h=20):
+    return Field((1.5, 0.9, 0.0), (20, 10, 0.1, 0.1), [(0.0, 3.0, 1.5, 1, 5)], tau_h=tau_h,
+                 field_type="sequence_memory")
+
+
+def test_keys_address_the_learning_scenario(tmp_path):
+    store = MemoryStore(str(tmp_path))
+    assert store.key(build()) == store.key(build())
+    assert store.key(build()) != store.key(build(tau_h=10))
+    assert store.key(build()) != store.key(build(), stop="Settled()")
+
+
+def test_stored_memory_is_shared_read_only(tmp_path):
+    store = MemoryStore(str(tmp_path))
+    key = store.key(build())
+    assert store.get(key) is None and key not in store
+
+    memory = np.linspace(0, 1, 401)
+    store.put(key, memory)
+    loaded = store.get(key)
+    assert key in store
+    assert loaded is store.get(key) is MemoryStore(str(tmp_path)).get(key)
+    np.testing.assert_array_equal(loaded, memory.reshape(1, -1))
+    with pytest.raises(ValueError):
+        loaded[0, 0] = 1.0
+
+
+def test_least_recently_used_memory_is_evicted(tmp_path, monkeypatch):
+    clock = itertools.count()
+    monkeypatch.setattr(memory_store.time, "time", lambda: float(next(clock)))
+    store = MemoryStore(str(tmp_path), max_entries=2)
+    store.put("a", np.zeros(4))
+    store.put("b", np.ones(4))
+    store.get("a")  # "b" is now the least recently used
+    store.put("c", np.full(4, 2.0))
+
+    assert "a" in store and "c" in store and "b" not in store
+    assert not os.path.exists(os.path.join(str(tmp_path), "b.npy"))
+    np.testing.assert_array_equal(store.latest(), np.full((1, 4), 2.0))
+    assert store.nbytes() == 2 * os.path.getsize(os.path.join(str(tmp_path), "a.npy"))
@@ -0,0 +1,13 @@
+import numpy as np
+
+from fields.precision import validate_precision
+
+
+def test_float32_recall_stays_within_the_default_tolerances(build_recall, input_centers):
+    report = validate_precision(build_recall, input_centers, dtype=np.float32)
+    assert report.passed
+    assert report.missing_crossings == 0
+    assert not np.isnan(report.crossing_times).any()
+    assert report.crossing_drift <= 0.1  # One time step of the grid
+    assert max(report.state_drift.values()) < 1e-3
+    assert all(mismatch == 0 for mismatch in report.output_mismatch.values())
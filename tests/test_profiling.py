@@ -0,0 +1,37 @@
+import json
+
+import pytest
+
+from fields import profiling
+from fields.profiling import FileSink, Profiler
+from fields.simulator import simultaneous_integration
+
+FIELD_STAGES = {"feedback", "external_input", "internal_input", "convolution", "h_u", "update", "history"}
+ENGINE_STAGES = {"feedback", "external_input", "convolution", "h_u", "coupling", "history"}
+
+
+@pytest.mark.parametrize("batched", [False, True])
+def test_stages_are_timed_within_the_steps(batched, build_recall, input_centers, tmp_path):
+    fields = build_recall()
+    path = tmp_path / "profile.jsonl"
+    with profiling.profile(Profiler(sinks=[FileSink(str(path))], flush_every=200)) as profiler:
+        simultaneous_integration(fields, input_centers, batched=batched)
+    assert profiling.active is None
+
+    steps = len(fields[0].t)
+    snapshot = profiler.snapshot()
+    assert snapshot["step"]["count"] == steps
+    if batched:
+        assert snapshot["stages"].keys() == {"engine/0"}
+        assert snapshot["stages"]["engine/0"].keys() == ENGINE_STAGES
+    else:
+        assert snapshot["stages"].keys() == {field.name for field in fields}
+        assert all(stages.keys() == FIELD_STAGES for stages in snapshot["stages"].values())
+    assert all(summary["count"] == steps for stages in snapshot["stages"].values() for summary in stages.values())
+
+    # Stages are disjoint parts of the steps
+    assert sum(histogram.total for histogram in profiler.stages.values()) <= profiler.steps.total
+
+    # Periodic snapshots and the final flush
+    lines = [json.loads(line) for line in path.read_text().splitlines()]
+    assert [line["step"]["count"] for line in lines] == list(range(200, steps, 200)) + [steps]
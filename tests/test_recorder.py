@@ -0,0 +1,45 @@
+import numpy as np
+import pytest
+
+from fields.recorder import HistoryRecorder
+from fields.simulator import simultaneous_integration
+
+
+@pytest.fixture
+def reference(build_recall, input_centers):
+    fields = build_recall()
+    simultaneous_integration(fields, input_centers)
+    return fields
+
+
+def run_with(build_recall, input_centers, policy):
+    fields = build_recall()
+    for field in fields:
+        field.recorder = policy().bind(field.x, field.t, field.dtype)
+    simultaneous_integration(fields, input_centers)
+    return fields
+
+
+@pytest.mark.parametrize("policy, steps", [
+    (lambda: HistoryRecorder.decimated(4), lambda n: np.arange(0, n, 4)),
+    (lambda: HistoryRecorder.ring(50), lambda n: np.arange(n - 50, n)),
+    (lambda: HistoryRecorder.ring(50, every=3), lambda n: np.arange(0, n, 3)[-50:]),
+])
+def test_policies_keep_the_selected_rows_of_a_full_recording(policy, steps, build_recall, input_centers, reference):
+    fields = run_with(build_recall, input_centers, policy)
+    for field, expected in zip(fields, reference):
+        rows = steps(len(field.t))
+        np.testing.assert_array_equal(field.recorder.steps, rows)
+        np.testing.assert_array_equal(field.recorder.t, expected.recorder.t[rows])
+        np.testing.assert_array_equal(field.history_u, expected.history_u[rows])
+        np.testing.assert_array_equal(field.history_external_input, expected.history_external_input[rows])
+        np.testing.assert_array_equal(field.history_internal_input, expected.history_internal_input[rows])
+        np.testing.assert_array_equal(field.final_state(), expected.final_state())
+
+
+def test_disabled_recording_keeps_only_the_state(build_recall, input_centers, reference):
+    fields = run_with(build_recall, input_centers, HistoryRecorder.disabled)
+    for field, expected in zip(fields, reference):
+        assert len(field.history_u) == 0
+        assert field.recorder.nbytes < expected.recorder.nbytes / 1000
+        np.testing.assert_array_equal(field.final_state(), expected.final_state())
@@ -0,0 +1,44 @@
+import os
+
+import numpy as np
+import pytest
+
+from fields.field import Field
+from fields.renderer import ActivityRenderer
+from fields.simulator import simultaneous_integration
+
+
+@pytest.fixture
+def field():
+    field = Field((1.5, 0.9, 0.0), (20, 2, 0.1, 0.1), [(0.0, 3.0, 1.5, 0, 15)], name="Action Onset")
+    simultaneous_integration([field], None)
+    return field
+
+
+def test_blitted_frames_match_a_fresh_render(field):
+    renderer = ActivityRenderer([field], plot_inputs=True)
+    assert len(renderer) == len(field.t)
+    assert list(renderer.rows(every=5)) == [0, 5, 10, 15, 20]
+
+    frames = {row: frame.copy() for row, frame in renderer.frames(every=5)}
+    assert frames[0].shape == renderer.frame_shape and frames[0].dtype == np.uint8
+    assert not np.array_equal(frames[0], frames[20])
+    # Each frame is drawn on the clean background, whatever was rendered before it
+    np.testing.assert_array_equal(frames[10], ActivityRenderer([field], plot_inputs=True).render(10))
+
+
+def test_frames_and_gif_are_written(field, tmp_path):
+    renderer = ActivityRenderer([field])
+    paths = renderer.save_frames(str(tmp_path / "frames"), every=10)
+    assert [os.path.basename(path) for path in paths] == ["frame_000000.png", "frame_000001.png",
+                                                          "frame_000002.png"]
+
+    pytest.importorskip("PIL")
+    path = str(tmp_path / "videos" / "run.gif")  # The directory is created
+    assert renderer.save_video(path, every=10) == 3
+    assert os.path.getsize(path) > 0
+
+
+def test_fields_without_history_are_rejected():
+    with pytest.raises(ValueError):
+        ActivityRenderer([Field((1.5, 0.9, 0.0), (20, 2, 0.1, 0.1))])
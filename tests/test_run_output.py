@@ -0,0 +1,72 @@
+import numpy as np
+import pytest
+
+from fields.recorder import HistoryRecorder
+from fields.run_output import RunWriter, load_run
+from fields.simulator import simultaneous_integration
+
+
+def test_run_round_trip(build_recall, input_centers, tmp_path):
+    reference = build_recall()
+    simultaneous_integration(reference, input_centers)
+
+    fields = build_recall()
+    fields[1].recorder = HistoryRecorder.decimated(3).bind(fields[1].x, fields[1].t)
+    fields[2].recorder = HistoryRecorder.at_positions(input_centers).bind(fields[2].x, fields[2].t)
+    with RunWriter(tmp_path / "run", fields, metadata={"input_centers": input_centers}, chunk_bytes=2 ** 20):
+        simultaneous_integration(fields, input_centers)
+
+    run = load_run(tmp_path / "run")
+    assert run.complete
+    assert run.metadata == {"input_centers": input_centers}
+    assert run["Action Onset"].recorder.chunk_rows < len(reference[0].t)  # Spread over several chunks
+
+    for trace, field, expected in zip(run.fields, fields, reference):
+        assert trace.name == field.name
+        np.testing.assert_array_equal(trace.recorder.steps, field.recorder.steps)
+        np.testing.assert_array_equal(np.asarray(trace.history_u), np.asarray(field.history_u))
+        np.testing.assert_array_equal(trace.final_state(), expected.final_state())
+
+    steps = run["Working Memory"].recorder.steps
+    np.testing.assert_array_equal(steps, np.arange(0, len(reference[1].t), 3))
+    np.testing.assert_array_equal(run["Working Memory"].history_u, reference[1].history_u[steps])
+    indices = run["Human Feedback"].recorder.indices
+    np.testing.assert_array_equal(run["Human Feedback"].history_u, reference[2].history_u[:, indices])
+
+    # The grid is stored once per field; the recorded points are derived from it
+    assert not list((tmp_path / "run" / "human_feedback").glob("x*.npy"))
+    np.testing.assert_array_equal(run["Human Feedback"].x, fields[2].x)
+    np.testing.assert_array_equal(run["Human Feedback"].recorder.x, fields[2].x[indices])
+
+
+def test_window_reads_a_time_range(build_recall, input_centers, tmp_path):
+    fields = build_recall()
+    with RunWriter(tmp_path / "run", fields, chunk_bytes=2 ** 20):
+        simultaneous_integration(fields, input_centers)
+
+    t, u, external_input, internal_input = load_run(tmp_path / "run")["Human Feedback"].window(20.0, 40.0)
+    rows = (fields[2].recorder.t >= 20.0) & (fields[2].recorder.t <= 40.0)
+    np.testing.assert_array_equal(t, fields[2].recorder.t[rows])
+    np.testing.assert_array_equal(u, np.asarray(fields[2].history_u)[rows])
+    np.testing.assert_array_equal(external_input, np.asarray(fields[2].history_external_input)[rows])
+    np.testing.assert_array_equal(internal_input, np.asarray(fields[2].history_internal_input)[rows])
+
+
+def test_run_interrupted_by_an_exception_is_incomplete(build_recall, tmp_path):
+    fields = build_recall()
+    with pytest.raises(RuntimeError):
+        with RunWriter(tmp_path / "run", fields):
+            for i in range(10):
+                for field in fields:
+                    field.integrate_single_step(i)
+            raise RuntimeError("interrupted")
+
+    run = load_run(tmp_path / "run")
+    assert not run.complete
+    assert len(run["Action Onset"].history_u) == 10
+
+
+def test_writer_refuses_to_overwrite_a_run(build_recall, tmp_path):
+    RunWriter(tmp_path / "run", build_recall()).close()
+    with pytest.raises(ValueError):
+        RunWriter(tmp_path / "run", build_recall())
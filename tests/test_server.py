@@ -0,0 +1,108 @@
+import asyncio
+
+import pytest
+
+from fields.recorder import HistoryRecorder
+from fields.server import SessionClient, SessionServer
+from fields.session import StreamingSession
+
+# Drives the Action Onset field over threshold at -40 about 50 steps earlier than the recall does
+PUSHED_INPUT = {"field": "Action Onset", "center": -40.0, "amplitude": 5.0, "width": 1.5, "duration": 2.0}
+
+
+def standalone_events(build_recall, input_centers, steps=400, push_at=None):
+    fields = build_recall()
+    for field in fields:
+        field.recorder = HistoryRecorder.disabled().bind(field.x, field.t, field.dtype)
+    session = StreamingSession(fields, input_centers)
+    if push_at is None:
+        return [(event.step, event.position) for event in session.advance(steps)]
+    events = session.advance(push_at)
+    session.push_input(PUSHED_INPUT["field"], PUSHED_INPUT["center"], PUSHED_INPUT["amplitude"],
+                       PUSHED_INPUT["width"], PUSHED_INPUT["duration"])
+    events += session.advance(steps - push_at)
+    return [(event.step, event.position) for event in events]
+
+
+def streamed_events(messages, session):
+    return [(message["step"], message["position"]) for message in messages
+            if message["type"] == "event" and message["session"] == session]
+
+
+def run_server(build_recall, scenario):
+    async def main():
+        server = await SessionServer({"recall": lambda: build_recall()}, tick=0.001).start(port=0)
+        clients = [await SessionClient.connect(port=server.address[1]) for _ in range(2)]
+        try:
+            return await scenario(server, clients)
+        finally:
+            for client in clients:
+                await client.close()
+            await server.close()
+    return asyncio.run(main())
+
+
+def test_hosted_sessions_match_standalone_sessions(build_recall, input_centers):
+    async def scenario(server, clients):
+        sessions = [(client, (await client.request("create", network="recall",
+                                                   input_centers=input_centers))["session"])
+                    for client in clients for _ in range(2)]
+        pushed_client, pushed = sessions[0]
+        await asyncio.gather(*[client.request("advance", session=session, steps=100)
+                               for client, session in sessions])
+        reply = await pushed_client.request("push_input", session=pushed, **PUSHED_INPUT)
+        assert reply["type"] == "ok"
+        await asyncio.gather(*[client.request("advance", session=session, steps=300)
+                               for client, session in sessions])
+
+        messages = {client: client.drain_events() for client in clients}
+        events = [streamed_events(messages[client], session) for client, session in sessions]
+        for client, session in sessions:
+            assert (await client.request("close", session=session))["type"] == "closed"
+        assert not server.sessions
+        return events, server.stats
+
+    events, stats = run_server(build_recall, scenario)
+    expected = standalone_events(build_recall, input_centers)
+    assert expected
+    assert events[0] == standalone_events(build_recall, input_centers, push_at=100) != expected
+    for session_events in events[1:]:
+        assert session_events == expected
+    assert stats.steps == 4 * 400
+
+
+def test_session_missing_its_deadline_is_deferred(build_recall, input_centers):
+    async def scenario(server, clients):
+        client = clients[0]
+        tight = (await client.request("create", network="recall", input_centers=input_centers,
+                                      deadline=1e-4))["session"]
+        loose = [(await client.request("create", network="recall", input_centers=input_centers,
+                                       deadline=1.0))["session"] for _ in range(3)]
+        await asyncio.gather(*[client.request("advance", session=session, steps=50) for session in [tight] + loose])
+        messages = client.drain_events()
+        stats = {session: (await client.request("stats", session=session))["stats"] for session in [tight] + loose}
+        return tight, loose, messages, stats, server.stats
+
+    tight, loose, messages, stats, server_stats = run_server(build_recall, scenario)
+    deferred = [message["session"] for message in messages if message["type"] == "deadline_deferred"]
+    assert deferred and set(deferred) == {tight}
+    assert stats[tight]["deferred_steps"] == len(deferred) == server_stats.deferred
+    assert all(stats[session]["deferred_steps"] == 0 for session in loose)
+    # Deferred steps are taken in a later tick, not dropped
+    assert all(stats[session]["step"] == 50 for session in stats)
+    assert streamed_events(messages, tight) == standalone_events(build_recall, input_centers, steps=50)
+
+
+def test_unknown_session_or_field_is_an_error(build_recall, input_centers):
+    async def scenario(server, clients):
+        session = (await clients[0].request("create", network="recall", input_centers=input_centers))["session"]
+        # Sessions are only visible to the connection that created them
+        with pytest.raises(ValueError, match="Unknown session"):
+            await clients[1].request("advance", session=session, steps=1)
+        with pytest.raises(ValueError, match=f"Session {session} has no field 'Nope'"):
+            await clients[0].request("push_input", session=session, **dict(PUSHED_INPUT, field="Nope"))
+        await clients[0].request("close", session=session)
+        with pytest.raises(ValueError, match="Unknown session"):
+            await clients[0].request("stats", session=session)
+
+    run_server(build_recall, scenario)
@@ -0,0 +1,28 @@
+import numpy as np
+
+from fields.simulator import simultaneous_integration
+from fields.session import StreamingSession
+
+
+def test_session_steps_past_the_time_grid(build_recall, input_centers):
+    reference = build_recall()
+    simultaneous_integration(reference, input_centers, batched=True)
+    n = len(reference[0].t)
+
+    fields = build_recall()
+    session = StreamingSession(fields, input_centers)
+    events = session.advance(n)
+    assert [(event.step, event.position) for event in events] == \
+        [(event.step, event.position) for event in reference[0].event_log]
+    for field, expected in zip(fields, reference):
+        np.testing.assert_array_equal(field.history_u, expected.history_u)
+
+    # The time grid only sizes the storage: the session goes on, the history grows
+    session.advance(100)
+    assert session.i == n + 100
+    np.testing.assert_allclose(session.time, (n + 100) * fields[0].dt)
+    for field, expected in zip(fields, reference):
+        np.testing.assert_array_equal(field.recorder.steps, np.arange(n + 100))
+        np.testing.assert_allclose(field.recorder.t[n:], np.arange(n, n + 100) * field.dt)
+        np.testing.assert_array_equal(field.history_u[:n], expected.history_u)
+        assert np.all(np.isfinite(field.u_field))
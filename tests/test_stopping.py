@@ -0,0 +1,30 @@
+import numpy as np
+
+from fields.field import Field
+from fields.simulator import simultaneous_integration
+from fields.stopping import EventsFired, Settled
+
+
+def test_events_fired_stops_after_the_last_feedback(build_recall, input_centers):
+    reference = build_recall()
+    simultaneous_integration(reference, input_centers)
+    last_event = max(event.step for field in reference for event in field.event_log)
+
+    fields = build_recall()
+    report = simultaneous_integration(fields, input_centers, stop=EventsFired())
+    assert (report.reason, report.step) == ("events_fired", last_event)
+    assert last_event < len(fields[0].t) - 1
+    for field, expected in zip(fields, reference):
+        # The history of the stopped run is the beginning of the full one, trimmed to the steps taken
+        assert len(field.history_u) == last_event + 1
+        np.testing.assert_array_equal(field.history_u, np.asarray(expected.history_u)[:last_event + 1])
+
+
+def test_settled_waits_for_the_inputs_to_switch():
+    field = Field((1.5, 0.9, 0.0), (20, 100, 0.1, 0.1), [(0.0, 3.0, 1.5, 1, 15)], tau_h=20, h_0=-1.0)
+    report = simultaneous_integration([field], None, stop=Settled(tolerance=1e-3, steps=20))
+    assert report.reason == "settled"
+    # The input switches off at t=15, after which the bump decays and settles
+    assert 15 < report.time < field.t[-1]
+    assert len(field.history_u) == report.step + 1
+    assert field.u_field.max() < field.theta
@@ -0,0 +1,65 @@
+import os
+import shutil
+
+import numpy as np
+import pytest
+
+import model_adaptation
+from fields.simulator import simultaneous_integration
+from fields.sweep import find_peaks, parameter_grid, run_parallel_sweep, run_sweep
+
+
+def test_disabled_recorders_keep_the_field_dtype(build_recall, input_centers):
+    networks = []
+
+    def build_network(**params):
+        networks.append(build_recall(dtype=np.float32, **params))
+        return networks[-1]
+
+    summary, = run_sweep(build_network, [{}], input_centers)
+    for field in networks[0]:
+        assert field.history_u.dtype == np.float32
+        assert summary.final_states[field.name].dtype == np.float32
+
+
+def test_sweep_matches_separate_runs(learned_memories, input_centers):
+    memory = learned_memories["model_adaptation"]
+
+    def build_network(scale):
+        return model_adaptation.create_recall_network(sequence_memory=scale * memory)
+
+    parameter_sets = parameter_grid(scale=[1.0, 0.9, 0.8])
+    summaries = run_sweep(build_network, parameter_sets, input_centers, batch_size=2)  # Two batches
+    for params, summary in zip(parameter_sets, summaries):
+        reference = build_network(**params)
+        simultaneous_integration(reference, input_centers)
+        assert summary.params == params
+        assert summary.crossings == [(event.position, event.time) for event in reference[0].event_log]
+        for field in reference:
+            np.testing.assert_array_equal(summary.final_states[field.name], field.final_state())
+            np.testing.assert_array_equal(summary.peaks[field.name], find_peaks(field.x, field.u_field, field.theta))
+    assert summaries[0].crossings != summaries[2].crossings
+
+
+def _square(spec, directory):
+    return {"value": np.array([spec["value"] ** 2])}
+
+
+def test_parallel_sweep_resumes_only_unfinished_scenarios(tmp_path):
+    scenarios = [{"value": value} for value in (1, 2, 3)]
+    output_dir = str(tmp_path / "sweep")
+    run_parallel_sweep(_square, scenarios, output_dir, processes=1)
+
+    # A finished scenario overwritten to tell whether it is rerun, and one interrupted while writing its results
+    np.save(os.path.join(output_dir, "000000", "value.npy"), np.array([-1]))
+    shutil.move(os.path.join(output_dir, "000001"), os.path.join(output_dir, "000001.tmp"))
+    os.remove(os.path.join(output_dir, "000001.tmp", "value.npy"))
+
+    results = run_parallel_sweep(_square, scenarios, output_dir, processes=1)
+    assert [int(result["value"][0]) for result in results] == [-1, 4, 9]
+    assert not os.path.exists(os.path.join(output_dir, "000001.tmp"))
+
+    results = run_parallel_sweep(_square, scenarios, output_dir, processes=1, resume=False)
+    assert [int(result["value"][0]) for result in results] == [1, 4, 9]
+    with pytest.raises(ValueError):
+        run_parallel_sweep(_square, scenarios[:2], output_dir, processes=1)